@@ -0,0 +1,24 @@
+"""Add storage_profile to Plan Config
+
+Revision ID: 5c2e8a91d4b7
+Revises: 78ef355cd603
+Create Date: 2026-10-17 10:12:31.482113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a91d4b7'
+down_revision = '78ef355cd603'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('plan_configs', sa.Column('storage_profile', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('plan_configs', 'storage_profile')
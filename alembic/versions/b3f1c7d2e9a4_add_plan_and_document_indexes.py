@@ -0,0 +1,28 @@
+"""Add plan, plan config and document indexes
+
+Revision ID: b3f1c7d2e9a4
+Revises: 5c2e8a91d4b7
+Create Date: 2026-10-17 16:40:12.905317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c7d2e9a4'
+down_revision = '5c2e8a91d4b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_plans_stripe_id_platform_id'), 'plans', ['stripe_id', 'platform', 'id'], unique=False)
+    op.create_index(op.f('ix_plan_configs_plan_platform_is_subscription'), 'plan_configs', ['plan', 'platform', 'is_subscription'], unique=False)
+    op.create_index(op.f('ix_documents_collection_id'), 'documents', ['collection_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_documents_collection_id'), table_name='documents')
+    op.drop_index(op.f('ix_plan_configs_plan_platform_is_subscription'), table_name='plan_configs')
+    op.drop_index(op.f('ix_plans_stripe_id_platform_id'), table_name='plans')
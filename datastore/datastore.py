@@ -1,26 +1,46 @@
+import os
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
 import asyncio
 from loguru import logger
 
 from models.models import (
+    CollectionStorage,
     Document,
     DocumentChunk,
+    DocumentChunkWithScore,
+    DocumentMetadata,
     DocumentMetadataFilter,
     Query,
     QueryResult,
     QueryWithEmbedding,
+    RetrievalMode,
+    UpsertProgress,
 )
 from services.chunks import get_document_chunks
-from services.openai import get_embeddings
+from services.cpu_pool import CPUTask
+from services.ingest import UpsertPipeline
+from services.embedding_cache import EmbeddingCache
+from services.lexical import reciprocal_rank_fusion
+from services.rerank import CrossEncoderReranker, mmr, within_budget
+from utils.metrics import Metrics
+
+QUERY_CANDIDATES = int(os.environ.get("QUERY_CANDIDATES", 20))  # Candidates each retriever contributes to a query with post-retrieval stages
+
+metrics = Metrics()
 
 class DataStore(ABC):
     async def upsert(
-        self, documents: List[Document], chunk_token_size: Optional[int] = None, collection_name: Optional[str] = None
+        self,
+        documents: List[Document],
+        chunk_token_size: Optional[int] = None,
+        collection_name: Optional[str] = None,
+        cpu_task: Optional[CPUTask] = None,
     ) -> List[str]:
         """
         Takes in a list of documents and inserts them into the database.
         First deletes all the existing vectors with the document id (if necessary, depends on the vector db), then inserts the new ones.
+        Chunking runs in cpu_task, the request's share of the CPU pool, when given.
         Return a list of document ids.
         """
         # Delete any existing vectors for documents with the input document ids
@@ -37,10 +57,35 @@ class DataStore(ABC):
         #     ]
         # )
         print(f"In datastore.py {collection_name}")
-        chunks = get_document_chunks(documents, chunk_token_size)
+        chunks = await get_document_chunks(documents, chunk_token_size, cpu_task)
         # logger.debug(chunks.id)
         return await self._upsert(chunks, collection_name)
 
+    async def upsert_stream(
+        self,
+        texts: AsyncIterator[str],
+        metadata: Optional[DocumentMetadata] = None,
+        document_id: Optional[str] = None,
+        chunk_token_size: Optional[int] = None,
+        collection_name: Optional[str] = None,
+        cpu_task: Optional[CPUTask] = None,
+        on_progress: Optional[Callable[[UpsertProgress], Awaitable[None]]] = None,
+        progress: Optional[UpsertProgress] = None,
+    ) -> UpsertProgress:
+        """
+        Takes in the text of one document piece by piece and inserts it into the database while
+        it is still being extracted, in batches of _upsert calls.
+        Pass the progress of an interrupted upsert of the same document to resume it.
+        Return the final progress of the upsert.
+        """
+        pipeline = UpsertPipeline(
+            write=lambda chunks: self._upsert(chunks, collection_name),
+            chunk_token_size=chunk_token_size,
+            cpu_task=cpu_task,
+            on_progress=on_progress,
+        )
+        return await pipeline.run(texts, metadata, document_id, progress)
+
     @abstractmethod
     async def _upsert(self, chunks: Dict[str, List[DocumentChunk]], collection_name: Optional[str] = None) -> List[str]:
         """
@@ -56,13 +101,80 @@ class DataStore(ABC):
         """
         # get a list of of just the queries from the Query list
         query_texts = [query.query for query in queries]
-        query_embeddings = get_embeddings(query_texts)
+        with metrics.timer("query.embed_ms"):
+            query_embeddings = await EmbeddingCache().get_embeddings(query_texts)
         # hydrate the queries with embeddings
         queries_with_embeddings = [
             QueryWithEmbedding(**query.dict(), embedding=embedding)
             for query, embedding in zip(queries, query_embeddings)
         ]
-        return await self._query(queries_with_embeddings, collection_name)
+        # Queries with a post-retrieval stage choose their top_k among more candidates
+        for query in queries_with_embeddings:
+            if self._post_processed(query):
+                query.top_k = max(query.top_k or 0, QUERY_CANDIDATES)
+        with metrics.timer("query.search_ms"):
+            results = await self._query(queries_with_embeddings, collection_name)
+
+        return [
+            await self._post_process(query, result, collection_name)
+            if self._post_processed(query)
+            else result
+            for query, result in zip(queries, results)
+        ]
+
+    def _post_processed(self, query: Query) -> bool:
+        return (
+            query.retrieval == RetrievalMode.hybrid
+            or query.rerank
+            or query.mmr_lambda is not None
+            or query.max_tokens is not None
+        )
+
+    async def _post_process(
+        self,
+        query: Query,
+        result: QueryResult,
+        collection_name: Optional[str] = None,
+    ) -> QueryResult:
+        """
+        Narrow the candidates of a query down to its top_k chunks: fuse them with the lexical
+        results, re-rank them, diversify them and keep those that fit in its token budget.
+        """
+        chunks = result.results
+        if query.retrieval == RetrievalMode.hybrid:
+            with metrics.timer("query.fuse_ms"):
+                chunks = await self._fuse(query, chunks, collection_name)
+        if query.rerank:
+            with metrics.timer("query.rerank_ms"):
+                chunks = await CrossEncoderReranker().rerank(query.query, chunks)
+        if query.mmr_lambda is not None:
+            with metrics.timer("query.mmr_ms"):
+                chunks = mmr(chunks, query.mmr_lambda)
+        return QueryResult(query=query.query, results=within_budget(chunks, query.top_k, query.max_tokens))
+
+    async def _fuse(
+        self, query: Query, dense: List[DocumentChunkWithScore], collection_name: Optional[str] = None
+    ) -> List[DocumentChunkWithScore]:
+        """
+        Merge the dense results of a query with its lexical results by reciprocal rank fusion.
+        """
+        lexical = await self._lexical_query(query, max(query.top_k or 0, QUERY_CANDIDATES), collection_name)
+        # Dense hits carry their embedding, which MMR needs
+        chunks = {str(chunk.id): chunk for chunk in [*lexical, *dense]}
+        fused = reciprocal_rank_fusion([
+            [str(chunk.id) for chunk in dense],
+            [str(chunk.id) for chunk in lexical],
+        ])
+        return [chunks[id].copy(update={"score": score}) for id, score in fused]
+
+    async def _lexical_query(
+        self, query: Query, limit: int, collection_name: Optional[str] = None
+    ) -> List[DocumentChunkWithScore]:
+        """
+        Takes in a query and returns the chunks best matching its terms, best first.
+        Datastores without a lexical index return nothing, so hybrid queries fall back to dense results.
+        """
+        return []
 
     @abstractmethod
     async def _query(self, queries: List[QueryWithEmbedding], collection_name: Optional[str] = None) -> List[QueryResult]:
@@ -86,12 +198,12 @@ class DataStore(ABC):
         """
         raise NotImplementedError
 
-    def create_collection(self, collection_name: str) -> bool:
+    def create_collection(self, collection_name: str, storage: Optional[CollectionStorage] = None) -> bool:
         """
-        Creates a collection in the datastore.
+        Creates a collection in the datastore, stored the way the storage profile says.
         """
         try:
-            self._create_collection(collection_name)
+            self._create_collection(collection_name, storage=storage)
             return True
         except:
             return False
@@ -102,5 +214,6 @@ class DataStore(ABC):
         collection_name: str,
         vector_size: int = 1536, 
         distance: str = "Cosine", 
+        storage: Optional[CollectionStorage] = None,
     ):
         raise NotImplementedError 
\ No newline at end of file
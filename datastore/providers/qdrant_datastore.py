@@ -1,7 +1,14 @@
 import os
+import time
 import uuid
-from typing import Dict, List, Optional
-
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import grpc
 from grpc._channel import _InactiveRpcError
 from qdrant_client.http.exceptions import UnexpectedResponse
 from qdrant_client.http.models import PayloadSchemaType
@@ -10,9 +17,13 @@ from utils.common import singleton_with_lock
 from loguru import logger
 
 from datastore.datastore import DataStore
+from datastore.providers.redis_lexical_index import RedisLexicalIndex
 from models.models import (
+    CollectionStorage,
+    StorageProfile,
     DocumentChunk,
     DocumentMetadataFilter,
+    Query,
     QueryResult,
     QueryWithEmbedding,
     DocumentChunkWithScore,
@@ -22,24 +33,233 @@ from qdrant_client.http import models as rest
 import qdrant_client
 
 from services.date import to_unix_timestamp
+from utils.circuit_breaker import CircuitBreaker
+from utils.metrics import Metrics
 
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost")
 QDRANT_PORT = os.environ.get("QDRANT_PORT", "6333")
 QDRANT_GRPC_PORT = os.environ.get("QDRANT_GRPC_PORT", "6334")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "document_chunks")
+QDRANT_POOL_SIZE = int(os.environ.get("QDRANT_POOL_SIZE", 4))  # gRPC channels, one client each
+QDRANT_POOL_THREADS = int(os.environ.get("QDRANT_POOL_THREADS", 16))  # Qdrant calls in flight per worker
+QDRANT_TIMEOUT = int(os.environ.get("QDRANT_TIMEOUT", 10))  # gRPC deadline of every call, in seconds
+QDRANT_SEARCH_TIMEOUT = float(os.environ.get("QDRANT_SEARCH_TIMEOUT", 5))  # Seconds a search may take before the caller gives up
+QDRANT_WRITE_TIMEOUT = float(os.environ.get("QDRANT_WRITE_TIMEOUT", 30))  # Seconds an upsert or delete may take
+QDRANT_BREAKER_FAILURES = int(os.environ.get("QDRANT_BREAKER_FAILURES", 5))  # Consecutive failures that open the circuit
+QDRANT_BREAKER_RESET = float(os.environ.get("QDRANT_BREAKER_RESET", 30))  # Seconds the circuit stays open
+QDRANT_COALESCE_WINDOW = float(os.environ.get("QDRANT_COALESCE_WINDOW", 0.003))  # Seconds searches on one collection wait to share a search_batch
+QDRANT_COALESCE_MAX_BATCH = int(os.environ.get("QDRANT_COALESCE_MAX_BATCH", 32))  # Searches sent in one search_batch at most
+
+QDRANT_STORAGE_PROFILE = os.environ.get("QDRANT_STORAGE_PROFILE", "default")  # Profile of the default collection and of plans without one
+QDRANT_MEMMAP_THRESHOLD = int(os.environ.get("QDRANT_MEMMAP_THRESHOLD", 20000))  # KB of vectors per segment above which on-disk profiles memmap them
+QDRANT_RESCORE = os.environ.get("QDRANT_RESCORE", "true").lower() == "true"  # Rescore quantized search results with the original vectors
+
+QDRANT_MULTITENANT = os.environ.get("QDRANT_MULTITENANT", "false").lower() == "true"  # Keep every customer collection in one shared collection
+QDRANT_SHARED_COLLECTION = os.environ.get("QDRANT_SHARED_COLLECTION", "tenant_chunks")  # The shared collection of the multi-tenant mode
+QDRANT_TENANT_PAYLOAD_M = int(os.environ.get("QDRANT_TENANT_PAYLOAD_M", 16))  # HNSW links of the per-tenant graphs in the shared collection
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def storage_config(storage: CollectionStorage) -> Dict[str, Any]:
+    """
+    Keyword arguments of create_collection for a storage profile.
+
+    On-disk profiles keep the payload on disk and let the optimizer memmap the original
+    vectors of every segment above QDRANT_MEMMAP_THRESHOLD; quantized profiles keep a compact
+    copy of the vectors in RAM for the HNSW search.
+    """
+    profile = storage.profile
+    config: Dict[str, Any] = {}
+
+    if profile in (StorageProfile.int8, StorageProfile.int8_on_disk):
+        config["quantization_config"] = rest.ScalarQuantization(
+            scalar=rest.ScalarQuantizationConfig(type=rest.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile == StorageProfile.binary:
+        if not hasattr(rest, "BinaryQuantization"):
+            raise ValueError("The binary storage profile needs qdrant-client >= 1.7")
+        config["quantization_config"] = rest.BinaryQuantization(
+            binary=rest.BinaryQuantizationConfig(always_ram=True)
+        )
+
+    if profile in (StorageProfile.int8_on_disk, StorageProfile.on_disk):
+        config["on_disk_payload"] = True
+        config["optimizers_config"] = rest.OptimizersConfigDiff(memmap_threshold=QDRANT_MEMMAP_THRESHOLD)
+
+    if storage.hnsw_m is not None or storage.hnsw_ef_construct is not None:
+        config["hnsw_config"] = rest.HnswConfigDiff(m=storage.hnsw_m, ef_construct=storage.hnsw_ef_construct)
+
+    return config
+
+metrics = Metrics()
+
+
+class QdrantClientPool:
+    """
+    Async front for a pool of QdrantClient instances, one gRPC channel each.
+
+    The pinned qdrant-client only ships a blocking client, so every call runs on a dedicated
+    thread pool and the event loop just awaits it. Calls are spread round-robin over the
+    channels, given up on after a deadline and refused outright while the circuit is open.
+    """
+
+    def __init__(self, size: int = QDRANT_POOL_SIZE, threads: int = QDRANT_POOL_THREADS):
+        self.clients = [
+            qdrant_client.QdrantClient(
+                url=QDRANT_URL,
+                port=int(QDRANT_PORT),
+                grpc_port=int(QDRANT_GRPC_PORT),
+                api_key=QDRANT_API_KEY,
+                prefer_grpc=True,
+                timeout=QDRANT_TIMEOUT,
+            )
+            for _ in range(size)
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="qdrant")
+        self.breaker = CircuitBreaker("qdrant", QDRANT_BREAKER_FAILURES, QDRANT_BREAKER_RESET)
+        self.counter = itertools.count()
+
+    @property
+    def client(self) -> qdrant_client.QdrantClient:
+        """A client for blocking calls made outside the event loop, like collection setup."""
+        return self.clients[0]
+
+    def _unavailable(self, e: Exception) -> bool:
+        if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        return isinstance(e, _InactiveRpcError) and e.code() in (
+            grpc.StatusCode.UNAVAILABLE,
+            grpc.StatusCode.DEADLINE_EXCEEDED,
+        )
+
+    async def call(self, method: str, timeout: float, **kwargs) -> Any:
+        self.breaker.before_call()
+        client = self.clients[next(self.counter) % len(self.clients)]
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, functools.partial(getattr(client, method), **kwargs)),
+                timeout,
+            )
+        except Exception as e:
+            # Only an unreachable Qdrant counts against the circuit, not a bad request
+            if self._unavailable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            metrics.incr(f"qdrant.{method}.error")
+            raise
+        self.breaker.record_success()
+        metrics.observe(f"qdrant.{method}_ms", (time.perf_counter() - start) * 1000)
+        return result
+
+
+class SearchCoalescer:
+    """
+    Micro-batch concurrent searches across requests.
+
+    Searches on the same collection are collected for up to `window` seconds, or until
+    `max_batch` of them are waiting, and sent as one search_batch whose results are fanned
+    back to every caller. A search identical to one that is waiting or in flight shares its
+    result instead of being sent again.
+    """
+
+    def __init__(
+        self,
+        search_batch: Callable[[str, List[rest.SearchRequest]], Awaitable[List[List[rest.ScoredPoint]]]],
+        window: float = QDRANT_COALESCE_WINDOW,
+        max_batch: int = QDRANT_COALESCE_MAX_BATCH,
+    ):
+        self.search_batch = search_batch
+        self.window = window
+        self.max_batch = max_batch
+        # Per collection: the searches waiting for the next batch, by key, with their enqueue time
+        self.pending: Dict[str, Dict[str, Tuple[rest.SearchRequest, asyncio.Future, float]]] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        # Every unresolved search, waiting or in flight, by (collection, key)
+        self.futures: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    def _key(self, request: rest.SearchRequest) -> str:
+        return hashlib.sha1(request.json().encode("utf-8")).hexdigest()
+
+    async def search(self, collection: str, requests: List[rest.SearchRequest]) -> List[List[rest.ScoredPoint]]:
+        # Shielded, since a caller giving up must not cancel a result other callers share
+        return await asyncio.gather(*[asyncio.shield(self._submit(collection, request)) for request in requests])
+
+    def _submit(self, collection: str, request: rest.SearchRequest) -> asyncio.Future:
+        key = self._key(request)
+        future = self.futures.get((collection, key))
+        if future is not None:
+            metrics.incr("qdrant.coalesce.deduplicated")
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.futures[(collection, key)] = future
+        future.add_done_callback(lambda _: self.futures.pop((collection, key), None))
+
+        pending = self.pending.setdefault(collection, {})
+        pending[key] = (request, future, time.perf_counter())
+        if len(pending) >= self.max_batch:
+            self._flush(collection)
+        elif collection not in self.timers:
+            self.timers[collection] = loop.call_later(self.window, self._flush, collection)
+        return future
+
+    def _flush(self, collection: str):
+        timer = self.timers.pop(collection, None)
+        if timer is not None:
+            timer.cancel()
+        batch = list(self.pending.pop(collection, {}).values())
+        if not batch:
+            return
+
+        now = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            metrics.observe("qdrant.coalesce.wait_ms", (now - enqueued_at) * 1000)
+        metrics.observe("qdrant.coalesce.batch_size", len(batch), BATCH_SIZE_BUCKETS)
+        asyncio.ensure_future(self._run(collection, batch))
+
+    async def _run(self, collection: str, batch: List[Tuple[rest.SearchRequest, asyncio.Future, float]]):
+        try:
+            results = await self.search_batch(collection, [request for request, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
 
 
 @singleton_with_lock
 class QdrantDataStore(DataStore):
     UUID_NAMESPACE = uuid.UUID("3896d314-1e95-4a3a-b45a-945f9f0b541d")
 
+    # Payload keys of the DocumentMetadataFilter equality filters
+    META_ATTRIBUTES_KEYS = {
+        "document_id": "metadata.document_id",
+        "source": "metadata.source",
+        "source_id": "metadata.source_id",
+        "author": "metadata.author",
+    }
+    # Every filtered field is indexed, so that no filtered search or delete scans the collection
+    PAYLOAD_INDEXES = {
+        **{key: PayloadSchemaType.KEYWORD for key in META_ATTRIBUTES_KEYS.values()},
+        "created_at": PayloadSchemaType.INTEGER,
+    }
+
     def __init__(
         self,
         collection_name: Optional[str] = None,
         vector_size: int = 1536,
         distance: str = "Cosine",
         recreate_collection: bool = False,
+        multitenant: bool = QDRANT_MULTITENANT,
     ):
         """
         Args:
@@ -48,19 +268,38 @@ class QdrantDataStore(DataStore):
             distance:
                 Any of "Cosine" / "Euclid" / "Dot". Distance function to measure
                 similarity
+            multitenant:
+                Store every customer collection in the shared collection, as the tenant
+                `tenant_id` of its points, instead of in a Qdrant collection of its own
         """
-        self.client = qdrant_client.QdrantClient(
-            url=QDRANT_URL,
-            port=int(QDRANT_PORT),
-            grpc_port=int(QDRANT_GRPC_PORT),
-            api_key=QDRANT_API_KEY,
-            prefer_grpc=True,
-            timeout=10,
-        )
+        self.pool = QdrantClientPool()
+        self.client = self.pool.client
+        self.coalescer = SearchCoalescer(self._search_batch)
         self.collection_name = collection_name or QDRANT_COLLECTION
+        self.multitenant = multitenant
 
         # Set up the collection so the points might be inserted or queried
         self._set_up_collection(vector_size, distance, recreate_collection)
+        if self.multitenant:
+            self._set_up_shared_collection(vector_size, distance)
+
+    def _resolve(self, collection_name: Optional[str]) -> Tuple[str, Optional[str]]:
+        """The Qdrant collection a customer collection is stored in, and its tenant id there."""
+        if collection_name is None:
+            return self.collection_name, None
+        if self.multitenant:
+            return QDRANT_SHARED_COLLECTION, collection_name
+        return collection_name, None
+
+    def _point_id(self, chunk_id: str, tenant_id: Optional[str] = None) -> str:
+        if tenant_id is None:
+            return chunk_id
+        # Chunk ids are only unique within a customer collection
+        try:
+            chunk_id = str(uuid.UUID(str(chunk_id)))
+        except ValueError:
+            pass
+        return uuid.uuid5(self.UUID_NAMESPACE, f"{tenant_id}:{chunk_id}").hex
 
     async def _upsert(
         self, 
@@ -71,23 +310,29 @@ class QdrantDataStore(DataStore):
         Takes in a list of document chunks and inserts them into the database.
         Return a list of document ids.
         """
-        collection = collection_name if collection_name is not None else self.collection_name
+        collection, tenant_id = self._resolve(collection_name)
 
         # logger.debug(chunks)
 
         points = [
-            self._convert_document_chunk_to_point(chunk)
+            self._convert_document_chunk_to_point(chunk, tenant_id)
             for _, chunks in chunks.items()
             for chunk in chunks
         ]
 
         # logger.debug(f"Points: {points}")
 
-        self.client.upsert(
+        await self.pool.call(
+            "upsert",
+            QDRANT_WRITE_TIMEOUT,
             collection_name=collection,
             points=points,  # type: ignore
             wait=True,
         )
+        await RedisLexicalIndex().add(
+            collection_name or self.collection_name,
+            [chunk for _, chunks in chunks.items() for chunk in chunks],
+        )
         return list(chunks.keys())
 
     async def _query(
@@ -98,16 +343,13 @@ class QdrantDataStore(DataStore):
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
         """
+        collection, tenant_id = self._resolve(collection_name)
         search_requests = [
-            self._convert_query_to_search_request(query) for query in queries
+            self._convert_query_to_search_request(query, tenant_id) for query in queries
         ]
 
-        collection = collection_name if collection_name is not None else self.collection_name
-
-        results = self.client.search_batch(
-            collection_name=collection,
-            requests=search_requests,
-        )
+        # Shares one search_batch with the concurrent searches of other requests
+        results = await self.coalescer.search(collection, search_requests)
 
         # logger.debug(results)
 
@@ -122,6 +364,23 @@ class QdrantDataStore(DataStore):
             for query, result in zip(queries, results)
         ]
 
+    async def _lexical_query(
+        self, query: Query, limit: int, collection_name: Optional[str] = None
+    ) -> List[DocumentChunkWithScore]:
+        return await RedisLexicalIndex().search(
+            collection_name or self.collection_name, query.query, limit, query.filter
+        )
+
+    async def _search_batch(
+        self, collection: str, search_requests: List[rest.SearchRequest]
+    ) -> List[List[rest.ScoredPoint]]:
+        return await self.pool.call(
+            "search_batch",
+            QDRANT_SEARCH_TIMEOUT,
+            collection_name=collection,
+            requests=search_requests,
+        )
+
     async def delete(
         self,
         ids: Optional[List[str]] = None,
@@ -133,27 +392,33 @@ class QdrantDataStore(DataStore):
         Removes vectors by ids, filter, or everything in the datastore.
         Returns whether the operation was successful.
         """
-        collection = collection_name if collection_name is not None else self.collection_name
-        if ids is None and filter is None and delete_all is None:
+        collection, tenant_id = self._resolve(collection_name)
+        if ids is None and filter is None and not delete_all:
             raise ValueError(
                 "Please provide one of the parameters: ids, filter or delete_all."
             )
 
         if delete_all:
-            points_selector = rest.Filter()
+            # Everything of this tenant only, when the collection is shared
+            points_selector = self._convert_metadata_filter_to_qdrant_filter(
+                tenant_id=tenant_id
+            ) or rest.Filter()
         else:
             points_selector = self._convert_metadata_filter_to_qdrant_filter(
-                filter, ids
+                filter, ids, tenant_id
             )
 
-        response = self.client.delete(
+        response = await self.pool.call(
+            "delete",
+            QDRANT_WRITE_TIMEOUT,
             collection_name=collection,
             points_selector=points_selector,  # type: ignore
         )
+        await RedisLexicalIndex().delete(collection_name or self.collection_name, ids, filter, delete_all)
         return "COMPLETED" == response.status
 
     def _convert_document_chunk_to_point(
-        self, document_chunk: DocumentChunk
+        self, document_chunk: DocumentChunk, tenant_id: Optional[str] = None
     ) -> rest.PointStruct:
         created_at = (
             to_unix_timestamp(document_chunk.metadata.created_at)
@@ -161,15 +426,21 @@ class QdrantDataStore(DataStore):
             else None
         )
         # logger.debug(f"Chunck:{document_chunk}")
+        payload = {
+            "id": document_chunk.id,
+            "text": document_chunk.text,
+            "metadata": document_chunk.metadata.dict(),
+            "created_at": created_at,
+            "token_count": document_chunk.token_count,
+            "start_char": document_chunk.start_char,
+            "end_char": document_chunk.end_char,
+        }
+        if tenant_id is not None:
+            payload["tenant_id"] = tenant_id
         return rest.PointStruct(
-            id=document_chunk.id,
+            id=self._point_id(document_chunk.id, tenant_id),
             vector=document_chunk.embedding,  # type: ignore
-            payload={
-                "id": document_chunk.id,
-                "text": document_chunk.text,
-                "metadata": document_chunk.metadata.dict(),
-                "created_at": created_at,
-            },
+            payload=payload,
         )
 
     def _create_document_chunk_id(self, external_id: Optional[str]) -> str:
@@ -178,31 +449,43 @@ class QdrantDataStore(DataStore):
         return uuid.uuid5(self.UUID_NAMESPACE, external_id).hex
 
     def _convert_query_to_search_request(
-        self, query: QueryWithEmbedding
+        self, query: QueryWithEmbedding, tenant_id: Optional[str] = None
     ) -> rest.SearchRequest:
         return rest.SearchRequest(
             vector=query.embedding,
-            filter=self._convert_metadata_filter_to_qdrant_filter(query.filter),
+            filter=self._convert_metadata_filter_to_qdrant_filter(query.filter, tenant_id=tenant_id),
             limit=query.top_k,  # type: ignore
             with_payload=True,
-            with_vector=False,
+            # Only MMR compares the results with each other
+            with_vector=query.mmr_lambda is not None,
+            # Ignored by collections without quantization
+            params=rest.SearchParams(quantization=rest.QuantizationSearchParams(rescore=QDRANT_RESCORE)),
         )
 
     def _convert_metadata_filter_to_qdrant_filter(
         self,
         metadata_filter: Optional[DocumentMetadataFilter] = None,
         ids: Optional[List[str]] = None,
+        tenant_id: Optional[str] = None,
     ) -> Optional[rest.Filter]:
-        if metadata_filter is None and ids is None:
+        if metadata_filter is None and ids is None and tenant_id is None:
             return None
 
         must_conditions, should_conditions = [], []
 
+        # Every condition of a shared collection is scoped to the tenant
+        if tenant_id is not None:
+            must_conditions.append(
+                rest.FieldCondition(
+                    key="tenant_id", match=rest.MatchValue(value=tenant_id)
+                )
+            )
+
         # Filtering by document ids
         if ids and len(ids) > 0:
             must_conditions.append(
                 rest.HasIdCondition(
-                    has_id=ids,
+                    has_id=[self._point_id(id, tenant_id) for id in ids],
                 )
             )
             # for document_id in ids:
@@ -215,14 +498,7 @@ class QdrantDataStore(DataStore):
 
         # Equality filters for the payload attributes
         if metadata_filter:
-            meta_attributes_keys = {
-                "document_id": "metadata.document_id",
-                "source": "metadata.source",
-                "source_id": "metadata.source_id",
-                "author": "metadata.author",
-            }
-
-            for meta_attr_name, payload_key in meta_attributes_keys.items():
+            for meta_attr_name, payload_key in self.META_ATTRIBUTES_KEYS.items():
                 attr_value = getattr(metadata_filter, meta_attr_name)
                 if attr_value is None:
                     continue
@@ -264,11 +540,14 @@ class QdrantDataStore(DataStore):
     ) -> DocumentChunkWithScore:
         payload = scored_point.payload or {}
         return DocumentChunkWithScore(
-            # id=payload.get("id"),
-            id=scored_point.id,
+            # Points of a shared collection have ids derived from the tenant and the chunk id
+            id=payload["id"] if "tenant_id" in payload else scored_point.id,
             text=scored_point.payload.get("text"),  # type: ignore
             metadata=scored_point.payload.get("metadata"),  # type: ignore
             embedding=scored_point.vector,  # type: ignore
+            token_count=payload.get("token_count"),
+            start_char=payload.get("start_char"),
+            end_char=payload.get("end_char"),
             score=scored_point.score,
         )
 
@@ -302,6 +581,8 @@ class QdrantDataStore(DataStore):
                 )
         except (UnexpectedResponse, _InactiveRpcError):
             self._recreate_collection(distance, vector_size)
+        else:
+            self.ensure_payload_indexes(self.collection_name)
 
     def _recreate_collection(self, distance: rest.Distance, vector_size: int):
         self.client.recreate_collection(
@@ -310,48 +591,90 @@ class QdrantDataStore(DataStore):
                 size=vector_size,
                 distance=distance,
             ),
+            **storage_config(CollectionStorage(profile=QDRANT_STORAGE_PROFILE)),
         )
+        self.ensure_payload_indexes(self.collection_name)
 
-        # Create the payload index for the document_id metadata attribute, as it is
-        # used to delete the document related entries
-        self.client.create_payload_index(
-            self.collection_name,
-            field_name="metadata.document_id",
-            field_type=PayloadSchemaType.KEYWORD,
-        )
+    def _set_up_shared_collection(self, vector_size: int, distance: str):
+        try:
+            self.client.get_collection(QDRANT_SHARED_COLLECTION)
+        except (UnexpectedResponse, _InactiveRpcError):
+            pass
+        else:
+            self.ensure_payload_indexes(QDRANT_SHARED_COLLECTION)
+            return
 
-        # Create the payload index for the created_at attribute, to make the lookup
-        # by range filters faster
-        self.client.create_payload_index(
-            self.collection_name,
-            field_name="created_at",
-            field_schema=PayloadSchemaType.INTEGER,
+        config = storage_config(CollectionStorage(profile=QDRANT_STORAGE_PROFILE))
+        # Every search is filtered by tenant: build one small HNSW graph per tenant
+        # instead of a global graph over all of them
+        config["hnsw_config"] = rest.HnswConfigDiff(m=0, payload_m=QDRANT_TENANT_PAYLOAD_M)
+        self.client.create_collection(
+            QDRANT_SHARED_COLLECTION,
+            vectors_config=rest.VectorParams(
+                size=vector_size,
+                distance=rest.Distance[distance.upper()],
+            ),
+            **config,
         )
+        self.ensure_payload_indexes(QDRANT_SHARED_COLLECTION)
 
     def _create_collection(
         self,
         collection_name: str,
         vector_size: int = 1536, 
         distance: str = "Cosine", 
+        storage: Optional[CollectionStorage] = None,
     ):
+        if self.multitenant:
+            # A customer collection is just a tenant of the shared collection, which is
+            # stored with QDRANT_STORAGE_PROFILE
+            return
+
         self.client.create_collection(
             collection_name,
             vectors_config=rest.VectorParams(
                 size=vector_size,
                 distance=distance,
             ),
+            **storage_config(storage or CollectionStorage(profile=QDRANT_STORAGE_PROFILE)),
         )
+        self.ensure_payload_indexes(collection_name)
 
-        self.client.create_payload_index(
-            self.collection_name,
-            field_name="metadata.document_id",
-            field_type=PayloadSchemaType.KEYWORD,
-        )
+    def payload_indexes(self, collection_name: str) -> Dict[str, PayloadSchemaType]:
+        """The payload indexes a collection should have."""
+        if collection_name == QDRANT_SHARED_COLLECTION:
+            return {"tenant_id": PayloadSchemaType.KEYWORD, **self.PAYLOAD_INDEXES}
+        return dict(self.PAYLOAD_INDEXES)
 
-        # Create the payload index for the created_at attribute, to make the lookup
-        # by range filters faster
-        self.client.create_payload_index(
-            self.collection_name,
-            field_name="created_at",
-            field_schema=PayloadSchemaType.INTEGER,
-        )
\ No newline at end of file
+    def audit_payload_indexes(self, collection_name: str) -> Tuple[List[str], List[str]]:
+        """
+        Compare the payload indexes of a collection with payload_indexes.
+        Return the fields without an index and the fields indexed with another type.
+        """
+        schema = self.client.get_collection(collection_name).payload_schema or {}
+        missing, mismatched = [], []
+        for field, field_schema in self.payload_indexes(collection_name).items():
+            if field not in schema:
+                missing.append(field)
+            elif schema[field].data_type != field_schema:
+                mismatched.append(field)
+        return missing, mismatched
+
+    def ensure_payload_indexes(self, collection_name: str) -> List[str]:
+        """
+        Create the missing payload indexes of a collection and return their fields.
+
+        Qdrant builds a new index over the points already stored while it keeps serving the
+        collection, so this also repairs live collections.
+        """
+        missing, mismatched = self.audit_payload_indexes(collection_name)
+        if mismatched:
+            logger.warning(f"Collection {collection_name} indexes {mismatched} with an unexpected type")
+        indexes = self.payload_indexes(collection_name)
+        for field in missing:
+            self.client.create_payload_index(
+                collection_name,
+                field_name=field,
+                field_schema=indexes[field],
+            )
+        return missing
\ No newline at end of file
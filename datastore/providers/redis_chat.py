@@ -1,75 +1,126 @@
 import redis
+import redis.asyncio
 import os
 
-from models.chat import ChatHistory, QAHistory
-from typing import List, Set
+from contextvars import ContextVar
+from typing import List, Optional, Set, Type
 from utils.common import singleton_with_lock
 
 import codecs
 
 REDIS_URL = os.environ.get("UPSTASH_REDIS_URL", "redis://localhost:6379")
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))  # Connections of each client's pool
+
+# Deletes the question of a keyword and its answer in one round trip
+DELETE_FAQ_SCRIPT = """
+local question = redis.call('HGET', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+if question then
+    redis.call('HDEL', KEYS[2], question)
+end
+return question
+"""
+
+
+class RoundTrips:
+    """Redis round trips made since it was started, pipelines and scripts counting as one."""
+
+    def __init__(self):
+        self.count = 0
+
+
+_round_trips: ContextVar[Optional[RoundTrips]] = ContextVar("redis_round_trips", default=None)
+
+
+def count_round_trips() -> RoundTrips:
+    """Count the Redis round trips of the current task, and the tasks it starts, from now on."""
+    round_trips = RoundTrips()
+    _round_trips.set(round_trips)
+    return round_trips
+
+
+def _count_round_trip():
+    round_trips = _round_trips.get()
+    if round_trips is not None:
+        round_trips.count += 1
+
+
+def _counted(connection_class: Type[redis.Connection]) -> Type[redis.Connection]:
+    class CountedConnection(connection_class):
+        def send_packed_command(self, *args, **kwargs):
+            _count_round_trip()
+            return super().send_packed_command(*args, **kwargs)
+
+    return CountedConnection
+
+
+def _async_counted(connection_class: Type[redis.asyncio.Connection]) -> Type[redis.asyncio.Connection]:
+    class CountedConnection(connection_class):
+        async def send_packed_command(self, *args, **kwargs):
+            _count_round_trip()
+            return await super().send_packed_command(*args, **kwargs)
+
+    return CountedConnection
 
 
 @singleton_with_lock
 class RedisChat():
+    """
+    Keywords and FAQ answers of every collection and language.
+
+    Layout:
+        {collection}::{language}::QuestionKeyWord     zset of the keywords of answered questions
+        {collection}::{language}::NotAnswerKeyWord    zset of the keywords of unanswered questions
+        {collection}::{language}::CacheKeyWord        set of the keywords with an FAQ answer
+        {collection}::{language}::KeywordToQuestion   hash from keyword to FAQ question
+        {collection}::{language}::QuestionToAnswer    hash from FAQ question to answer
+
+    Methods writing several keys make one round trip: a MULTI transaction, or a script when
+    a write depends on a read.
+    """
+
     def __init__(self):
-        self.redis = redis.from_url(REDIS_URL)
-    
-    def set_chat_history(self, user_id: bytes, chat_history: ChatHistory):
-        if not self.redis.exists(user_id):
-            self.redis.json().set(user_id, "$", [])
-            self.redis.expire(user_id, 1800)
-            
-        self.redis.json().arrappend(user_id, "$", chat_history)
-    
-    def get_qa_history(self, user_id: bytes) -> List[QAHistory]:
-        chat_history = self.redis.json().get(user_id, "$")[0]
-        qa_list = []
-        for chat in chat_history:
-            qa_list.append(QAHistory(**chat))
-
-        return qa_list
-    
-    def get_chat_history(self, user_id: bytes) -> List[ChatHistory]:
-        try:
-            chat_history = self.redis.json().get(user_id, "$")[0]
-        except TypeError:
-            chat_history = []
-            
-        return chat_history
+        pool = redis.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+        pool.connection_class = _counted(pool.connection_class)
+        self.redis = redis.Redis(connection_pool=pool)
+        self.delete_faq_script = self.redis.register_script(DELETE_FAQ_SCRIPT)
 
-    def user_exists(self, user_id: bytes) -> bool:
-        return self.redis.exists(user_id)
-    
     def add_question_key_word(self, query: str, language: str, collection: str):
         # self.redis.zincrby(f"{language}QuestionKeyWord", 1, query)
         self.redis.zincrby(f"{collection}::{language}::QuestionKeyWord", 1, query)
-    
+
     def get_key_word(self, language: str, collection: str) -> Set[str]:
         result = self.redis.zrange(f"{collection}::{language}::QuestionKeyWord", 0, 4, desc=True)
         return set(map(codecs.decode, result))
-    
+
     def add_not_answer_key_world(self, query: str, language: str, collection: str):
-        self.redis.zrem(f"{collection}::{language}::QuestionKeyWord", query)
-        self.redis.zincrby(f"{collection}::{language}::NotAnswerKeyWord", 1, query)
-    
+        pipe = self.redis.pipeline()
+        pipe.zrem(f"{collection}::{language}::QuestionKeyWord", query)
+        pipe.zincrby(f"{collection}::{language}::NotAnswerKeyWord", 1, query)
+        pipe.execute()
+
     def set_keyword_cache(self, query_list: Set[str], language: str, collection: str):
-        self.redis.delete(f"{collection}::{language}::CacheKeyWord")
-        self.redis.sadd(f"{collection}::{language}::CacheKeyWord", *query_list)
-    
+        pipe = self.redis.pipeline()
+        pipe.delete(f"{collection}::{language}::CacheKeyWord")
+        if query_list:
+            pipe.sadd(f"{collection}::{language}::CacheKeyWord", *query_list)
+        pipe.execute()
+
     def get_keyword_cache(self, language: str, collection: str) -> Set[str]:
         result = self.redis.smembers(f"{collection}::{language}::CacheKeyWord")
         return set(map(codecs.decode, result))
 
     def add_faq(self, keyword:str, question: str, answer: str, language: str, collection: str):
-        self.redis.hset(f"{collection}::{language}::KeywordToQuestion", keyword, question)
-        self.redis.hset(f"{collection}::{language}::QuestionToAnswer", question, answer)
-    
-    def delete_faq(self, keyword: str, language: str, collection: str):
-        question = self.redis.hget(f"{collection}::{language}::KeywordToQuestion", keyword)
+        pipe = self.redis.pipeline()
+        pipe.hset(f"{collection}::{language}::KeywordToQuestion", keyword, question)
+        pipe.hset(f"{collection}::{language}::QuestionToAnswer", question, answer)
+        pipe.execute()
 
-        self.redis.hdel(f"{collection}::{language}::KeywordToQuestion", keyword)
-        self.redis.hdel(f"{collection}::{language}::QuestionToAnswer", question)
+    def delete_faq(self, keyword: str, language: str, collection: str):
+        self.delete_faq_script(
+            keys=[f"{collection}::{language}::KeywordToQuestion", f"{collection}::{language}::QuestionToAnswer"],
+            args=[keyword],
+        )
 
     def get_faq_question(self, language: str, collection: str) -> List[str]:
         question_list = self.redis.hkeys(f"{collection}::{language}::QuestionToAnswer")
@@ -77,7 +128,7 @@ class RedisChat():
             question_str_list = list(map(codecs.decode, question_list))
         except TypeError:
             question_str_list = []
-        
+
         return question_str_list
 
     def get_faq_answer(self, question: str, language: str, collection: str) -> str:
@@ -87,4 +138,61 @@ class RedisChat():
         except TypeError:
             answer_str = ""
         return answer_str
-    
+
+
+@singleton_with_lock
+class AsyncRedisChat():
+    """
+    RedisChat for the request handlers: the same keys through an asyncio client, so that Redis
+    round trips do not block the event loop.
+    """
+
+    def __init__(self):
+        pool = redis.asyncio.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+        pool.connection_class = _async_counted(pool.connection_class)
+        self.redis = redis.asyncio.Redis(connection_pool=pool)
+        self.delete_faq_script = self.redis.register_script(DELETE_FAQ_SCRIPT)
+
+    async def add_question_key_word(self, query: str, language: str, collection: str):
+        await self.redis.zincrby(f"{collection}::{language}::QuestionKeyWord", 1, query)
+
+    async def get_key_word(self, language: str, collection: str) -> Set[str]:
+        result = await self.redis.zrange(f"{collection}::{language}::QuestionKeyWord", 0, 4, desc=True)
+        return set(map(codecs.decode, result))
+
+    async def add_not_answer_key_world(self, query: str, language: str, collection: str):
+        pipe = self.redis.pipeline()
+        pipe.zrem(f"{collection}::{language}::QuestionKeyWord", query)
+        pipe.zincrby(f"{collection}::{language}::NotAnswerKeyWord", 1, query)
+        await pipe.execute()
+
+    async def set_keyword_cache(self, query_list: Set[str], language: str, collection: str):
+        pipe = self.redis.pipeline()
+        pipe.delete(f"{collection}::{language}::CacheKeyWord")
+        if query_list:
+            pipe.sadd(f"{collection}::{language}::CacheKeyWord", *query_list)
+        await pipe.execute()
+
+    async def get_keyword_cache(self, language: str, collection: str) -> Set[str]:
+        result = await self.redis.smembers(f"{collection}::{language}::CacheKeyWord")
+        return set(map(codecs.decode, result))
+
+    async def add_faq(self, keyword: str, question: str, answer: str, language: str, collection: str):
+        pipe = self.redis.pipeline()
+        pipe.hset(f"{collection}::{language}::KeywordToQuestion", keyword, question)
+        pipe.hset(f"{collection}::{language}::QuestionToAnswer", question, answer)
+        await pipe.execute()
+
+    async def delete_faq(self, keyword: str, language: str, collection: str):
+        await self.delete_faq_script(
+            keys=[f"{collection}::{language}::KeywordToQuestion", f"{collection}::{language}::QuestionToAnswer"],
+            args=[keyword],
+        )
+
+    async def get_faq_question(self, language: str, collection: str) -> List[str]:
+        question_list = await self.redis.hkeys(f"{collection}::{language}::QuestionToAnswer")
+        return list(map(codecs.decode, question_list or []))
+
+    async def get_faq_answer(self, question: str, language: str, collection: str) -> str:
+        answer = await self.redis.hget(f"{collection}::{language}::QuestionToAnswer", question)
+        return codecs.decode(answer) if answer is not None else ""
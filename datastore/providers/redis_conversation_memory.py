@@ -0,0 +1,101 @@
+import os
+from typing import List, Optional, Tuple, Union
+
+from redis.asyncio.lock import Lock
+
+from models.chat import ConversationTurn
+from datastore.providers.redis_chat import AsyncRedisChat
+from utils.common import singleton_with_lock
+
+CONVERSATION_WINDOW = int(os.environ.get("CONVERSATION_WINDOW", 6))  # Latest turns read for a new turn
+CONVERSATION_MAX_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", 50))  # Turns kept for the history of a conversation
+CONVERSATION_TTL = int(os.environ.get("CONVERSATION_TTL", 1800))  # Seconds a conversation is kept after its last turn
+CONVERSATION_SUMMARY_LOCK_TTL = int(os.environ.get("CONVERSATION_SUMMARY_LOCK_TTL", 60))  # Seconds a summary update holds its conversation at most
+
+
+@singleton_with_lock
+class RedisConversationMemory():
+    """
+    Turns of the conversations of every user, with a running summary of the older ones.
+
+    Layout, following the RedisChat key scheme:
+        {user_id}::Turns         list of the turns, oldest first, as compact ConversationTurn JSON
+        {user_id}::Summary       hash with the text and the tokens of the running summary
+        {user_id}::SummaryLock   lock of the summary while a turn is folded into it
+
+    A new turn only reads the last CONVERSATION_WINDOW turns with LRANGE, turns leaving the
+    window are folded into the summary. Both keys expire CONVERSATION_TTL seconds after the
+    last turn.
+    """
+
+    def __init__(self):
+        self.redis = AsyncRedisChat().redis
+
+    def _key(self, user_id: Union[str, bytes], name: str) -> Union[str, bytes]:
+        # The websocket keys users by their UUID bytes, LINE by their user id
+        if isinstance(user_id, bytes):
+            return user_id + f"::{name}".encode()
+        return f"{user_id}::{name}"
+
+    async def append(self, user_id: Union[str, bytes], turn: ConversationTurn) -> Optional[ConversationTurn]:
+        """
+        Add a turn to a conversation in one round trip.
+
+        Returns:
+            The turn that left the window with this one, to fold into the summary.
+        """
+        turns, summary = self._key(user_id, "Turns"), self._key(user_id, "Summary")
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(turns, turn.json(by_alias=True))
+        pipe.ltrim(turns, -CONVERSATION_MAX_TURNS, -1)
+        pipe.lindex(turns, -(CONVERSATION_WINDOW + 1))
+        pipe.expire(turns, CONVERSATION_TTL)
+        pipe.expire(summary, CONVERSATION_TTL)
+        evicted = (await pipe.execute())[2]
+        return ConversationTurn.parse_raw(evicted) if evicted is not None else None
+
+    async def window(
+        self, user_id: Union[str, bytes], size: int = CONVERSATION_WINDOW
+    ) -> Tuple[List[ConversationTurn], Optional[str], int]:
+        """
+        The latest turns of a conversation, oldest first, with the text and tokens of its summary,
+        in one round trip.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lrange(self._key(user_id, "Turns"), -size, -1)
+        pipe.hmget(self._key(user_id, "Summary"), "text", "tokens")
+        turns, (text, tokens) = await pipe.execute()
+        return (
+            [ConversationTurn.parse_raw(turn) for turn in turns],
+            text.decode() if text is not None else None,
+            int(tokens or 0),
+        )
+
+    async def turns(self, user_id: Union[str, bytes]) -> List[ConversationTurn]:
+        """Every turn kept for a conversation, oldest first."""
+        return [ConversationTurn.parse_raw(turn) for turn in await self.redis.lrange(self._key(user_id, "Turns"), 0, -1)]
+
+    async def exists(self, user_id: Union[str, bytes]) -> bool:
+        return await self.redis.exists(self._key(user_id, "Turns")) > 0
+
+    async def summary(self, user_id: Union[str, bytes]) -> Optional[str]:
+        text = await self.redis.hget(self._key(user_id, "Summary"), "text")
+        return text.decode() if text is not None else None
+
+    async def set_summary(self, user_id: Union[str, bytes], text: str, tokens: int):
+        summary = self._key(user_id, "Summary")
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(summary, mapping={"text": text, "tokens": tokens})
+        pipe.expire(summary, CONVERSATION_TTL)
+        await pipe.execute()
+
+    def summary_lock(self, user_id: Union[str, bytes]) -> Lock:
+        """
+        Lock of the summary of a conversation, so turns leaving the window one after another
+        are folded into it in turn by every worker instead of overwriting each other.
+        """
+        return self.redis.lock(
+            self._key(user_id, "SummaryLock"),
+            timeout=CONVERSATION_SUMMARY_LOCK_TTL,
+            blocking_timeout=CONVERSATION_SUMMARY_LOCK_TTL,
+        )
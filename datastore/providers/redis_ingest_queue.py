@@ -0,0 +1,167 @@
+import os
+import time
+from typing import Optional
+
+from loguru import logger
+
+from datastore.providers.redis_chat import AsyncRedisChat
+from models.models import IngestJob, IngestJobStatus
+from utils.common import singleton_with_lock
+
+INGEST_TENANT_CONCURRENCY = int(os.environ.get("INGEST_TENANT_CONCURRENCY", 2))  # Jobs of one tenant running at once
+INGEST_LEASE_SECONDS = int(os.environ.get("INGEST_LEASE_SECONDS", 60))  # A job whose worker stops renewing its lease for this long is requeued
+INGEST_JOB_TTL = int(os.environ.get("INGEST_JOB_TTL", 604800))  # Seconds a finished job stays queryable
+
+# Move the oldest queued job to the processing list and lease it to the worker in one step,
+# so a reaper never sees a claimed job without a lease
+CLAIM_SCRIPT = """
+local id = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if id then
+    redis.call('SET', ARGV[1] .. id .. ARGV[2], ARGV[3], 'EX', ARGV[4])
+end
+return id
+"""
+
+# Take one of the tenant's running slots unless all of them are held by live jobs
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Put a processing job back in the queue if its lease expired, at most once across reapers
+REAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 and redis.call('LREM', KEYS[2], 1, ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+@singleton_with_lock
+class RedisIngestQueue():
+    """
+    Reliable queue of ingestion jobs shared by every worker process.
+
+    Layout, following the RedisChat key scheme:
+        IngestJob::{id}                 JSON of the job, including its last committed progress
+        IngestJob::{id}::Lease          id of the worker running the job, renewed while it runs
+        IngestJobs::Queue               list of queued job ids, LPUSH in and RPOPLPUSH out
+        IngestJobs::Processing          list of claimed job ids
+        IngestJobs::Tenant::{tenant}    zset of the tenant's running job ids scored by lease expiry
+
+    A job stays in the processing list until it finishes, so when a worker dies its lease
+    expires and `reap` hands the job to another worker, which resumes it from its progress.
+    Every method goes through the asyncio client, the queue is used from the API's event loop.
+    """
+
+    JOB_PREFIX = "IngestJob::"
+    LEASE_SUFFIX = "::Lease"
+    QUEUE = "IngestJobs::Queue"
+    PROCESSING = "IngestJobs::Processing"
+
+    def __init__(
+        self,
+        tenant_concurrency: int = INGEST_TENANT_CONCURRENCY,
+        lease_seconds: int = INGEST_LEASE_SECONDS,
+    ):
+        self.redis = AsyncRedisChat().redis
+        self.tenant_concurrency = tenant_concurrency
+        self.lease_seconds = lease_seconds
+        self.claim_script = self.redis.register_script(CLAIM_SCRIPT)
+        self.acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+        self.reap_script = self.redis.register_script(REAP_SCRIPT)
+
+    def _job(self, job_id: str) -> str:
+        return f"{self.JOB_PREFIX}{job_id}"
+
+    def _lease(self, job_id: str) -> str:
+        return f"{self.JOB_PREFIX}{job_id}{self.LEASE_SUFFIX}"
+
+    def _tenant(self, tenant: str) -> str:
+        return f"IngestJobs::Tenant::{tenant}"
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        data = await self.redis.get(self._job(job_id))
+        return IngestJob.parse_raw(data) if data else None
+
+    async def save(self, job: IngestJob):
+        finished = job.status in (IngestJobStatus.done, IngestJobStatus.failed)
+        await self.redis.set(self._job(job.id), job.json(), ex=INGEST_JOB_TTL if finished else None)
+
+    async def enqueue(self, job: IngestJob):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(self._job(job.id), job.json())
+        pipe.lpush(self.QUEUE, job.id)
+        await pipe.execute()
+
+    async def claim(self, worker_id: str) -> Optional[IngestJob]:
+        """
+        Take the oldest queued job whose tenant has a free slot, or None. Jobs of tenants
+        already at their cap go to the back of the queue.
+        """
+        for _ in range(await self.redis.llen(self.QUEUE)):
+            job_id = await self.claim_script(
+                keys=[self.QUEUE, self.PROCESSING],
+                args=[self.JOB_PREFIX, self.LEASE_SUFFIX, worker_id, self.lease_seconds],
+            )
+            if job_id is None:
+                return None
+            job_id = job_id.decode()
+
+            job = await self.get(job_id)
+            if job is None:
+                logger.warning(f"Dropping ingestion job {job_id} without data")
+                await self.release(job_id)
+                continue
+
+            now = time.time()
+            if await self.acquire_script(
+                keys=[self._tenant(job.tenant)],
+                args=[job.id, now, now + self.lease_seconds, self.tenant_concurrency],
+            ):
+                return job
+
+            await self.requeue(job)
+        return None
+
+    async def renew(self, job: IngestJob, worker_id: str):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._lease(job.id), worker_id, ex=self.lease_seconds)
+        pipe.zadd(self._tenant(job.tenant), {job.id: time.time() + self.lease_seconds})
+        await pipe.execute()
+
+    async def release(self, job_id: str, tenant: Optional[str] = None):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lrem(self.PROCESSING, 0, job_id)
+        pipe.delete(self._lease(job_id))
+        if tenant is not None:
+            pipe.zrem(self._tenant(tenant), job_id)
+        await pipe.execute()
+
+    async def requeue(self, job: IngestJob):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(self._job(job.id), job.json())
+        pipe.lrem(self.PROCESSING, 0, job.id)
+        pipe.delete(self._lease(job.id))
+        pipe.zrem(self._tenant(job.tenant), job.id)
+        pipe.lpush(self.QUEUE, job.id)
+        await pipe.execute()
+
+    async def finish(self, job: IngestJob):
+        await self.save(job)
+        await self.release(job.id, job.tenant)
+
+    async def reap(self) -> int:
+        """Requeue the processing jobs whose worker stopped renewing their lease."""
+        reaped = 0
+        for job_id in await self.redis.lrange(self.PROCESSING, 0, -1):
+            job_id = job_id.decode()
+            reaped += await self.reap_script(keys=[self._lease(job_id), self.PROCESSING, self.QUEUE], args=[job_id])
+        if reaped:
+            logger.info(f"Requeued {reaped} ingestion jobs with an expired lease")
+        return reaped
@@ -0,0 +1,204 @@
+import os
+import json
+import re
+from typing import List, Optional
+
+from loguru import logger
+from redis.exceptions import RedisError, ResponseError
+from redis.commands.search.field import NumericField, TagField, TextField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query as SearchQuery
+
+from datastore.providers.redis_chat import AsyncRedisChat
+from models.models import DocumentChunk, DocumentChunkWithScore, DocumentMetadataFilter
+from services.date import to_unix_timestamp
+from services.lexical import tokenize
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+LEXICAL_INDEX_ENABLED = os.environ.get("LEXICAL_INDEX_ENABLED", "false").lower() == "true"  # Index chunks for hybrid retrieval, off until a tenant needs it
+LEXICAL_MAX_QUERY_TERMS = int(os.environ.get("LEXICAL_MAX_QUERY_TERMS", 64))  # Distinct terms of a query searched at most
+
+TAG_FIELDS = ["document_id", "source", "source_id", "author"]
+COUNT_FIELDS = ["token_count", "start_char", "end_char"]  # Counted at ingestion, returned as they were stored
+DELETE_BATCH_SIZE = 1000
+
+metrics = Metrics()
+
+
+def escape_tag(value: str) -> str:
+    return re.sub(r"([^\w])", r"\\\1", value)
+
+
+@singleton_with_lock
+class RedisLexicalIndex():
+    """
+    BM25 index over the text of the chunks, one RediSearch index per collection.
+
+    Layout, following the RedisChat key scheme:
+        {collection}::Lexical::{chunk_id}   hash with the chunk's terms, text, metadata and counts
+        {collection}::LexicalIdx            full-text index over the terms of those hashes
+
+    The text is split by services.lexical.tokenize before it is stored, since RediSearch has
+    no Japanese tokenizer, and searched with the same terms. Chunks keep their text and
+    metadata so a lexical hit needs no round trip to the vector database. Every call goes
+    through the asyncio client, as the index is written and searched by the datastore's
+    request paths.
+    """
+
+    def __init__(self):
+        self.redis = AsyncRedisChat().redis
+        self.indexes = set()
+
+    def _prefix(self, collection: str) -> str:
+        return f"{collection}::Lexical::"
+
+    def _index(self, collection: str) -> str:
+        return f"{collection}::LexicalIdx"
+
+    async def _ensure_index(self, collection: str):
+        index = self._index(collection)
+        if index in self.indexes:
+            return
+
+        try:
+            await self.redis.ft(index).create_index(
+                [
+                    TextField("terms", no_stem=True),
+                    *[TagField(field) for field in TAG_FIELDS],
+                    NumericField("created_at"),
+                ],
+                definition=IndexDefinition(prefix=[self._prefix(collection)], index_type=IndexType.HASH),
+                stopwords=[],
+            )
+        except ResponseError as e:
+            if "Index already exists" not in str(e):
+                raise
+        self.indexes.add(index)
+
+    async def add(self, collection: str, chunks: List[DocumentChunk]):
+        if not LEXICAL_INDEX_ENABLED or not chunks:
+            return
+
+        try:
+            await self._ensure_index(collection)
+            pipe = self.redis.pipeline(transaction=False)
+            for chunk in chunks:
+                metadata = chunk.metadata
+                mapping = {
+                    "terms": " ".join(tokenize(chunk.text)),
+                    "text": chunk.text,
+                    "metadata": metadata.json(),
+                }
+                for field in COUNT_FIELDS:
+                    value = getattr(chunk, field)
+                    if value is not None:
+                        mapping[field] = value
+                for field in TAG_FIELDS:
+                    value = getattr(metadata, field, None)
+                    if value is not None:
+                        mapping[field] = str(value)
+                if metadata.created_at is not None:
+                    mapping["created_at"] = to_unix_timestamp(metadata.created_at)
+                pipe.hset(self._prefix(collection) + chunk.id, mapping=mapping)
+            await pipe.execute()
+        except RedisError as e:
+            # The chunks are still in the vector database, a backfill adds them again
+            logger.error(f"Lexical indexing of {len(chunks)} chunks failed: {e}")
+            metrics.incr("lexical.error")
+
+    def _filter(self, filter: Optional[DocumentMetadataFilter]) -> str:
+        if filter is None:
+            return ""
+
+        clauses = []
+        for field in TAG_FIELDS:
+            value = getattr(filter, field)
+            if value is not None:
+                clauses.append(f"@{field}:{{{escape_tag(str(value))}}}")
+        if filter.start_date or filter.end_date:
+            start = to_unix_timestamp(filter.start_date) if filter.start_date else "-inf"
+            end = to_unix_timestamp(filter.end_date) if filter.end_date else "+inf"
+            clauses.append(f"@created_at:[{start} {end}]")
+        return " ".join(clauses)
+
+    async def search(
+        self,
+        collection: str,
+        query: str,
+        limit: int,
+        filter: Optional[DocumentMetadataFilter] = None,
+    ) -> List[DocumentChunkWithScore]:
+        """The chunks best matching the terms of the query by BM25, best first."""
+        if not LEXICAL_INDEX_ENABLED:
+            return []
+
+        terms = list(dict.fromkeys(tokenize(query)))[:LEXICAL_MAX_QUERY_TERMS]
+        if not terms:
+            return []
+
+        search_query = (
+            SearchQuery(f"@terms:({'|'.join(terms)}) {self._filter(filter)}".strip())
+            .scorer("BM25")
+            .with_scores()
+            .return_fields("text", "metadata", *COUNT_FIELDS)
+            .paging(0, limit)
+        )
+        try:
+            await self._ensure_index(collection)
+            result = await self.redis.ft(self._index(collection)).search(search_query)
+        except RedisError as e:
+            logger.warning(f"Lexical search failed: {e}")
+            metrics.incr("lexical.error")
+            return []
+
+        prefix = self._prefix(collection)
+        return [
+            DocumentChunkWithScore(
+                id=doc.id[len(prefix):],
+                text=doc.text,
+                metadata=json.loads(doc.metadata),
+                **{field: getattr(doc, field, None) for field in COUNT_FIELDS},
+                score=float(doc.score),
+            )
+            for doc in result.docs
+        ]
+
+    async def delete(
+        self,
+        collection: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ):
+        """Mirror a DataStore.delete of the collection."""
+        if not LEXICAL_INDEX_ENABLED:
+            return
+
+        try:
+            if delete_all:
+                # DD also deletes the indexed hashes
+                await self.redis.ft(self._index(collection)).dropindex(delete_documents=True)
+                self.indexes.discard(self._index(collection))
+                return
+
+            keys = [self._prefix(collection) + id for id in ids or []]
+            clauses = self._filter(filter)
+            if not clauses:
+                if keys:
+                    await self.redis.delete(*keys)
+                return
+
+            # Like the vector database, delete what matches the ids and the filter
+            await self._ensure_index(collection)
+            while True:
+                query = SearchQuery(clauses).no_content().paging(0, DELETE_BATCH_SIZE)
+                if keys:
+                    query = query.limit_ids(*keys)
+                result = await self.redis.ft(self._index(collection)).search(query)
+                if not result.docs:
+                    break
+                await self.redis.delete(*[doc.id for doc in result.docs])
+        except RedisError as e:
+            logger.warning(f"Lexical index delete failed: {e}")
+            metrics.incr("lexical.error")
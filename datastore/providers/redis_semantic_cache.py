@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import uuid
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+from redis.exceptions import RedisError, ResponseError
+from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query as SearchQuery
+
+from datastore.providers.redis_chat import AsyncRedisChat
+from models.chat import SemanticCacheHit
+from models.i18n import i18n
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))  # Minimum cosine similarity for a hit
+SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", 86400))  # Seconds an answer stays cached
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 1000))  # Per collection and language
+EMBEDDING_DIMENSION = 1536
+
+metrics = Metrics()
+
+
+@singleton_with_lock
+class RedisSemanticCache():
+    """
+    Answers keyed by question embedding, one RediSearch vector index per collection and language.
+
+    Layout, following the RedisChat key scheme:
+        {collection}::{language}::SemanticCache::{id}   hash with embedding, answer and chunk ids
+        {collection}::{language}::SemanticCacheIdx      FLAT cosine index over those hashes
+        {collection}::{language}::SemanticCacheLRU      zset of entry ids scored by last access
+
+    Every call goes through the asyncio client, and a Redis failure is logged and treated as a
+    miss, so the cache never fails a chat turn.
+    """
+
+    def __init__(self):
+        self.redis = AsyncRedisChat().redis
+        self.indexes = set()
+
+    def _prefix(self, collection: str, language: str) -> str:
+        return f"{collection}::{language}::SemanticCache::"
+
+    def _index(self, collection: str, language: str) -> str:
+        return f"{collection}::{language}::SemanticCacheIdx"
+
+    def _lru(self, collection: str, language: str) -> str:
+        return f"{collection}::{language}::SemanticCacheLRU"
+
+    async def _ensure_index(self, collection: str, language: str):
+        index = self._index(collection, language)
+        if index in self.indexes:
+            return
+
+        try:
+            await self.redis.ft(index).create_index(
+                [
+                    TagField("collection"),
+                    VectorField(
+                        "embedding",
+                        "FLAT",
+                        {"TYPE": "FLOAT32", "DIM": EMBEDDING_DIMENSION, "DISTANCE_METRIC": "COSINE"},
+                    ),
+                ],
+                definition=IndexDefinition(prefix=[self._prefix(collection, language)], index_type=IndexType.HASH),
+            )
+        except ResponseError as e:
+            if "Index already exists" not in str(e):
+                raise
+        self.indexes.add(index)
+
+    async def lookup(self, embedding: List[float], collection: str, language: str) -> Optional[SemanticCacheHit]:
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+
+        try:
+            await self._ensure_index(collection, language)
+            query = (
+                SearchQuery("*=>[KNN 1 @embedding $vec AS distance]")
+                .sort_by("distance")
+                .return_fields("answer", "chunk_ids", "distance")
+                .dialect(2)
+            )
+            result = await self.redis.ft(self._index(collection, language)).search(
+                query, query_params={"vec": np.asarray(embedding, dtype=np.float32).tobytes()}
+            )
+        except RedisError as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            metrics.incr("semantic_cache.error")
+            return None
+
+        if result.docs:
+            doc = result.docs[0]
+            similarity = 1 - float(doc.distance)
+            if similarity >= SEMANTIC_CACHE_THRESHOLD:
+                entry_id = doc.id[len(self._prefix(collection, language)):]
+                try:
+                    await self.redis.zadd(self._lru(collection, language), {entry_id: time.time()})
+                except RedisError as e:
+                    logger.warning(f"Semantic cache access not recorded: {e}")
+                metrics.incr("semantic_cache.hit")
+                return SemanticCacheHit(
+                    answer=doc.answer,
+                    chunk_ids=json.loads(doc.chunk_ids),
+                    similarity=similarity,
+                )
+
+        metrics.incr("semantic_cache.miss")
+        return None
+
+    async def add(self, embedding: List[float], answer: str, chunk_ids: List[str], collection: str, language: str):
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+
+        entry_id = uuid.uuid4().hex
+        key = self._prefix(collection, language) + entry_id
+        lru = self._lru(collection, language)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={
+            "collection": collection,
+            "embedding": np.asarray(embedding, dtype=np.float32).tobytes(),
+            "answer": answer,
+            "chunk_ids": json.dumps(chunk_ids),
+        })
+        pipe.expire(key, SEMANTIC_CACHE_TTL)
+        pipe.zadd(lru, {entry_id: time.time()})
+        pipe.expire(lru, SEMANTIC_CACHE_TTL)
+        pipe.zcard(lru)
+
+        try:
+            await self._ensure_index(collection, language)
+            size = (await pipe.execute())[-1]
+
+            # Evict the least recently used entries beyond the per-collection cap
+            if size > SEMANTIC_CACHE_MAX_ENTRIES:
+                evicted = await self.redis.zpopmin(lru, size - SEMANTIC_CACHE_MAX_ENTRIES)
+                if evicted:
+                    prefix = self._prefix(collection, language)
+                    await self.redis.delete(*[prefix + evicted_id.decode() for evicted_id, _ in evicted])
+                    metrics.incr("semantic_cache.eviction", len(evicted))
+        except RedisError as e:
+            logger.warning(f"Semantic cache unavailable: {e}")
+            metrics.incr("semantic_cache.error")
+
+    async def invalidate(self, collection: str):
+        """Drop every cached answer of a collection, called whenever its documents change."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+
+        try:
+            for language in i18n:
+                index = self._index(collection, language)
+                self.indexes.discard(index)
+                try:
+                    # DD also deletes the indexed hashes
+                    await self.redis.ft(index).dropindex(delete_documents=True)
+                except ResponseError:
+                    pass
+                await self.redis.delete(self._lru(collection, language))
+        except RedisError as e:
+            # Entries left behind expire after SEMANTIC_CACHE_TTL
+            logger.warning(f"Semantic cache of {collection} not invalidated: {e}")
+            metrics.incr("semantic_cache.error")
+            return
+
+        metrics.incr("semantic_cache.invalidation")
+
+    def stats(self) -> dict:
+        return {
+            "hits": metrics.get("semantic_cache.hit"),
+            "misses": metrics.get("semantic_cache.miss"),
+            "evictions": metrics.get("semantic_cache.eviction"),
+            "invalidations": metrics.get("semantic_cache.invalidation"),
+            "hit_rate": metrics.ratio("semantic_cache.hit", "semantic_cache.miss"),
+        }
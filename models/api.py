@@ -2,7 +2,10 @@ from models.models import (
     Document,
     DocumentMetadataFilter,
     Query,
-    QueryResult
+    QueryResult,
+    UpsertProgress,
+    IngestJobStatus,
+    CollectionStorage,
 )
 from models.chat import QAHistory
 from models.payments import SubscriptionPlatform, SubscriptionType, allSubscriptionInfo
@@ -18,6 +21,14 @@ class UpsertRequest(BaseModel):
 
 class UpsertResponse(BaseModel):
     ids: List[str]
+    progress: Optional[UpsertProgress] = None
+
+
+class IngestJobResponse(BaseModel):
+    id: str
+    status: IngestJobStatus
+    progress: Optional[UpsertProgress] = None
+    error: Optional[str] = None
 
 
 class QueryRequest(BaseModel):
@@ -44,6 +55,7 @@ class CreateCollectionRequest(BaseModel):
     fallback_msg: Optional[str] = "Token Limit Reached"
     line_channel_access_token: Optional[str] = ""
     line_language: Optional[str] = "ja"
+    storage: Optional[CollectionStorage] = None  # Defaults to the storage profile of the owner's plan
 
 
 class CreateCollectionResponse(BaseModel):
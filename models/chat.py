@@ -1,7 +1,8 @@
 from typing import Optional, List, Union
 from enum import Enum
 from models.i18n import i18n
-from pydantic import BaseModel
+from models.models import DocumentChunkWithScore
+from pydantic import BaseModel, Field
 
 class QAHistory(BaseModel):
     user_question: str
@@ -12,6 +13,43 @@ class ChatHistory(QAHistory):
     query: Optional[str] = None
     background: str
     
+class ConversationTurn(BaseModel):
+    """One turn of a conversation, stored under one-letter keys to keep the memory small."""
+    user_question: str = Field(alias="q")
+    answer: str = Field(alias="a")
+    tokens: int = Field(0, alias="t")  # Tokens of the question and the answer, counted once when stored
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+class ConversationHistory(BaseModel):
+    summary: Optional[str] = None  # Running summary of the turns older than the window
+    turns: List[ConversationTurn] = []  # Latest turns, oldest first
+    tokens: int = 0  # Tokens of the summary and the turns
+
+
+class ChatContext(BaseModel):
+    text: str
+    chunks: List[DocumentChunkWithScore]
+    tokens: int  # Tokens the text adds to the prompt
+
+
+class TokenUsage(BaseModel):
+    routing: int = 0  # Tokens of the function-calling completion
+    prompt: int = 0  # Prompt tokens of the answer
+    completion: int = 0  # Tokens of the answer
+
+    @property
+    def total(self) -> int:
+        return self.routing + self.prompt + self.completion
+
+
+class SemanticCacheHit(BaseModel):
+    answer: str
+    chunk_ids: List[str]
+    similarity: float
+
 class ChatHistortList(BaseModel):
     chat_history: Optional[List[ChatHistory]]
 
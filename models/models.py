@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from enum import Enum
 
 
@@ -26,6 +26,9 @@ class DocumentChunk(BaseModel):
     text: str
     metadata: DocumentChunkMetadata
     embedding: Optional[List[float]] = None
+    token_count: Optional[int] = None  # Tokens of the text, counted once at ingestion
+    start_char: Optional[int] = None  # Offset of the first character of the chunk in its document
+    end_char: Optional[int] = None  # Offset after the last character of the chunk in its document
 
 
 class DocumentChunkWithScore(DocumentChunk):
@@ -42,6 +45,52 @@ class DocumentWithChunks(Document):
     chunks: List[DocumentChunk]
 
 
+class UpsertProgress(BaseModel):
+    document_id: str
+    chunks: int = 0  # Chunks created so far
+    embedded: int = 0  # Chunks embedded so far
+    written: int = 0  # Chunks written to the vector store so far
+    committed: List[int] = []  # Text pieces whose chunks are all written
+    piece_chars: Dict[int, int] = {}  # Characters of every text piece extracted so far
+    done: bool = False
+
+
+class StorageProfile(str, Enum):
+    default = "default"  # float32 vectors and payload in RAM
+    int8 = "int8"  # Scalar int8 quantized copy in RAM, searched with rescoring
+    int8_on_disk = "int8_on_disk"  # int8 copy in RAM, original vectors and payload on disk
+    binary = "binary"  # Binary quantized copy in RAM, searched with rescoring
+    on_disk = "on_disk"  # Vectors and payload on disk
+
+
+class CollectionStorage(BaseModel):
+    profile: StorageProfile = StorageProfile.default
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+
+
+class IngestJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class IngestJob(BaseModel):
+    id: str
+    tenant: str
+    collection: str
+    file_id: str
+    file_name: Optional[str] = None
+    path: str
+    mimetype: Optional[str] = None
+    metadata: DocumentMetadata
+    status: IngestJobStatus = IngestJobStatus.queued
+    attempts: int = 0
+    progress: Optional[UpsertProgress] = None
+    error: Optional[str] = None
+
+
 class DocumentMetadataFilter(BaseModel):
     document_id: Optional[str] = None
     source: Optional[Source] = None
@@ -51,10 +100,19 @@ class DocumentMetadataFilter(BaseModel):
     end_date: Optional[str] = None  # any date string format
 
 
+class RetrievalMode(str, Enum):
+    dense = "dense"  # Nearest neighbours of the query embedding
+    hybrid = "hybrid"  # Dense and BM25 lexical results merged by reciprocal rank fusion
+
+
 class Query(BaseModel):
     query: str
     filter: Optional[DocumentMetadataFilter] = None
     top_k: Optional[int] = 3
+    retrieval: RetrievalMode = RetrievalMode.dense
+    rerank: bool = False  # Rescore the candidates with a cross-encoder
+    mmr_lambda: Optional[float] = None  # Relevance weight of MMR diversification, None to skip it
+    max_tokens: Optional[int] = None  # Token budget of the returned chunks
 
 
 class QueryWithEmbedding(Query):
@@ -0,0 +1,36 @@
+import argparse
+
+from datastore.providers.qdrant_datastore import QdrantDataStore
+
+
+def main(args):
+    datastore = QdrantDataStore()
+    collections = args.collections or [c.name for c in datastore.client.get_collections().collections]
+
+    incomplete = 0
+    for collection_name in collections:
+        try:
+            missing, mismatched = datastore.audit_payload_indexes(collection_name)
+            if not missing and not mismatched:
+                continue
+            incomplete += 1
+            if mismatched:
+                print(f"{collection_name}: indexed with an unexpected type: {', '.join(mismatched)}")
+            if missing and args.repair:
+                created = datastore.ensure_payload_indexes(collection_name)
+                print(f"{collection_name}: created {', '.join(created)}")
+            elif missing:
+                print(f"{collection_name}: missing {', '.join(missing)}")
+        except Exception as e:
+            print(f"{collection_name}: failed, {e}")
+
+    print(f"{incomplete} of {len(collections)} collections had incomplete payload indexes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audit and repair the payload indexes of Qdrant collections")
+    parser.add_argument("--collections", nargs="+", help="Collections to audit, all of them by default")
+    parser.add_argument("--repair", action="store_true", help="Create the missing indexes")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+
+from datastore.providers.qdrant_datastore import QdrantDataStore
+from datastore.providers.redis_lexical_index import LEXICAL_INDEX_ENABLED, RedisLexicalIndex
+from models.models import DocumentChunk
+
+DEFAULT_BATCH_SIZE = 256
+
+
+async def backfill_collection(datastore: QdrantDataStore, collection_name: str, batch_size: int) -> int:
+    """Add every chunk of a collection to its lexical index and return how many were added."""
+    collection, tenant_id = datastore._resolve(collection_name)
+    offset, added = None, 0
+    while True:
+        points, offset = datastore.client.scroll(
+            collection,
+            scroll_filter=datastore._convert_metadata_filter_to_qdrant_filter(tenant_id=tenant_id),
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        await RedisLexicalIndex().add(
+            collection_name,
+            [
+                DocumentChunk(
+                    id=point.payload.get("id") or str(point.id),
+                    text=point.payload["text"],
+                    metadata=point.payload["metadata"],
+                    token_count=point.payload.get("token_count"),
+                    start_char=point.payload.get("start_char"),
+                    end_char=point.payload.get("end_char"),
+                )
+                for point in points
+            ],
+        )
+        added += len(points)
+        if offset is None:
+            break
+    return added
+
+
+async def main(args):
+    datastore = QdrantDataStore()
+    for i, collection_name in enumerate(args.collections):
+        try:
+            added = await backfill_collection(datastore, collection_name, args.batch_size)
+            print(f"[{i + 1}/{len(args.collections)}] {collection_name}: {added} chunks")
+        except Exception as e:
+            print(f"[{i + 1}/{len(args.collections)}] {collection_name}: failed, {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the chunks already in Qdrant to the lexical index")
+    parser.add_argument("--collections", nargs="+", required=True, help="Customer collection ids")
+    parser.add_argument("--batch_size", default=DEFAULT_BATCH_SIZE, type=int)
+    args = parser.parse_args()
+
+    if not LEXICAL_INDEX_ENABLED:
+        parser.error("the lexical index is disabled, set LEXICAL_INDEX_ENABLED=true")
+    asyncio.run(main(args))
@@ -0,0 +1,53 @@
+import argparse
+from collections import defaultdict
+
+from datastore.providers.qdrant_datastore import QdrantDataStore
+from services.chunks import tokenizer
+
+DEFAULT_BATCH_SIZE = 256
+
+
+def backfill_collection(datastore: QdrantDataStore, collection_name: str, batch_size: int) -> int:
+    """Store the token count of every chunk of a collection stored without one and return how many were counted."""
+    collection, tenant_id = datastore._resolve(collection_name)
+    offset, counted = None, 0
+    while True:
+        points, offset = datastore.client.scroll(
+            collection,
+            scroll_filter=datastore._convert_metadata_filter_to_qdrant_filter(tenant_id=tenant_id),
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        missing = [point for point in points if point.payload.get("token_count") is None]
+        token_counts = tokenizer.encode_batch([point.payload["text"] for point in missing], disallowed_special=())
+        # Chunks are about the same size, so a batch shares a few counts and takes a few writes
+        points_by_count = defaultdict(list)
+        for point, tokens in zip(missing, token_counts):
+            points_by_count[len(tokens)].append(point.id)
+        for token_count, ids in points_by_count.items():
+            datastore.client.set_payload(collection, payload={"token_count": token_count}, points=ids)
+        counted += len(missing)
+        if offset is None:
+            break
+    return counted
+
+
+def main(args):
+    datastore = QdrantDataStore()
+    for i, collection_name in enumerate(args.collections):
+        try:
+            counted = backfill_collection(datastore, collection_name, args.batch_size)
+            print(f"[{i + 1}/{len(args.collections)}] {collection_name}: {counted} chunks")
+        except Exception as e:
+            print(f"[{i + 1}/{len(args.collections)}] {collection_name}: failed, {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store the token counts of the chunks already in Qdrant")
+    parser.add_argument("--collections", nargs="+", required=True, help="Customer collection ids")
+    parser.add_argument("--batch_size", default=DEFAULT_BATCH_SIZE, type=int)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,134 @@
+import time
+import asyncio
+import argparse
+import threading
+
+import numpy as np
+import openai
+import uvicorn
+from aiohttp import ClientSession, WSMsgType
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+from services.openai import close_aiosession, acreate_chat_completion
+from scripts.benchmarks.fake_openai import create_app, serve_in_thread
+
+ROUTING_SCHEMA = [
+    {
+        "name": "ask_database",
+        "parameters": {
+            "type": "object",
+            "properties": {"key_word": {"type": "string"}},
+        },
+    }
+]
+
+
+def create_chat_app(mode: str) -> FastAPI:
+    """
+    A websocket endpoint with the same OpenAI call shape as `chat_switch` + `ask_database`:
+    a function-calling routing completion followed by a streamed answer.
+    """
+    app = FastAPI()
+
+    async def sync_turn(question: str):
+        openai.ChatCompletion.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": question}], functions=ROUTING_SCHEMA
+        )
+        stream = openai.ChatCompletion.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": question}], stream=True
+        )
+        for chunk in stream:
+            yield chunk["choices"][0]["delta"].get("content", "")
+
+    async def async_turn(question: str):
+        await acreate_chat_completion(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": question}], functions=ROUTING_SCHEMA
+        )
+        stream = await acreate_chat_completion(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": question}], stream=True
+        )
+        async for chunk in stream:
+            yield chunk["choices"][0]["delta"].get("content", "")
+
+    turn = async_turn if mode == "async" else sync_turn
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        while True:
+            try:
+                question = await websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+
+            async for content in turn(question):
+                if content:
+                    await websocket.send_json({"type": "answer::body", "content": content})
+            await websocket.send_json({"type": "answer::end"})
+
+    return app
+
+
+def serve_chat_in_thread(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_session(url: str, turns: int, ttft: list):
+    async with ClientSession() as session:
+        async with session.ws_connect(url) as ws:
+            for i in range(turns):
+                start = time.perf_counter()
+                first = None
+                await ws.send_str(f"question {i}")
+                async for msg in ws:
+                    if msg.type != WSMsgType.TEXT:
+                        break
+                    data = msg.json()
+                    if first is None and data["type"] == "answer::body":
+                        first = time.perf_counter() - start
+                    if data["type"] == "answer::end":
+                        break
+                ttft.append(first)
+
+
+async def main(args):
+    fake_url = serve_in_thread(create_app(args.latency, args.token_delay, args.tokens), port=args.fake_port)
+    openai.api_base = fake_url
+    openai.api_key = "fake"
+    openai.api_type = "open_ai"
+
+    server = serve_chat_in_thread(create_chat_app(args.mode), args.port)
+
+    ttft = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(f"ws://127.0.0.1:{args.port}/ws", args.turns, ttft)
+        for _ in range(args.sessions)
+    ])
+    elapsed = time.perf_counter() - start
+    server.should_exit = True
+    await close_aiosession()
+
+    ttft_ms = np.array(ttft) * 1000
+    print(f"mode={args.mode} sessions={args.sessions} turns={args.turns}")
+    print(f"time-to-first-token p50={np.percentile(ttft_ms, 50):.1f}ms p99={np.percentile(ttft_ms, 99):.1f}ms")
+    print(f"turns/s={len(ttft) / elapsed:.1f} wall={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Websocket time-to-first-token benchmark")
+    parser.add_argument("--mode", default="async", choices=["async", "sync"])
+    parser.add_argument("--sessions", default=20, type=int)
+    parser.add_argument("--turns", default=3, type=int)
+    parser.add_argument("--latency", default=0.2, type=float)
+    parser.add_argument("--token_delay", default=0.02, type=float)
+    parser.add_argument("--tokens", default=50, type=int)
+    parser.add_argument("--port", default=8766, type=int)
+    parser.add_argument("--fake_port", default=8765, type=int)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
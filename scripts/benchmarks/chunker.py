@@ -0,0 +1,32 @@
+import time
+import argparse
+
+from services.chunks import get_text_chunks
+from tests.services.test_chunks import legacy_get_text_chunks, random_text
+
+
+def timed(func, text):
+    start = time.perf_counter()
+    chunks = func(text, None)
+    return chunks, time.perf_counter() - start
+
+
+def main(args):
+    for size in args.sizes:
+        text = random_text(seed=size, length=size * 1024 * 1024)
+
+        chunks, elapsed = timed(get_text_chunks, text)
+        print(f"{size}MB get_text_chunks: {elapsed:.2f}s chunks={len(chunks)}")
+
+        if size <= args.legacy_max_size:
+            legacy_chunks, legacy_elapsed = timed(legacy_get_text_chunks, text)
+            print(f"{size}MB legacy: {legacy_elapsed:.2f}s identical={legacy_chunks == chunks}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Text chunker benchmark")
+    parser.add_argument("--sizes", default=[1, 10], type=int, nargs="+", help="Text sizes in MB")
+    parser.add_argument("--legacy_max_size", default=10, type=int, help="Largest size to also run the old chunker on")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,62 @@
+import time
+import asyncio
+import argparse
+
+import openai
+
+from services.openai import acreate_embeddings, aget_embeddings, close_aiosession
+from services.embedding_scheduler import EmbeddingScheduler
+from scripts.benchmarks.fake_openai import create_app, serve_in_thread
+
+
+async def sequential(texts, batch_size):
+    """The previous get_document_chunks loop: one batch after another."""
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        embeddings.extend(await aget_embeddings(texts[i : i + batch_size]))
+    return embeddings
+
+
+async def main(args):
+    fake_app = create_app(latency=args.latency)
+    openai.api_base = serve_in_thread(fake_app, port=args.fake_port)
+    openai.api_key = "fake"
+    openai.api_type = "open_ai"
+
+    # ~200 token chunks, like get_text_chunks produces
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 40 for i in range(args.chunks)]
+
+    start = time.perf_counter()
+    expected = await sequential(texts, args.batch_size)
+    sequential_time = time.perf_counter() - start
+
+    scheduler = EmbeddingScheduler(
+        embed=acreate_embeddings,
+        concurrency=args.concurrency,
+        tokens_per_minute=args.tpm,
+        requests_per_minute=args.rpm,
+        batch_size=args.batch_size,
+    )
+    start = time.perf_counter()
+    embeddings = await scheduler.embed(texts)
+    scheduler_time = time.perf_counter() - start
+
+    assert embeddings == expected, "scheduler changed the chunk order"
+    print(f"chunks={args.chunks} batch_size={args.batch_size} concurrency={args.concurrency}")
+    print(f"sequential={sequential_time:.2f}s scheduler={scheduler_time:.2f}s speedup={sequential_time / scheduler_time:.1f}x")
+    print(f"fake server requests={fake_app['stats']['embeddings']}")
+    await close_aiosession()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch embedding throughput benchmark")
+    parser.add_argument("--chunks", default=2000, type=int)
+    parser.add_argument("--batch_size", default=16, type=int)
+    parser.add_argument("--concurrency", default=8, type=int)
+    parser.add_argument("--tpm", default=10_000_000, type=int)
+    parser.add_argument("--rpm", default=100_000, type=int)
+    parser.add_argument("--latency", default=0.3, type=float)
+    parser.add_argument("--fake_port", default=8765, type=int)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,136 @@
+import json
+import time
+import asyncio
+import argparse
+import hashlib
+import threading
+
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_DIMENSION = 1536
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic unit vector for a text, so repeated runs return identical results."""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def create_app(latency: float = 0.2, token_delay: float = 0.02, tokens: int = 50) -> web.Application:
+    """
+    Build an aiohttp app that mimics the subset of the OpenAI / Azure OpenAI API used by the server.
+
+    Args:
+        latency: Seconds to wait before the first byte of every response.
+        token_delay: Seconds between streamed chunks.
+        tokens: Number of content chunks in a completion.
+    """
+    stats = {"chat": 0, "embeddings": 0, "embedded_texts": 0}
+
+    async def chat_completions(request: web.Request):
+        body = await request.json()
+        stats["chat"] += 1
+        await asyncio.sleep(latency)
+
+        if body.get("functions"):
+            question = body["messages"][-1]["content"]
+            return web.json_response({
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "function_call": {
+                            "name": "ask_database",
+                            "arguments": json.dumps({"key_word": question}),
+                        },
+                    },
+                    "finish_reason": "function_call",
+                }],
+                "usage": {"prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60},
+            })
+
+        if not body.get("stream"):
+            return web.json_response({
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "token " * tokens},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 300, "completion_tokens": tokens, "total_tokens": 300 + tokens},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for _ in range(tokens):
+            chunk = {"choices": [{"index": 0, "delta": {"content": "token "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(token_delay)
+
+        chunk = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def embeddings(request: web.Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        stats["embeddings"] += 1
+        stats["embedded_texts"] += len(texts)
+        await asyncio.sleep(latency)
+
+        return web.json_response({
+            "data": [
+                {"index": i, "embedding": fake_embedding(text)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/chat/completions", chat_completions)
+    app.router.add_post("/engines/{engine}/chat/completions", chat_completions)
+    app.router.add_post("/openai/deployments/{deployment}/chat/completions", chat_completions)
+    app.router.add_post("/embeddings", embeddings)
+    app.router.add_post("/engines/{engine}/embeddings", embeddings)
+    app.router.add_post("/openai/deployments/{deployment}/embeddings", embeddings)
+    return app
+
+
+def serve_in_thread(app: web.Application, host: str = "127.0.0.1", port: int = 8765) -> str:
+    """Run the fake server on its own event loop in a daemon thread and return its base url."""
+    started = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, host, port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    # Give the socket a moment to start accepting
+    time.sleep(0.1)
+    return f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument("--latency", default=0.2, type=float)
+    parser.add_argument("--token_delay", default=0.02, type=float)
+    parser.add_argument("--tokens", default=50, type=int)
+    args = parser.parse_args()
+
+    web.run_app(
+        create_app(args.latency, args.token_delay, args.tokens),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,59 @@
+import json
+import uuid
+import asyncio
+import argparse
+
+from datastore.providers.qdrant_datastore import QdrantDataStore
+from models.models import Document, Query, RetrievalMode
+
+
+def load_faq(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def score(results, expected, top_k):
+    """hit@k and reciprocal rank of the expected document in one result list."""
+    ids = [chunk.metadata.document_id for chunk in results[:top_k]]
+    if expected not in ids:
+        return 0, 0.0
+    return 1, 1 / (ids.index(expected) + 1)
+
+
+async def main(args):
+    faq = load_faq(args.faq)
+    datastore = QdrantDataStore()
+    collection = str(uuid.uuid4())
+    datastore.create_collection(collection)
+
+    # Every answer is one document, the one its question should retrieve
+    documents = [Document(id=str(uuid.uuid4()), text=item["answer"]) for item in faq]
+    await datastore.upsert(documents, collection_name=collection)
+
+    print(f"questions={len(faq)} top_k={args.top_k}")
+    try:
+        for mode in RetrievalMode:
+            hits, reciprocal_ranks = 0, 0.0
+            for start in range(0, len(faq), 16):
+                batch = faq[start:start + 16]
+                results = await datastore.query(
+                    [Query(query=item["question"], top_k=args.top_k, retrieval=mode) for item in batch],
+                    collection,
+                )
+                for result, document in zip(results, documents[start:start + 16]):
+                    hit, rr = score(result.results, document.id, args.top_k)
+                    hits += hit
+                    reciprocal_ranks += rr
+            print(f"{mode.value:>7}: hit@{args.top_k}={hits / len(faq):.3f} MRR={reciprocal_ranks / len(faq):.3f}")
+    finally:
+        await datastore.delete(delete_all=True, collection_name=collection)
+        datastore.client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dense and hybrid retrieval quality on an FAQ set")
+    parser.add_argument("--faq", default="eval/registry/data/faq-ja.json")
+    parser.add_argument("--top_k", default=3, type=int)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
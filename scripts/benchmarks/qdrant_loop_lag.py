@@ -0,0 +1,86 @@
+import time
+import random
+import asyncio
+import argparse
+
+import numpy as np
+from qdrant_client.http import models as rest
+
+from datastore.providers.qdrant_datastore import QdrantClientPool
+
+COLLECTION = "benchmark_loop_lag"
+
+
+def random_vector(dimension):
+    return [random.random() for _ in range(dimension)]
+
+
+def seed(client, points, dimension):
+    client.recreate_collection(
+        COLLECTION,
+        vectors_config=rest.VectorParams(size=dimension, distance=rest.Distance.COSINE),
+    )
+    for start in range(0, points, 256):
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[
+                rest.PointStruct(id=i, vector=random_vector(dimension), payload={"text": f"chunk {i}"})
+                for i in range(start, min(start + 256, points))
+            ],
+            wait=True,
+        )
+
+
+async def measure(search, args):
+    """Run `--concurrency` search loops for `--duration` seconds while sampling event-loop lag."""
+    lags, searches = [], 0
+    deadline = time.perf_counter() + args.duration
+
+    async def ticker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+    async def searcher():
+        nonlocal searches
+        while time.perf_counter() < deadline:
+            request = rest.SearchRequest(vector=random_vector(args.dimension), limit=args.top_k, with_payload=True)
+            await search([request])
+            searches += 1
+
+    await asyncio.gather(ticker(), *[searcher() for _ in range(args.concurrency)])
+    return np.percentile(lags, 50), np.percentile(lags, 99), max(lags), searches / args.duration
+
+
+async def main(args):
+    pool = QdrantClientPool(size=args.channels, threads=args.threads)
+    seed(pool.client, args.points, args.dimension)
+
+    async def blocking(requests):
+        # The previous QdrantDataStore._query: the sync client called on the event loop
+        return pool.client.search_batch(collection_name=COLLECTION, requests=requests)
+
+    async def pooled(requests):
+        return await pool.call("search_batch", 5, collection_name=COLLECTION, requests=requests)
+
+    print(f"points={args.points} concurrency={args.concurrency} channels={args.channels} threads={args.threads}")
+    for name, search in [("blocking", blocking), ("pooled", pooled)]:
+        p50, p99, worst, qps = await measure(search, args)
+        print(f"{name:>8}: loop lag p50={p50:.1f}ms p99={p99:.1f}ms max={worst:.1f}ms searches/s={qps:.0f}")
+
+    pool.client.delete_collection(COLLECTION)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qdrant event-loop lag and throughput benchmark")
+    parser.add_argument("--points", default=20000, type=int)
+    parser.add_argument("--dimension", default=1536, type=int)
+    parser.add_argument("--top_k", default=5, type=int)
+    parser.add_argument("--concurrency", default=50, type=int)
+    parser.add_argument("--duration", default=10, type=float)
+    parser.add_argument("--channels", default=4, type=int)
+    parser.add_argument("--threads", default=16, type=int)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,88 @@
+import time
+import random
+import argparse
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from datastore.providers.qdrant_datastore import storage_config
+from models.models import CollectionStorage, StorageProfile
+
+COLLECTION = "benchmark_profiles"
+
+
+def random_vector(dimension):
+    return [random.random() for _ in range(dimension)]
+
+
+def seed(client, profile, points, dimension):
+    client.recreate_collection(
+        COLLECTION,
+        vectors_config=rest.VectorParams(size=dimension, distance=rest.Distance.COSINE),
+        **storage_config(CollectionStorage(profile=profile)),
+    )
+    random.seed(0)
+    for start in range(0, points, 256):
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[
+                rest.PointStruct(id=i, vector=random_vector(dimension))
+                for i in range(start, min(start + 256, points))
+            ],
+            wait=True,
+        )
+    # Let the optimizer build the index and quantize the segments before searching
+    while client.get_collection(COLLECTION).status != rest.CollectionStatus.GREEN:
+        time.sleep(1)
+
+
+def measure(client, queries, top_k, rescore):
+    """Recall@k against an exact search of the same collection, and search latency."""
+    recalls, latencies = [], []
+    for vector in queries:
+        exact = client.search(
+            COLLECTION, query_vector=vector, limit=top_k, search_params=rest.SearchParams(exact=True)
+        )
+        start = time.perf_counter()
+        found = client.search(
+            COLLECTION,
+            query_vector=vector,
+            limit=top_k,
+            search_params=rest.SearchParams(quantization=rest.QuantizationSearchParams(rescore=rescore)),
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({p.id for p in exact} & {p.id for p in found}) / top_k)
+    return np.mean(recalls), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main(args):
+    client = QdrantClient(url=args.url)
+    random.seed(1)
+    queries = [random_vector(args.dimension) for _ in range(args.queries)]
+
+    print(f"points={args.points} dimension={args.dimension} top_k={args.top_k}")
+    for profile in args.profiles:
+        try:
+            seed(client, profile, args.points, args.dimension)
+        except ValueError as e:
+            print(f"{profile:>12}: skipped, {e}")
+            continue
+        for rescore in (False, True):
+            recall, p50, p99 = measure(client, queries, args.top_k, rescore)
+            print(f"{profile:>12} rescore={rescore!s:<5}: recall@{args.top_k}={recall:.3f} p50={p50:.1f}ms p99={p99:.1f}ms")
+
+    client.delete_collection(COLLECTION)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qdrant storage profile recall and latency benchmark")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--points", default=50000, type=int)
+    parser.add_argument("--dimension", default=1536, type=int)
+    parser.add_argument("--top_k", default=5, type=int)
+    parser.add_argument("--queries", default=200, type=int)
+    parser.add_argument("--profiles", default=[p.value for p in StorageProfile], nargs="+")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,97 @@
+import uuid
+import argparse
+from typing import List
+
+from qdrant_client.http import models as rest
+
+from datastore.providers.qdrant_datastore import QdrantDataStore, QDRANT_SHARED_COLLECTION
+
+DEFAULT_BATCH_SIZE = 256
+
+
+def customer_collections(datastore: QdrantDataStore) -> List[str]:
+    # Customer collections are named after their id in Postgres
+    names = []
+    for collection in datastore.client.get_collections().collections:
+        try:
+            uuid.UUID(collection.name)
+        except ValueError:
+            continue
+        names.append(collection.name)
+    return names
+
+
+def migrate_collection(datastore: QdrantDataStore, collection_name: str, batch_size: int, delete: bool) -> int:
+    """
+    Copy every point of a customer collection into the shared collection, as the tenant
+    `collection_name`, and return how many were copied.
+
+    The copies keep their vectors and payloads and get the point ids the datastore uses for
+    the tenant, so running the migration again overwrites them instead of duplicating them.
+    """
+    client = datastore.client
+    offset, copied = None, 0
+    while True:
+        points, offset = client.scroll(
+            collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            client.upsert(
+                collection_name=QDRANT_SHARED_COLLECTION,
+                points=[
+                    rest.PointStruct(
+                        id=datastore._point_id(str(point.id), collection_name),
+                        vector=point.vector,
+                        payload={"id": str(point.id), **(point.payload or {}), "tenant_id": collection_name},
+                    )
+                    for point in points
+                ],
+                wait=True,
+            )
+            copied += len(points)
+        if offset is None:
+            break
+
+    migrated = client.count(
+        QDRANT_SHARED_COLLECTION,
+        count_filter=datastore._convert_metadata_filter_to_qdrant_filter(tenant_id=collection_name),
+        exact=True,
+    ).count
+    if migrated < copied:
+        raise RuntimeError(f"Only {migrated} of {copied} points of {collection_name} are in the shared collection")
+
+    if delete:
+        client.delete_collection(collection_name)
+    return copied
+
+
+def main(args):
+    datastore = QdrantDataStore(multitenant=True)
+    collections = args.collections or customer_collections(datastore)
+    print(f"Migrating {len(collections)} collections into {QDRANT_SHARED_COLLECTION}")
+
+    failed = []
+    for i, collection_name in enumerate(collections):
+        try:
+            copied = migrate_collection(datastore, collection_name, args.batch_size, args.delete)
+            print(f"[{i + 1}/{len(collections)}] {collection_name}: {copied} points")
+        except Exception as e:
+            print(f"[{i + 1}/{len(collections)}] {collection_name}: failed, {e}")
+            failed.append(collection_name)
+
+    if failed:
+        print(f"Failed collections, run again with --collections: {' '.join(failed)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move per-customer Qdrant collections into the shared collection")
+    parser.add_argument("--collections", nargs="+", help="Customer collection ids, all of them by default")
+    parser.add_argument("--batch_size", default=DEFAULT_BATCH_SIZE, type=int)
+    parser.add_argument("--delete", action="store_true", help="Delete every collection once its points are copied")
+    args = parser.parse_args()
+
+    main(args)
@@ -19,23 +19,32 @@ from models.api import (
 )
 
 from loguru import logger
+from websockets.exceptions import ConnectionClosed
 from services.chat import chat_switch
+from services import conversation
 
 from models.models import Query
 from models.i18n import i18n, i18nAdapter
-from models.chat import AuthMetadata, WebsocketMessage, WebsocketFlag
+from models.chat import AuthMetadata, QAHistory, WebsocketMessage, WebsocketFlag
 from services.recaptcha import v2_captcha_verify, v3_captcha_verify
 from services.chunks import token_count
 from services.line_bot import line_reply
+from services.collection_config import CollectionConfigCache
+from services.token_meter import TokenMeter
 
-from datastore.providers.redis_chat import RedisChat
-from server.api.deps import get_db
-from server.db import crud
-from sqlalchemy.orm import Session
+from datastore.providers.redis_chat import AsyncRedisChat, count_round_trips
+from datastore.providers.redis_conversation_memory import RedisConversationMemory
+from server.api.deps import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.metrics import Metrics
 
 router = APIRouter()
-cache = RedisChat()
+async_cache = AsyncRedisChat()
+collection_configs = CollectionConfigCache()
+meter = TokenMeter()
+memory = RedisConversationMemory()
 i18n_adapter = i18nAdapter("languages/local.json")
+metrics = Metrics()
 
 BEARER_TOKEN = os.environ.get("BEARER_TOKEN")
 assert BEARER_TOKEN is not None
@@ -47,8 +56,11 @@ async def chat_history(response: Response, user_id: str):
     except ValueError:
         raise HTTPException(status_code=500, detail="badly formed hexadecimal UUID string")
 
-    if cache.user_exists(user_bytes):
-        history = cache.get_qa_history(user_bytes)
+    if await memory.exists(user_bytes):
+        history = [
+            QAHistory(user_question=turn.user_question, answer=turn.answer)
+            for turn in await memory.turns(user_bytes)
+        ]
         exist_flag = True
 
     else:
@@ -87,14 +99,14 @@ async def chat(
 async def line_webhook(
     request: Request,
     collection: uuid.UUID, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     body = await request.json()
 
-    line_token, line_language = crud.get_line_config(db, collection)
+    line_language = (await collection_configs.get(db, collection)).line_language
     language = i18n(line_language)
     sorry = i18n_adapter.get_message(language, message="sorry")
-    stripe_id = crud.get_collection_stripe_id(db, cache.redis, collection)
+    stripe_id = await collection_configs.stripe_id(db, collection)
     try:
         for event in body["events"]:
             if event["type"] != "message":
@@ -103,9 +115,9 @@ async def line_webhook(
                 return
             else:
                 user_id = event["source"]["userId"]
-                history = cache.get_chat_history(user_id)
+                history = await conversation.history(user_id)
 
-                test_answer, token_usage = await line_reply(
+                test_answer, usage = await line_reply(
                     reply_token=event["replyToken"],
                     question=event["message"]["text"],
                     history=history,
@@ -113,18 +125,18 @@ async def line_webhook(
                     collection=str(collection),
                     language=language,
                     sorry=sorry,
-                    cache=cache
+                    stripe_id=stripe_id
                 )
 
-                token_usage += token_count(test_answer) + 300
+                usage.completion = token_count(test_answer)
 
-                crud.minus_token_remaining(db, cache.redis, stripe_id, token_usage)
+                await meter.charge(db, stripe_id, usage.total)
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Internal Service Error")
 
 @router.websocket("/ws/{collection}")
-async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_endpoint(collection: str, websocket: WebSocket, db: AsyncSession = Depends(get_async_db)):
     await websocket.accept()
     
     try:
@@ -145,14 +157,14 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
     language = i18n("en")
 
     try:
-        stripe_id = crud.get_collection_stripe_id(db, cache.redis, collection)
+        stripe_id = await collection_configs.stripe_id(db, collection)
     except AttributeError:
         await websocket.close(1002, "errors.PlansOrCollectionNotExists")
         return
 
     logger.debug(f"stripe_id: {stripe_id}")
 
-    fallback_msg = crud.get_fallback_msg(db, collection)
+    fallback_msg = (await collection_configs.get(db, collection)).fallback_msg
 
     while True:
         try:
@@ -167,6 +179,8 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
             await websocket.close(1004, "errors.Data")
             return
 
+        round_trips = count_round_trips()
+
         match message.type:
             case "switch_lang":
                 language = i18n(message.content.language)
@@ -183,16 +197,16 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
 
                 await websocket.send_json(WebsocketMessage(
                     type=WebsocketFlag.questions, 
-                    content=cache.get_faq_question(language, collection)
+                    content=await async_cache.get_faq_question(language, collection)
                 ).dict())
 
                 continue
 
             case "chat_v2":
-                recaptcha = v2_captcha_verify(user_uuid, message.content.v2_token)
+                recaptcha = await v2_captcha_verify(user_uuid, message.content.v2_token)
             
             case "chat_v3":
-                recaptcha = v3_captcha_verify(user_uuid, message.content.v3_token)
+                recaptcha = await v3_captcha_verify(user_uuid, message.content.v3_token)
 
 
         if recaptcha:
@@ -203,23 +217,20 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
             await websocket.send_json(WebsocketMessage(type=WebsocketFlag.answer_start).dict())
 
             if cache_flag:
-                cache_answer = cache.get_faq_answer(user_question, language, collection)
+                cache_answer = await async_cache.get_faq_answer(user_question, language, collection)
                 if cache_answer:
                     await websocket.send_json(WebsocketMessage(
                         type=WebsocketFlag.answer_body, 
                         content=cache_answer
                     ).dict())
 
-                    cache.set_chat_history(user_uuid, {
-                        "user_question": user_question,
-                        "answer": cache_answer
-                    })
+                    await conversation.remember(user_uuid, user_question, cache_answer, stripe_id)
 
                     await websocket.send_json(WebsocketMessage(type=WebsocketFlag.answer_end).dict())
 
                     continue
             
-            if cache.redis.exists(f"{stripe_id}::reach_limit"):
+            if await async_cache.redis.exists(f"{stripe_id}::reach_limit"):
                 await websocket.send_json(WebsocketMessage(
                     type=WebsocketFlag.answer_body, 
                     content=fallback_msg
@@ -229,9 +240,9 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
 
                 continue
 
-            chat_response, token_usage = await chat_switch(
+            chat_response, usage = await chat_switch(
                 question=user_question,  
-                history=cache.get_chat_history(user_uuid), 
+                history=await conversation.history(user_uuid), 
                 collection=collection, 
                 language=language,
                 sorry=sorry,
@@ -239,24 +250,31 @@ async def websocket_endpoint(collection: str, websocket: WebSocket, db: Session
             )
 
             content = ""
-            async for data in chat_response:
-                content += data
+            try:
+                async for data in chat_response:
+                    content += data
 
-                await websocket.send_json(WebsocketMessage(
-                    type=WebsocketFlag.answer_body, 
-                    content=data
-                ).dict())
+                    await websocket.send_json(WebsocketMessage(
+                        type=WebsocketFlag.answer_body, 
+                        content=data
+                    ).dict())
+            except (WebSocketDisconnect, ConnectionClosed):
+                # Tear down the upstream completion so we stop paying for tokens nobody reads
+                await chat_response.aclose()
+                logger.info(f"{user_id} disconnected while streaming")
+
+                usage.completion = token_count(content)
+                await meter.charge(db, stripe_id, usage.total)
+                return
             
-            cache.set_chat_history(user_uuid, {
-                "user_question": user_question,
-                "answer": content
-            })
+            await conversation.remember(user_uuid, user_question, content, stripe_id)
 
-            token_usage += token_count(content) + 300
-            logger.debug(f"token_usage: {token_usage}")
-            crud.minus_token_remaining(db, cache.redis, stripe_id, token_usage)
+            usage.completion = token_count(content)
+            logger.debug(f"token_usage: {usage}")
+            await meter.charge(db, stripe_id, usage.total)
 
             await websocket.send_json(WebsocketMessage(type=WebsocketFlag.answer_end).dict())
+            metrics.observe("chat.redis_round_trips", round_trips.count)
 
         else:
             await websocket.send_json(WebsocketMessage(type=WebsocketFlag.v2_req).dict())
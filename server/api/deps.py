@@ -1,7 +1,7 @@
 import os
 
-from typing import Generator
-from server.db.database import SessionLocal
+from typing import AsyncGenerator, Generator
+from server.db.database import AsyncSessionLocal, SessionLocal
 
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -26,6 +26,10 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def validate_user_info(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     if credentials.scheme != "Bearer":
         raise HTTPException(status_code=401, detail="Missing token")
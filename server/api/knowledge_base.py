@@ -1,5 +1,6 @@
 
-from uuid import UUID
+import os
+from uuid import UUID, uuid4
 
 from fastapi import (
     FastAPI, 
@@ -15,7 +16,7 @@ from fastapi import (
 from typing import Optional, Annotated
 from loguru import logger
 
-from models.models import DocumentMetadata, Source
+from models.models import CollectionStorage, DocumentMetadata, IngestJob, Source
 from models.api import (
     DeleteRequest,
     DeleteResponse,
@@ -27,40 +28,50 @@ from models.api import (
     CreateCollectionResponse,
     UpdateCollectionResponse,
     CollectionFileResponse,
-    UserCollectionResponse
+    UserCollectionResponse,
+    IngestJobResponse,
 )
-from services.file import get_document_from_file
-from datastore.providers.qdrant_datastore import QdrantDataStore
+from services.file import save_form_file
+from services.ingest_worker import INGEST_UPLOAD_DIR
+from services.collection_config import CollectionConfigCache
+from datastore.providers.qdrant_datastore import QdrantDataStore, QDRANT_STORAGE_PROFILE
 from datastore.providers.redis_chat import RedisChat
+from datastore.providers.redis_semantic_cache import RedisSemanticCache
+from datastore.providers.redis_ingest_queue import RedisIngestQueue
 
-from server.db import crud, models, schemas
-from .deps import get_db, validate_user_info, validate_token
+from server.db import async_crud, crud, models, schemas
+from .deps import get_async_db, get_db, validate_user_info, validate_token
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 datastore = QdrantDataStore()
 cache = RedisChat()
+semantic_cache = RedisSemanticCache()
+ingest_queue = RedisIngestQueue()
+collection_configs = CollectionConfigCache()
 
-def validate_user(
+async def validate_user(
     collection: UUID,
     user: str = Depends(validate_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    if not crud.check_collection_owner(db, user, collection):
+    if not await async_crud.check_collection_owner(db, user, collection):
         raise HTTPException(status_code=401, detail="Unauthorized")
     else:
         return user
 
 @router.post(
     "/upsert-file/{collection}",
-    response_model=UpsertResponse,
+    response_model=IngestJobResponse,
+    status_code=202,
 )
 async def upsert_file(
     collection: UUID,
     file: UploadFile = File(...),
     metadata: Optional[str] = Form(None),
     file_name: Optional[str] = Form(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: str = Depends(validate_user),
 ):
 
@@ -73,26 +84,55 @@ async def upsert_file(
     except:
         metadata_obj = DocumentMetadata(source=Source.file)
 
-    document, file_space = await get_document_from_file(file, metadata_obj)
+    temp_file_path, file_space = await save_form_file(file, INGEST_UPLOAD_DIR)
 
-    sum_file_size = crud.get_total_file_size(db, user)
+    try:
+        sum_file_size = await async_crud.get_total_file_size(db, user)
 
-    file_limit = crud.get_file_limit(db, user)
+        file_limit = await async_crud.get_file_limit(db, user)
 
-    if (sum_file_size + file_space) > file_limit:
-        raise HTTPException(status_code=429, detail="File size limit exceeded")
-    
-    document_id = crud.create_file(db, schemas.DocumentFileCreate(file_name=file_name, collection_id=collection, file_size=file_space))
-    metadata_obj.source_id = str(document_id)
-    
-    try:
-        ids = await datastore.upsert([document], collection_name=str(collection))
-        return UpsertResponse(ids=ids)
+        if (sum_file_size + file_space) > file_limit:
+            raise HTTPException(status_code=429, detail="File size limit exceeded")
+
+        document_id = await async_crud.create_file(db, schemas.DocumentFileCreate(file_name=file_name, collection_id=collection, file_size=file_space))
+        metadata_obj.source_id = str(document_id)
+
+        job = IngestJob(
+            id=str(uuid4()),
+            tenant=user,
+            collection=str(collection),
+            file_id=str(document_id),
+            file_name=file_name,
+            path=temp_file_path,
+            mimetype=file.content_type,
+            metadata=metadata_obj,
+        )
+        await ingest_queue.enqueue(job)
+        return IngestJobResponse(id=job.id, status=job.status)
+    except HTTPException:
+        os.remove(temp_file_path)
+        raise
     except Exception as e:
         logger.error(e)
+        os.remove(temp_file_path)
         raise HTTPException(status_code=500, detail=f"str({e})")
 
 
+@router.get(
+    "/upsert-file/jobs/{job_id}",
+    response_model=IngestJobResponse,
+)
+async def get_ingest_job(
+    job_id: str,
+    user: str = Depends(validate_token),
+):
+    job = await ingest_queue.get(job_id)
+    if job is None or job.tenant != user:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return IngestJobResponse(id=job.id, status=job.status, progress=job.progress, error=job.error)
+
+
 @router.post(
     "/query/{collection}",
     response_model=QueryResponse,
@@ -125,6 +165,7 @@ async def upsert(
 
     try:
         ids = await datastore.upsert(request.documents, collection_name=str(collection))
+        await semantic_cache.invalidate(str(collection))
         return UpsertResponse(ids=ids)
     except Exception as e:
         logger.error(e)
@@ -148,12 +189,14 @@ async def delete(
             delete_all=request.delete_all,
             collection_name=str(collection)
         )
+        await semantic_cache.invalidate(str(collection))
 
         if request.filter is not None and request.filter.source_id is not None:
             crud.delete_file(db, request.filter.source_id)
 
         if request.delete_all:
             crud.delete_collection(db, collection)
+            await collection_configs.ainvalidate(collection)
 
         return DeleteResponse(success=success)
     except Exception as e:
@@ -171,7 +214,11 @@ def creat_collection(
 ):
     try:
         collection_id = crud.create_collection(db, schemas.CollectionCreate(**request.dict(), owner=user))
-        datastore.create_collection(collection_id)
+        collection_configs.invalidate(collection_id)
+        storage = request.storage or CollectionStorage(
+            profile=crud.get_storage_profile(db, user) or QDRANT_STORAGE_PROFILE
+        )
+        datastore.create_collection(collection_id, storage)
         return CreateCollectionResponse(
             id=collection_id,
             owner=user,
@@ -244,6 +291,7 @@ def update_collection(
 ):
     try:
         collection = crud.update_collection(db, collection_id, schemas.CollectionCreate(**request.dict(), owner=user))
+        collection_configs.invalidate(collection_id)
 
         return UpdateCollectionResponse(
             id=collection.id,
@@ -12,17 +12,20 @@ from fastapi import (
 )
 from fastapi.responses import RedirectResponse
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from datastore.providers.redis_chat import RedisChat
+from services.collection_config import CollectionConfigCache
+from services.token_meter import TokenMeter
 from models.api import CreateStripeSubscriptionRequest, RedirectUrlResponse, SubscriptionInfoReturn, SubscriptionStorageReturn
-from server.db import crud, models, schemas
-from .deps import get_db, get_user_info, validate_token
+from server.db import async_crud, crud, models, schemas
+from .deps import get_async_db, get_db, get_user_info, validate_token
 
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 webhook_secret = os.environ.get('STRIPE_WEBHOOK_SECRET')
 router = APIRouter()
-cache = RedisChat()
+collection_configs = CollectionConfigCache()
+meter = TokenMeter()
 
 @router.post(
     "/plan/create",
@@ -119,11 +122,11 @@ async def get_subscription_info(
 )
 async def get_user_storage(
     user_id: str = Depends(validate_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
-        total_space = crud.get_file_limit(db, user_id)
-        sum_file_size = crud.get_total_file_size(db, user_id)
+        total_space = await async_crud.get_file_limit(db, user_id)
+        sum_file_size = await async_crud.get_total_file_size(db, user_id)
 
         return SubscriptionStorageReturn(
             total_space=total_space,
@@ -170,9 +173,10 @@ async def stripe_webhook(
             start_at = datetime.fromtimestamp(event_data["object"]["lines"]["data"][0]["period"]["start"])
             end_at = datetime.fromtimestamp(event_data["object"]["lines"]["data"][0]["period"]["end"])
 
-            cache.redis.delete(f"{stripe_id}::reach_limit")
-
+            # Usage so far belongs to the previous plan, the counter restarts from the new one
+            meter.flush_usage([stripe_id], db)
             crud.add_plan(db, stripe_id, price_id, subscription_id, start_at, end_at)
+            meter.reset(stripe_id)
         except Exception as e:
             event_id = event["id"]
             logger.error(f"{event_id} Error: {e}")
@@ -184,10 +188,17 @@ async def stripe_webhook(
         start_at = datetime.fromtimestamp(event_data["object"]["current_period_start"])
         end_at = datetime.fromtimestamp(event_data["object"]["current_period_end"])
 
-        cache.redis.delete(f"{stripe_id}::reach_limit")
-        
+        meter.flush_usage([stripe_id], db)
         crud.add_plan(db, stripe_id, price_id, subscription_id, start_at, end_at)
+        meter.reset(stripe_id)
         
     if event["type"] == "customer.subscription.deleted":
+        stripe_id = event_data["object"]["customer"]
         subscription_id = event_data["object"]["id"]
+        meter.flush_usage([stripe_id], db)
         crud.delete_plan(db, subscription_id)
+        meter.reset(stripe_id)
+
+    # Customers and plans decide which collections can chat, and who pays for it
+    if event["type"] in ("customer.created", "invoice.paid", "customer.subscription.updated", "customer.subscription.deleted"):
+        await collection_configs.ainvalidate()
@@ -0,0 +1,78 @@
+"""
+The queries of the request handlers' hot paths on an AsyncSession, so they do not block the
+event loop. They return what their namesakes in crud return.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import exists, func
+
+from uuid import UUID
+from typing import Optional
+from . import models, schemas
+import datetime
+from loguru import logger
+
+
+async def check_collection_owner(db: AsyncSession, owner: str, collection_id: UUID) -> bool:
+    logger.info(f"check_collection_owner: owner: {owner}, collection_id: {collection_id}")
+    collection_owner = await db.scalar(
+        select(models.Collection.owner).where(models.Collection.id == collection_id)
+    )
+    return collection_owner is not None and collection_owner == owner
+
+async def get_collection_config(db: AsyncSession, collection_id: UUID) -> Optional[schemas.CollectionConfig]:
+    row = (await db.execute(
+        select(
+            models.Collection.id,
+            models.Collection.fallback_msg,
+            models.Collection.line_channel_access_token,
+            models.Collection.line_language,
+            models.User.stripe_id,
+            exists().where(models.Plan.stripe_id == models.User.stripe_id).label("has_plan"),
+        ).outerjoin(
+            models.User, models.User.owner == models.Collection.owner
+        ).where(
+            models.Collection.id == collection_id
+        )
+    )).first()
+
+    return schemas.CollectionConfig(**row._asdict()) if row is not None else None
+
+async def create_file(db: AsyncSession, file: schemas.DocumentFileCreate) -> UUID:
+    collection = await db.get(models.Collection, file.collection_id)
+    collection.updated_at = datetime.datetime.utcnow()
+
+    db_file = models.DocumentFile(**file.dict())
+    db.add(db_file)
+    await db.commit()
+
+    return db_file.id
+
+async def delete_file(db: AsyncSession, file_id: UUID):
+    db_file = await db.get(models.DocumentFile, file_id)
+    await db.delete(db_file)
+    await db.commit()
+
+async def get_total_file_size(db: AsyncSession, user: str) -> int:
+    total_file_size = await db.scalar(
+        select(func.sum(models.DocumentFile.file_size)).join(models.Collection).where(models.Collection.owner == user)
+    )
+    return total_file_size or 0
+
+async def get_file_limit(db: AsyncSession, owner: str):
+    file_limit = await db.scalar(
+        select(func.sum(models.Plan.file_remaining))
+        .join(models.User, models.User.stripe_id == models.Plan.stripe_id)
+        .where(models.User.owner == owner)
+    )
+
+    return file_limit
+
+async def get_token_remaining(db: AsyncSession, stripe_id: str) -> Optional[int]:
+    """Tokens left on the plan chat tokens are charged to, the one with the most left."""
+    return await db.scalar(
+        select(models.Plan.token_remaining)
+        .where(models.Plan.stripe_id == stripe_id)
+        .order_by(models.Plan.token_remaining.desc())
+        .limit(1)
+    )
@@ -1,12 +1,10 @@
 import os
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
-
-from redis import Redis
-import codecs
+from sqlalchemy import bindparam, update
+from sqlalchemy.sql import exists, func
 
 from uuid import UUID
-from typing import List
+from typing import Dict, List, Optional
 from . import models, schemas
 from models.payments import SubscriptionPlatform, SubscriptionType
 import datetime
@@ -59,15 +57,23 @@ def get_collection_by_id(db: Session, collection_id: UUID):
     db_collection = db.get(models.Collection, collection_id)
     return db_collection
 
-def get_fallback_msg(db: Session, collection_id: UUID):
-    db_collection = db.get(models.Collection, collection_id)
-    return db_collection.fallback_msg
+def get_collection_config(db: Session, collection_id: UUID) -> Optional[schemas.CollectionConfig]:
+    """Everything the chat needs to know about a collection, in one query."""
+    row = db.query(
+        models.Collection.id,
+        models.Collection.fallback_msg,
+        models.Collection.line_channel_access_token,
+        models.Collection.line_language,
+        models.User.stripe_id,
+        exists().where(models.Plan.stripe_id == models.User.stripe_id).label("has_plan"),
+    ).outerjoin(
+        models.User, models.User.owner == models.Collection.owner
+    ).filter(
+        models.Collection.id == collection_id
+    ).first()
 
-def get_line_config(db: Session, collection_id: UUID) -> (str, str):
-    db_collection = db.get(models.Collection, collection_id)
+    return schemas.CollectionConfig(**row._asdict()) if row is not None else None
 
-    return (db_collection.line_channel_access_token, db_collection.line_language)
-    
 def get_collection_list(db: Session):
     collection_list = db.scalars(db.query(models.Collection.id)).all()
     return collection_list
@@ -177,48 +183,65 @@ def get_price_id(db: Session, plan: SubscriptionType, platform: SubscriptionPlat
     return plan_config.price_id
 
 def get_file_limit(db: Session, owner: str):
-    user = db.query(models.User).filter(models.User.owner == owner).first().stripe_id
-    file_limit = db.query(func.sum(models.Plan.file_remaining)).filter(models.Plan.stripe_id == user).scalar()
+    file_limit = db.query(func.sum(models.Plan.file_remaining)).join(
+        models.User, models.User.stripe_id == models.Plan.stripe_id
+    ).filter(models.User.owner == owner).scalar()
 
     return file_limit
 
-def get_collection_stripe_id(db: Session, client: Redis, collection_id: UUID):
-    if client.exists(f"{collection_id}::stripe"):
-        user = codecs.decode(client.get(f"{collection_id}::stripe"))
-    else:
-        owner = db.get(models.Collection, collection_id).owner
-        user = db.query(models.User).filter(models.User.owner == owner).first().stripe_id
-        plan = db.query(models.Plan).filter(models.Plan.stripe_id == user).first()
-        if user is not None and plan is not None:
-            client.set(f"{collection_id}::stripe", user)
-        else:
-            raise AttributeError
-            
-    return user
-
-def minus_token_remaining(db: Session, client: Redis, stripe_id: str, token_count: int):
-    user_plan = db.query(models.Plan).filter(models.Plan.stripe_id == stripe_id).order_by(models.Plan.token_remaining.desc()).first()
-
-    if user_plan.token_remaining > 0:
-        user_plan.token_remaining -= token_count
-        db.commit()
-    else:
-        logger.debug(f"Start Invoice Send")
-        invoice = stripe.Invoice.create(
-            customer=stripe_id,
-            collection_method="send_invoice",
-            auto_advance=True,
-            days_until_due=15
-        )
-        price_id = get_user_plan_price(db, stripe_id, "web")
-        stripe.InvoiceItem.create(
-            customer=stripe_id,
-            price=price_id,
-            invoice=invoice.id
-        )
-        stripe.Invoice.send_invoice(invoice.id)
+def get_storage_profile(db: Session, owner: str) -> Optional[str]:
+    """The vector storage profile of the owner's plan, None when the plan does not set one."""
+    user = db.query(models.User).filter(models.User.owner == owner).first()
+    if user is None:
+        return None
+
+    plan_config = db.query(models.PlanConfig).join(
+        models.Plan,
+        (models.Plan.plan == models.PlanConfig.plan) & (models.Plan.platform == models.PlanConfig.platform),
+    ).filter(
+        models.Plan.stripe_id == user.stripe_id,
+        models.PlanConfig.storage_profile.isnot(None),
+    ).first()
+
+    return plan_config.storage_profile if plan_config is not None else None
+
+def apply_token_usage(db: Session, usage: Dict[str, int]):
+    """Charge the tokens used by every customer to their plan, in one batched UPDATE."""
+    plans = db.query(models.Plan.id, models.Plan.stripe_id, models.Plan.token_remaining).filter(
+        models.Plan.stripe_id.in_(usage.keys())
+    ).all()
+
+    charged = {}
+    for plan in plans:
+        if plan.stripe_id not in charged or plan.token_remaining > charged[plan.stripe_id].token_remaining:
+            charged[plan.stripe_id] = plan
+    if not charged:
+        return
+
+    plan_table = models.Plan.__table__
+    db.execute(
+        update(plan_table)
+        .where(plan_table.c.id == bindparam("plan_id"))
+        .values(token_remaining=plan_table.c.token_remaining - bindparam("used")),
+        [{"plan_id": plan.id, "used": usage[stripe_id]} for stripe_id, plan in charged.items()],
+    )
+    db.commit()
 
-        client.set(f"{stripe_id}::reach_limit", 1)
+def create_usage_invoice(db: Session, stripe_id: str):
+    logger.debug(f"Start Invoice Send")
+    invoice = stripe.Invoice.create(
+        customer=stripe_id,
+        collection_method="send_invoice",
+        auto_advance=True,
+        days_until_due=15
+    )
+    price_id = get_user_plan_price(db, stripe_id, "web")
+    stripe.InvoiceItem.create(
+        customer=stripe_id,
+        price=price_id,
+        invoice=invoice.id
+    )
+    stripe.Invoice.send_invoice(invoice.id)
 
 
 def get_user_plan_price(db: Session, stripe_id: str, platform: str):
@@ -233,31 +256,35 @@ def get_user_plan_price(db: Session, stripe_id: str, platform: str):
 
 
 def get_subscription_info(db: Session, stripe_id: str):
-    user_plan = db.query(
-            models.Plan.platform, 
-            func.sum(models.Plan.token_remaining).label("token_remaining")
-        ).filter(
-            models.Plan.stripe_id == stripe_id
-        ).group_by(models.Plan.platform).all()
+    """The newest plan of every platform of a customer with the tokens left on all of them, in one query."""
+    plans = db.query(
+        models.Plan.platform,
+        models.Plan.plan,
+        models.Plan.start_at,
+        models.Plan.expire_at,
+        func.sum(models.Plan.token_remaining).over(partition_by=models.Plan.platform).label("token_remaining"),
+        func.row_number().over(partition_by=models.Plan.platform, order_by=models.Plan.id.desc()).label("newest"),
+    ).filter(
+        models.Plan.stripe_id == stripe_id
+    ).subquery()
+
+    user_plan = db.query(plans, models.PlanConfig.token_limit).outerjoin(
+        models.PlanConfig,
+        (models.PlanConfig.plan == plans.c.plan)
+        & (models.PlanConfig.platform == plans.c.platform)
+        & (models.PlanConfig.is_subscription == True),
+    ).filter(
+        plans.c.newest == 1
+    ).all()
 
     data = {}
     for row in user_plan:
-        platform = row.platform
-
-        newest_plan = db.query(models.Plan).filter(
-            models.Plan.stripe_id == stripe_id, models.Plan.platform == platform
-        ).order_by(models.Plan.id.desc()).first()
-
-        plan_config = db.query(models.PlanConfig).filter(
-            models.PlanConfig.plan == newest_plan.plan
-        ).first()
-
-        data[platform] = {
-            "plan": newest_plan.plan,
+        data[row.platform] = {
+            "plan": row.plan,
             "remaining_tokens": row.token_remaining,
-            "total_tokens": plan_config.token_limit,
-            "start_at": newest_plan.start_at,
-            "expire_at": newest_plan.expire_at
+            "total_tokens": row.token_limit,
+            "start_at": row.start_at,
+            "expire_at": row.expire_at
         }
 
     return data
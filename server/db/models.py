@@ -1,7 +1,7 @@
 import uuid
 import datetime
 
-from sqlalchemy import Column, String, Boolean, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Boolean, Integer, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import UUID
 
@@ -33,7 +33,7 @@ class DocumentFile(Base):
     file_name = Column(String, nullable=False)
     file_size = Column(Integer, default=0)
     
-    collection_id = Column(UUID, ForeignKey("collections.id"))
+    collection_id = Column(UUID, ForeignKey("collections.id"), index=True)
     created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
 
     collection = relationship("Collection", back_populates="documents")
@@ -66,6 +66,9 @@ class Plan(Base):
 
     user = relationship("User", backref="plans")
 
+    # The plans of a customer per platform, newest first
+    __table_args__ = (Index("ix_plans_stripe_id_platform_id", "stripe_id", "platform", "id"),)
+
 class PlanConfig(Base):
     __tablename__ = "plan_configs"
 
@@ -78,4 +81,8 @@ class PlanConfig(Base):
     is_subscription = Column(Boolean, default=True)
 
     file_limit = Column(Integer)
-    token_limit = Column(Integer)
\ No newline at end of file
+    token_limit = Column(Integer)
+
+    storage_profile = Column(String, nullable=True)
+
+    __table_args__ = (Index("ix_plan_configs_plan_platform_is_subscription", "plan", "platform", "is_subscription"),)
\ No newline at end of file
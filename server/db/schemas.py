@@ -36,6 +36,14 @@ class Collection(CollectionBase):
     class Config:
         orm_mode = True
 
+class CollectionConfig(BaseModel):
+    id: UUID
+    stripe_id: Optional[str] = None  # Customer of the collection's owner
+    has_plan: bool = False  # Whether the customer has a plan to charge the chat tokens to
+    fallback_msg: Optional[str] = None
+    line_channel_access_token: Optional[str] = None
+    line_language: Optional[str] = None
+
 class UserBase(BaseModel):
     owner: str
     email: str
@@ -64,4 +72,5 @@ class PlanConfig(BaseModel):
     plan: str
     
     file_limit: int
-    token_limit: int
\ No newline at end of file
+    token_limit: int
+    storage_profile: Optional[str] = None
\ No newline at end of file
@@ -1,3 +1,6 @@
+import os
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,10 +8,21 @@ from fastapi.staticfiles import StaticFiles
 from server.api import knowledge_base, payment, chat
 from models.i18n import i18nAdapter
 from services.recommand_question import generate_faq
+from services.openai import get_aiosession, close_aiosession
 
 from datastore.factory import get_datastore, get_redis
+from datastore.providers.redis_semantic_cache import RedisSemanticCache
+from services.embedding_cache import EmbeddingCache
+from services.cpu_pool import CPUPool
+from services.ingest_worker import IngestWorker
+from services.collection_config import CollectionConfigCache
+from services.token_meter import TokenMeter, TOKEN_METER_FLUSH_SECONDS
+from server.db.database import async_engine
 
 from utils.schedulers import AsyncIOSchedulerWrapper
+from utils.metrics import Metrics
+
+INGEST_INPROCESS_WORKER = os.environ.get("INGEST_INPROCESS_WORKER", "true").lower() == "true"  # Also run ingestion jobs in the API process
 
 app = FastAPI()
 app.mount("/.well-known", StaticFiles(directory=".well-known"), name="static")
@@ -25,6 +39,14 @@ app.include_router(knowledge_base.router)
 app.include_router(payment.router)
 app.include_router(chat.router)
 
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        **Metrics().snapshot(),
+        "semantic_cache": RedisSemanticCache().stats(),
+        "embedding_cache": EmbeddingCache().stats(),
+    }
+
 @app.on_event("startup")
 async def startup():
     global datastore
@@ -36,6 +58,8 @@ async def startup():
     global i18n_adapter
     i18n_adapter = i18nAdapter("languages/local.json")
 
+    get_aiosession()
+
     scheduler = AsyncIOSchedulerWrapper()
     scheduler.add_job(
         func=generate_faq,
@@ -47,7 +71,36 @@ async def startup():
         name="generate_faq",
         replace_existing=True,
     )
+    scheduler.add_job(
+        func=TokenMeter().flush_usage,
+        trigger="interval",
+        seconds=TOKEN_METER_FLUSH_SECONDS,
+        id="flush_token_usage",
+        name="flush_token_usage",
+        replace_existing=True,
+    )
     scheduler.start()
 
+    if INGEST_INPROCESS_WORKER:
+        global ingest_worker
+        ingest_worker = asyncio.create_task(IngestWorker().run_forever())
+
+    global collection_config_listener
+    collection_config_listener = asyncio.create_task(CollectionConfigCache().listen())
+
+    global invoice_sender
+    invoice_sender = asyncio.create_task(TokenMeter().send_invoices())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_aiosession()
+    if INGEST_INPROCESS_WORKER:
+        ingest_worker.cancel()
+    collection_config_listener.cancel()
+    invoice_sender.cancel()
+    TokenMeter().flush_usage()
+    await async_engine.dispose()
+    CPUPool().shutdown()
+
 def start():
     uvicorn.run("server.main:app", host="0.0.0.0", port=8000, reload=True)
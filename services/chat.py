@@ -1,29 +1,39 @@
-from services.openai import get_chat_completion, get_completion
+from services.openai import aget_chat_completion, acreate_chat_completion
+from services.embedding_cache import EmbeddingCache
+from services.stream import StreamBridge
+from services.context import build_context, context_budget, message_tokens
+from services.intent_router import get_intent_router, local_route, record_llm_route
 from models.models import DocumentChunkWithScore
 from models.openai_schemas import OpenAIChatResponse
-from models.chat import ChatHistory
+from models.chat import ConversationHistory, TokenUsage
 from models.nlp_schemas import Classify
-from models.models import Query
-from typing import List
+from models.models import Query, RetrievalMode
+from typing import Callable, Dict, List, Optional, Tuple
 
-import openai
 import json
 import re
 import random
+import time
 import os
 
 from datastore.providers.qdrant_datastore import QdrantDataStore
 from datastore.providers.azure_nlp import AzureClient
-from datastore.providers.redis_chat import RedisChat
+from datastore.providers.redis_chat import AsyncRedisChat
+from datastore.providers.redis_semantic_cache import RedisSemanticCache
 from models.i18n import i18nAdapter
 from loguru import logger
 
 datastore = QdrantDataStore()
 nlp_client = AzureClient()
-cache = RedisChat()
+cache = AsyncRedisChat()
+semantic_cache = RedisSemanticCache()
+intent_router = get_intent_router()
 i18n_adapter = i18nAdapter("languages/local.json")
 
 chat_engine = os.environ.get("OPENAI_COMPLETIONMODEL_DEPLOYMENTID")
+chat_retrieval = RetrievalMode(os.environ.get("CHAT_RETRIEVAL", "dense"))  # How answers retrieve their context
+chat_mmr_lambda = float(os.environ.get("CHAT_MMR_LAMBDA", 0.7))  # Relevance weight of the MMR diversification of the context
+chat_rerank = os.environ.get("CHAT_RERANK", "false").lower() == "true"  # Re-rank the context with a cross-encoder
 
 query_schema = [
     {
@@ -49,7 +59,21 @@ query_schema = [
 ]
 
 
-async def chat_switch(question: str,  history: List[ChatHistory], collection: str, language: str, sorry: str, stream: bool):
+async def route_question(question: str, history: ConversationHistory, question_embedding: Optional[List[float]] = None):
+    """
+    Pick the function for a question, trying the local intent router before the function-calling completion.
+
+    Returns:
+        A tuple of (function_name, function_args, token_usage). function_name is None when the LLM
+        did not call a function.
+    """
+    decision = await local_route(
+        intent_router, question, question_embedding, follow_up=bool(history.turns or history.summary)
+    )
+    if decision is not None:
+        logger.info(f"Local route: {decision.name} Confidence: {decision.confidence:.3f}")
+        return decision.name, decision.arguments, 0
+
     messages = [
         {
             "role": "system", 
@@ -57,16 +81,22 @@ async def chat_switch(question: str,  history: List[ChatHistory], collection: st
         }
     ]
 
-    if len(history) > 0:
+    if history.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {history.summary}"
+        })
+
+    for turn in history.turns:
         messages.extend(
             [
                 {
                     "role": "user",
-                    "content": history[-1]["user_question"]
+                    "content": turn.user_question
                 },
                 {
                     "role": "assistant",
-                    "content": history[-1]["answer"]
+                    "content": turn.answer
                 },
             ]
         )
@@ -76,12 +106,14 @@ async def chat_switch(question: str,  history: List[ChatHistory], collection: st
         "content": question
     })
 
-    response = openai.ChatCompletion.create(
+    start = time.perf_counter()
+    response = await acreate_chat_completion(
         messages=messages,
         functions=query_schema,
         temperature=0,
         engine=chat_engine,
     )
+    record_llm_route(time.perf_counter() - start)
 
     response_message = response["choices"][0]["message"]
     token_usage = response["usage"]["total_tokens"]
@@ -90,99 +122,86 @@ async def chat_switch(question: str,  history: List[ChatHistory], collection: st
         function_name = response_message["function_call"]["name"]
         function_args = json.loads(response_message["function_call"]["arguments"])
         logger.info(f"Function name: {function_name} Args: {function_args}")
-        match function_name:
-            case "ask_database":
-                func = ask_database(
-                    user_question=question,
-                    query=function_args.get("key_word"),
-                    collection=collection,
-                    language=language,
-                    sorry=sorry,
-                    stream=stream
-                )
-
-            case "get_balance":
-                func = get_balance(
-                    user_question=question
-                )
-    else:
-        logger.warning(f"{question} Fallback")
-        func = ask_database(
-            user_question=question,
-            query=question,
-            collection=collection,
-            language=language,
-            sorry=sorry,
-            stream=stream
-        )
+        return function_name, function_args, token_usage
+
+    logger.warning(f"{question} Fallback")
+    return None, {}, token_usage
+
+
+async def chat_switch(question: str,  history: ConversationHistory, collection: str, language: str, sorry: str, stream: bool):
+    """
+    Returns:
+        A tuple of (answer, usage). usage gets the prompt tokens of the answer once the answer
+        is consumed, its completion tokens are left to the caller.
+    """
+    question_embedding = (await EmbeddingCache().get_embeddings([question]))[0]
+    # A follow-up only makes sense with its conversation, so it is neither served from nor added to the cache
+    standalone = not history.turns and not history.summary
+    if standalone:
+        cached = await semantic_cache.lookup(question_embedding, collection, language)
+        if cached is not None:
+            logger.info(f"{question} Semantic cache hit: {cached.similarity:.3f}")
+            return cached_answer(cached.answer), TokenUsage()
+
+    function_name, function_args, token_usage = await route_question(question, history, question_embedding)
+    usage = TokenUsage(routing=token_usage)
+
+    match function_name:
+        case "get_balance":
+            func = get_balance(
+                user_question=question,
+                usage=usage
+            )
+
+        case _:
+            func = ask_database(
+                user_question=question,
+                query=function_args.get("key_word") or question,
+                collection=collection,
+                language=language,
+                sorry=sorry,
+                stream=stream,
+                question_embedding=question_embedding if standalone else None,
+                usage=usage
+            )
     
-    return func, token_usage
+    return func, usage
 
 
-async def chat_line(question: str,  history: List[ChatHistory], collection: str, language: str, sorry: str) -> str:
-    messages = [
-        {
-            "role": "system", 
-            "content": "Before replying to user questions, please query the database." 
-        }
-    ]
+async def chat_line(question: str,  history: ConversationHistory, collection: str, language: str, sorry: str) -> str:
+    function_name, function_args, token_usage = await route_question(question, history)
+    usage = TokenUsage(routing=token_usage)
 
-    if len(history) > 0:
-        messages.extend(
-            [
-                {
-                    "role": "user",
-                    "content": history[-1]["user_question"]
-                },
-                {
-                    "role": "assistant",
-                    "content": history[-1]["answer"]
-                },
-            ]
-        )
+    match function_name:
+        case "get_balance":
+            line_reply = "$1000"
 
-    messages.append({
-        "role": "user",
-        "content": question
-    })
+        case _:
+            line_reply, usage.prompt = await chat_reply(
+                user_question=question,
+                query=function_args.get("key_word") or question,
+                collection=collection,
+                language=language,
+                sorry=sorry
+            )
 
-    response = openai.ChatCompletion.create(
-        messages=messages,
-        functions=query_schema,
-        temperature=0,
-        engine=chat_engine,
-    )
+    return line_reply, usage
 
-    response_message = response["choices"][0]["message"]
-    token_usage = response["usage"]["total_tokens"]
 
-    if response_message.get("function_call"):
-        function_name = response_message["function_call"]["name"]
-        function_args = json.loads(response_message["function_call"]["arguments"])
-        logger.info(f"Function name: {function_name} Args: {function_args}")
-        match function_name:
-            case "ask_database":
-                line_reply = await chat_reply(
-                    user_question=question,
-                    query=function_args.get("key_word"),
-                    collection=collection,
-                    language=language,
-                    sorry=sorry
-                )
-
-            case "get_balance":
-                line_reply = "$1000"
-    else:
-        logger.warning(f"{question} Fallback")
-        line_reply = await chat_reply(
-            user_question=question,
-            query=question,
-            collection=collection,
-            language=language,
-            sorry=sorry
-        )
+def answer_prompt(
+    template: Callable[[str, str, str], List[Dict[str, str]]],
+    context: List[DocumentChunkWithScore],
+    user_question: str,
+    sorry: str,
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Messages of an answer whose context fits the context window of the chat model, with their
+    prompt tokens. Only the template and the question are tokenized, chunks bring their count.
+    """
+    prompt_tokens = message_tokens(template("", user_question, sorry))
+    packed = build_context(context, context_budget(chat_engine, prompt_tokens))
+    return template(packed.text, user_question, sorry), prompt_tokens + packed.tokens
 
-    return line_reply, token_usage
 
 def normal_answer(context: str, question: str, sorry: str) -> List[str]:
     # print(f"Context: {context}")
@@ -229,54 +248,69 @@ async def ask_database(
     collection: str, 
     language: str, 
     sorry: str, 
-    stream: bool
+    stream: bool,
+    question_embedding: Optional[List[float]] = None,
+    usage: Optional[TokenUsage] = None
 ) -> str:
     query_results = await datastore.query(
-        [Query(query=query, top_k=3)],
+        [Query(
+            query=query,
+            top_k=3,
+            retrieval=chat_retrieval,
+            rerank=chat_rerank,
+            mmr_lambda=chat_mmr_lambda,
+        )],
         collection
     )
 
-    cache.add_question_key_word(query, language, collection)
-    context_str = ""
-
-    for doc in query_results[0].results:
-        context_str += f"{doc.text}\n\"\"\"\n"
+    await cache.add_question_key_word(query, language, collection)
     
     sentiment = nlp_client.sentiment_analysis(user_question)
     logger.info(f"Quseion: {user_question} Sentiment: {sentiment}")
     # sentiment = classify_question(user_question).sentiment
-    if sentiment == "negative":
-        messages = negative_answer(context_str, user_question, sorry)
-    else:
-        messages = normal_answer(context_str, user_question, sorry)
+    template = negative_answer if sentiment == "negative" else normal_answer
+    messages, prompt_tokens = answer_prompt(template, query_results[0].results, user_question, sorry)
+    if usage is not None:
+        usage.prompt = prompt_tokens
 
     if stream:
-        stream_answer = openai.ChatCompletion.create(
+        stream_answer = await acreate_chat_completion(
             messages=messages, stream=True, temperature=0, engine=chat_engine,
         )
         # print(messages)
         final_result = ""
-        for chunk in stream_answer:
-            resp = OpenAIChatResponse(**chunk)
-            if not resp.choices:
-                continue
-            
-            if resp.choices[0].delta is not None:
-                content = resp.choices[0].delta.get("content", "")
-                final_result += content
-                # Sorry 申
-                if final_result.startswith(i18n_adapter.get_message(language, message="sorry")):
-                    print(f"{user_question} Can't Answer")
-                    cache.add_not_answer_key_world(query, language, collection)
-
-            elif chunk.choices[0].finish_reason == "stop":
-                continue
-
-            yield content
+        async with StreamBridge(stream_answer) as chunks:
+            async for chunk in chunks:
+                resp = OpenAIChatResponse(**chunk)
+                if not resp.choices:
+                    continue
+
+                if resp.choices[0].delta is not None:
+                    content = resp.choices[0].delta.get("content", "")
+                    final_result += content
+                    # Sorry 申
+                    if final_result.startswith(i18n_adapter.get_message(language, message="sorry")):
+                        print(f"{user_question} Can't Answer")
+                        await cache.add_not_answer_key_world(query, language, collection)
+
+                elif chunk.choices[0].finish_reason == "stop":
+                    continue
+
+                yield content
     else:
-        answer = get_chat_completion(messages=messages)
-
-        yield answer
+        final_result = await aget_chat_completion(messages=messages)
+
+        yield final_result
+
+    # Only complete, answerable responses are worth serving again
+    if question_embedding is not None and not final_result.startswith(i18n_adapter.get_message(language, message="sorry")):
+        await semantic_cache.add(
+            question_embedding,
+            final_result,
+            [doc.id for doc in query_results[0].results],
+            collection,
+            language
+        )
 
 async def chat_reply(
     user_question: str, 
@@ -286,34 +320,32 @@ async def chat_reply(
     sorry: str, 
 ) -> str:
     query_results = await datastore.query(
-        [Query(query=query, top_k=3)],
+        [Query(
+            query=query,
+            top_k=3,
+            retrieval=chat_retrieval,
+            rerank=chat_rerank,
+            mmr_lambda=chat_mmr_lambda,
+        )],
         collection
     )
 
-    cache.add_question_key_word(query, language, collection)
-    context_str = ""
-
-    for doc in query_results[0].results:
-        context_str += f"{doc.text}\n\"\"\"\n"
-    messages = normal_answer(context_str, user_question, sorry)
-    answer = get_chat_completion(messages=messages)
-
-    return answer
+    await cache.add_question_key_word(query, language, collection)
+    messages, prompt_tokens = answer_prompt(normal_answer, query_results[0].results, user_question, sorry)
+    answer = await aget_chat_completion(messages=messages)
 
+    return answer, prompt_tokens
 
-def chat_response(context: List[DocumentChunkWithScore], user_question: str, sorry: str) -> str:
-    context_str = ""
-    for doc in context:
-        context_str += f"{doc.text}\n\"\"\"\n"
 
-    messages = normal_answer(context_str, user_question, sorry)
+async def chat_response(context: List[DocumentChunkWithScore], user_question: str, sorry: str) -> str:
+    messages, _ = answer_prompt(normal_answer, context, user_question, sorry)
 
-    answer = get_chat_completion(messages)
+    answer = await aget_chat_completion(messages)
 
     return answer
 
 
-async def get_balance(user_question: str):
+async def get_balance(user_question: str, usage: Optional[TokenUsage] = None):
     balance = random.randint(1000, 10000)
     messages = [
         {
@@ -327,25 +359,29 @@ async def get_balance(user_question: str):
         }
     ]
     
-    stream_answer = openai.ChatCompletion.create(
+    stream_answer = await acreate_chat_completion(
         messages=messages,
         stream=True, 
         temperature=0,
         engine=chat_engine,
     )
 
-    for chunk in stream_answer:
-        resp = OpenAIChatResponse(**chunk)
-        
-        if not resp.choices:
-            continue
+    async with StreamBridge(stream_answer) as chunks:
+        async for chunk in chunks:
+            resp = OpenAIChatResponse(**chunk)
+
+            if not resp.choices:
+                continue
+
+            if resp.choices[0].delta is not None:
+                content = resp.choices[0].delta.get("content", "")
+            elif chunk.choices[0].finish_reason == "stop":
+                continue
 
-        if resp.choices[0].delta is not None:
-            content = resp.choices[0].delta.get("content", "")
-        elif chunk.choices[0].finish_reason == "stop":
-            continue
+            yield content
 
-        yield content
+async def cached_answer(answer: str):
+    yield answer
 
 async def fallback_func():
     for content in "Sorry, I don't know how to help with that":
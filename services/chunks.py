@@ -1,12 +1,13 @@
+import asyncio
 from typing import Dict, List, Optional, Tuple
 import uuid
-import os
 from models.models import Document, DocumentChunk, DocumentChunkMetadata
 # from loguru import logger
 
 import tiktoken
 
-from services.openai import get_embeddings
+from services.cpu_pool import CPUPool, CPUTask
+from services.embedding_scheduler import EmbeddingScheduler
 
 # Global variables
 tokenizer = tiktoken.get_encoding(
@@ -17,8 +18,8 @@ tokenizer = tiktoken.get_encoding(
 CHUNK_SIZE = 200  # The target size of each text chunk in tokens
 MIN_CHUNK_SIZE_CHARS = 350  # The minimum size of each text chunk in characters
 MIN_CHUNK_LENGTH_TO_EMBED = 5  # Discard chunks shorter than this
-EMBEDDINGS_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 256))  # The number of embeddings to request at a time
 MAX_NUM_CHUNKS = 10000  # The maximum number of chunks to generate from a text
+MIN_TEXT_LENGTH_FOR_POOL = 20000  # Shorter texts are chunked inline, the pool round trip costs more than it saves
 
 
 def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
@@ -32,6 +33,28 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
     Returns:
         A list of text chunks, each of which is a string of ~CHUNK_SIZE tokens.
     """
+    return [chunk_text for chunk_text, _, _, _ in get_text_chunk_spans(text, chunk_token_size)]
+
+
+def get_text_chunk_spans(text: str, chunk_token_size: Optional[int]) -> List[Tuple[str, int, int, int]]:
+    """
+    Split a text into chunks like get_text_chunks, with the character offsets and the token
+    count of each chunk.
+
+    The text is encoded once and walked with a token offset instead of re-slicing the token
+    list, so the work is linear in the document length. Each chunk's length is still taken
+    from re-encoding its (at most chunk_size tokens long) text, which keeps the chunk
+    boundaries exactly as they were. Offsets are counted on the bytes of the consumed tokens,
+    so a character split between two chunks does not shift the offsets of the next ones.
+
+    Args:
+        text: The text to split into chunks.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+
+    Returns:
+        A list of (chunk_text, start, end, tokens) tuples, where text[start:end] is the text of the
+        chunk before its newlines were replaced and tokens the length of chunk_text in tokens.
+    """
     # Return an empty list if the text is empty or whitespace
     if not text or text.isspace():
         return []
@@ -48,19 +71,24 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
     # Initialize a counter for the number of chunks
     num_chunks = 0
 
+    # Offset of the first token that has not been consumed yet
+    start = 0
+
+    # Offset of the first character that has not been consumed yet
+    char_start = 0
+
     # Loop until all tokens are consumed
-    while tokens and num_chunks < MAX_NUM_CHUNKS:
-        # Take the first chunk_size tokens as a chunk
-        chunk = tokens[:chunk_size]
+    while start < len(tokens) and num_chunks < MAX_NUM_CHUNKS:
+        # Take the next chunk_size tokens as a chunk
+        chunk = tokens[start : start + chunk_size]
 
         # Decode the chunk into text
         chunk_text = tokenizer.decode(chunk)
 
         # Skip the chunk if it is empty or whitespace
         if not chunk_text or chunk_text.isspace():
-            # Remove the tokens corresponding to the chunk text from the remaining tokens
-            tokens = tokens[len(chunk) :]
-            # Continue to the next iteration of the loop
+            start += len(chunk)
+            char_start += _char_count(tokenizer.decode_bytes(chunk))
             continue
 
         # Find the last period or punctuation mark in the chunk
@@ -79,27 +107,56 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
         # Remove any newline characters and strip any leading or trailing whitespace
         chunk_text_to_append = chunk_text.replace("\n", " ").strip()
 
+        # Tokens corresponding to the chunk text
+        consumed = len(tokenizer.encode(chunk_text, disallowed_special=()))
+
         if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
-            # Append the chunk text to the list of chunks
-            chunks.append(chunk_text_to_append)
+            # Append the chunk text, its offsets without the stripped whitespace and its tokens to the list of chunks
+            chunks.append(_span(chunk_text, chunk_text_to_append, char_start, consumed))
 
-        # Remove the tokens corresponding to the chunk text from the remaining tokens
-        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+        # Advance past the tokens and characters corresponding to the chunk text
+        char_start += _char_count(tokenizer.decode_bytes(tokens[start : start + consumed]))
+        start += consumed
 
         # Increment the number of chunks
         num_chunks += 1
 
     # Handle the remaining tokens
-    if tokens:
-        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
+    if start < len(tokens):
+        decoded_text = tokenizer.decode(tokens[start:])
+        remaining_text = decoded_text.replace("\n", " ").strip()
         if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
-            chunks.append(remaining_text)
+            chunks.append(_span(decoded_text, remaining_text, char_start, len(tokens) - start))
 
     return chunks
 
 
+def _char_count(utf8: bytes) -> int:
+    """Characters starting in a piece of UTF-8, which may begin or end in the middle of one."""
+    return sum(1 for byte in utf8 if byte & 0xC0 != 0x80)
+
+
+def _span(decoded_text: str, chunk_text: str, char_start: int, decoded_tokens: int) -> Tuple[str, int, int, int]:
+    start = char_start + len(decoded_text) - len(decoded_text.lstrip())
+    # Only re-encode chunks whose whitespace or newlines were changed
+    tokens = decoded_tokens if chunk_text == decoded_text else len(tokenizer.encode(chunk_text, disallowed_special=()))
+    return chunk_text, start, start + len(chunk_text), tokens
+
+
+async def get_text_chunk_spans_in_pool(
+    text: str, chunk_token_size: Optional[int], cpu_task: Optional[CPUTask] = None
+) -> List[Tuple[str, int, int, int]]:
+    """
+    get_text_chunk_spans, run in the CPU pool for texts long enough to block the event loop.
+    """
+    if len(text) < MIN_TEXT_LENGTH_FOR_POOL:
+        return get_text_chunk_spans(text, chunk_token_size)
+    cpu_task = cpu_task or CPUPool().task()
+    return await cpu_task.run(get_text_chunk_spans, text, chunk_token_size)
+
+
 def create_document_chunks(
-    doc: Document, chunk_token_size: Optional[int]
+    doc: Document, chunk_token_size: Optional[int], text_chunks: Optional[List[Tuple[str, int, int, int]]] = None
 ) -> Tuple[List[DocumentChunk], str]:
     """
     Create a list of document chunks from a document object and return the document id.
@@ -107,6 +164,7 @@ def create_document_chunks(
     Args:
         doc: The document object to create chunks from. It should have a text attribute and optionally an id and a metadata attribute.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        text_chunks: The document text already split by get_text_chunk_spans, or None to split it here.
 
     Returns:
         A tuple of (doc_chunks, doc_id), where doc_chunks is a list of document chunks, each of which is a DocumentChunk object with an id, a document_id, a text, and a metadata attribute,
@@ -120,7 +178,8 @@ def create_document_chunks(
     doc_id = doc.id or str(uuid.uuid4())
 
     # Split the document text into chunks
-    text_chunks = get_text_chunks(doc.text, chunk_token_size)
+    if text_chunks is None:
+        text_chunks = get_text_chunk_spans(doc.text, chunk_token_size)
 
     metadata = (
         DocumentChunkMetadata(**doc.metadata.__dict__)
@@ -133,8 +192,8 @@ def create_document_chunks(
     # Initialize an empty list of chunks for this document
     doc_chunks = []
 
-    # Assign each chunk a sequential number and create a DocumentChunk object
-    for i, text_chunk in enumerate(text_chunks):
+    # Assign each chunk a sequential number and create a DocumentChunk object, with the tokens counted by the chunker
+    for i, (text_chunk, start_char, end_char, chunk_tokens) in enumerate(text_chunks):
         # chunk_id = f"{doc_id}_{i}"
         if not doc.id:
             chunk_id = str(uuid.uuid4())
@@ -142,12 +201,18 @@ def create_document_chunks(
                 id=chunk_id,
                 text=text_chunk,
                 metadata=metadata,
+                token_count=chunk_tokens,
+                start_char=start_char,
+                end_char=end_char,
             )
         else:
             doc_chunk = DocumentChunk(
                 id=doc_id,
                 text=text_chunk,
                 metadata=metadata,
+                token_count=chunk_tokens,
+                start_char=start_char,
+                end_char=end_char,
             )
         # Append the chunk object to the list of chunks for this document
         # logger.debug(f"Add Chunks {i} - {doc_chunk.id}")
@@ -157,8 +222,8 @@ def create_document_chunks(
     return doc_chunks, doc_id
 
 
-def get_document_chunks(
-    documents: List[Document], chunk_token_size: Optional[int]
+async def get_document_chunks(
+    documents: List[Document], chunk_token_size: Optional[int], cpu_task: Optional[CPUTask] = None
 ) -> Dict[str, List[DocumentChunk]]:
     """
     Convert a list of documents into a dictionary from document id to list of document chunks.
@@ -166,6 +231,7 @@ def get_document_chunks(
     Args:
         documents: The list of documents to convert.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        cpu_task: The request's share of the CPU pool the documents are tokenized in.
 
     Returns:
         A dictionary mapping each document id to a list of document chunks, each of which is a DocumentChunk object
@@ -177,9 +243,15 @@ def get_document_chunks(
     # Initialize an empty list of all chunks
     all_chunks: List[DocumentChunk] = []
 
+    # Split the documents into text chunks in the CPU pool, several documents at once
+    cpu_task = cpu_task or CPUPool().task()
+    text_chunks = await asyncio.gather(
+        *[get_text_chunk_spans_in_pool(doc.text or "", chunk_token_size, cpu_task) for doc in documents]
+    )
+
     # Loop over each document and create chunks
-    for doc in documents:
-        doc_chunks, doc_id = create_document_chunks(doc, chunk_token_size)
+    for doc, doc_text_chunks in zip(documents, text_chunks):
+        doc_chunks, doc_id = create_document_chunks(doc, chunk_token_size, doc_text_chunks)
         # logger.debug(f"Doc_id: {doc_id}")
         # Append the chunks for this document to the list of all chunks
         all_chunks.extend(doc_chunks)
@@ -191,19 +263,10 @@ def get_document_chunks(
     if not all_chunks:
         return {}
 
-    # Get all the embeddings for the document chunks in batches, using get_embeddings
-    embeddings: List[List[float]] = []
-    for i in range(0, len(all_chunks), EMBEDDINGS_BATCH_SIZE):
-        # Get the text of the chunks in the current batch
-        batch_texts = [
-            chunk.text for chunk in all_chunks[i : i + EMBEDDINGS_BATCH_SIZE]
-        ]
-
-        # Get the embeddings for the batch texts
-        batch_embeddings = get_embeddings(batch_texts)
-
-        # Append the batch embeddings to the embeddings list
-        embeddings.extend(batch_embeddings)
+    # Get all the embeddings for the document chunks, several token-packed batches at a time
+    embeddings = await EmbeddingScheduler().embed(
+        [chunk.text for chunk in all_chunks], [chunk.token_count for chunk in all_chunks]
+    )
 
     # Update the document chunk objects with the embeddings
     for i, chunk in enumerate(all_chunks):
@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+from threading import Lock
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from loguru import logger
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from datastore.providers.redis_chat import AsyncRedisChat, RedisChat
+from server.db import async_crud, schemas
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+COLLECTION_CONFIG_TTL = int(os.environ.get("COLLECTION_CONFIG_TTL", 300))  # Seconds a worker keeps a collection's config
+COLLECTION_CONFIG_CHANNEL = "CollectionConfig::invalidate"
+INVALIDATE_ALL = "*"
+
+metrics = Metrics()
+
+
+@singleton_with_lock
+class CollectionConfigCache():
+    """
+    Read-through, per-worker cache of the collection settings the chat reads on every
+    connection and webhook: the owner's Stripe customer, the fallback message and the LINE
+    configuration.
+
+    A config is loaded with async_crud.get_collection_config and kept for COLLECTION_CONFIG_TTL
+    seconds. Changes are published on the COLLECTION_CONFIG_CHANNEL Redis channel, with the
+    collection id or INVALIDATE_ALL as message, and every worker listening drops its copy;
+    the TTL bounds staleness when a message is missed.
+    """
+
+    def __init__(self, ttl: int = COLLECTION_CONFIG_TTL):
+        self.ttl = ttl
+        self.configs: Dict[str, Tuple[float, schemas.CollectionConfig]] = {}
+        self.lock = Lock()
+        self.redis = RedisChat().redis
+        self.async_redis = AsyncRedisChat().redis
+
+    async def get(self, db: AsyncSession, collection_id: UUID) -> Optional[schemas.CollectionConfig]:
+        key = str(collection_id)
+        with self.lock:
+            cached = self.configs.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            metrics.incr("collection_config.hit")
+            return cached[1]
+
+        metrics.incr("collection_config.miss")
+        config = await async_crud.get_collection_config(db, collection_id)
+        # Missing collections are not cached, so a new one is found right away
+        if config is not None:
+            with self.lock:
+                self.configs[key] = (time.monotonic() + self.ttl, config)
+        return config
+
+    async def stripe_id(self, db: AsyncSession, collection_id: UUID) -> str:
+        """
+        The Stripe customer chat tokens of a collection are charged to.
+
+        Raises:
+            AttributeError: The collection does not exist or its owner has no plan.
+        """
+        config = await self.get(db, collection_id)
+        if config is None or config.stripe_id is None or not config.has_plan:
+            raise AttributeError(f"Collection {collection_id} has no plan")
+        return config.stripe_id
+
+    def drop(self, collection_id: str):
+        with self.lock:
+            if collection_id == INVALIDATE_ALL:
+                self.configs.clear()
+            else:
+                self.configs.pop(collection_id, None)
+
+    def invalidate(self, collection_id: Optional[UUID] = None):
+        """Drop the config of a collection, or of every collection, in every worker."""
+        message = str(collection_id) if collection_id is not None else INVALIDATE_ALL
+        self.drop(message)
+        try:
+            self.redis.publish(COLLECTION_CONFIG_CHANNEL, message)
+        except RedisError as e:
+            logger.warning(f"Collection config invalidation of {message} not published: {e}")
+
+    async def ainvalidate(self, collection_id: Optional[UUID] = None):
+        """Async version of `invalidate`, for the request handlers running on the event loop."""
+        message = str(collection_id) if collection_id is not None else INVALIDATE_ALL
+        self.drop(message)
+        try:
+            await self.async_redis.publish(COLLECTION_CONFIG_CHANNEL, message)
+        except RedisError as e:
+            logger.warning(f"Collection config invalidation of {message} not published: {e}")
+
+    async def listen(self):
+        """Drop the configs other workers invalidate, until cancelled."""
+        while True:
+            try:
+                pubsub = self.async_redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(COLLECTION_CONFIG_CHANNEL)
+                # Invalidations sent while unsubscribed are lost
+                self.drop(INVALIDATE_ALL)
+                async for message in pubsub.listen():
+                    self.drop(message["data"].decode())
+            except RedisError as e:
+                logger.warning(f"Collection config invalidations lost: {e}")
+                await asyncio.sleep(1)
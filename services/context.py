@@ -0,0 +1,82 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+from models.chat import ChatContext
+from models.models import DocumentChunkWithScore
+from services.chunks import token_count
+
+CHAT_ANSWER_TOKENS = int(os.environ.get("CHAT_ANSWER_TOKENS", 1024))  # Tokens of the context window kept for the answer
+CHAT_CONTEXT_WINDOW = int(os.environ.get("CHAT_CONTEXT_WINDOW", 4096))  # Context window of models missing from CONTEXT_WINDOWS
+
+# Context windows by model, Azure deployment names included
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-35-turbo": 4096,
+    "gpt-3.5-turbo": 4096,
+    "gpt-35-turbo-16k": 16384,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+}
+
+SEPARATOR = '\n"""\n'
+SEPARATOR_TOKENS = token_count(SEPARATOR)
+TOKENS_PER_MESSAGE = 3  # <|start|>{role}\n{content}<|end|>\n
+REPLY_PRIMING_TOKENS = 3  # Every reply is primed with <|start|>assistant<|message|>
+
+
+def chunk_tokens(chunk: DocumentChunkWithScore) -> int:
+    """Tokens of a chunk, counted at ingestion, or now for chunks stored before that."""
+    if chunk.token_count is not None:
+        return chunk.token_count
+    return token_count(chunk.text)
+
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt tokens of chat completion messages, counted the way the API bills them."""
+    tokens = REPLY_PRIMING_TOKENS
+    for message in messages:
+        tokens += TOKENS_PER_MESSAGE
+        for value in message.values():
+            tokens += token_count(value)
+    return tokens
+
+
+def context_budget(model: Optional[str], prompt_tokens: int) -> int:
+    """Tokens left for the context in a prompt of prompt_tokens without it."""
+    window = CONTEXT_WINDOWS.get(model, CHAT_CONTEXT_WINDOW)
+    return max(window - CHAT_ANSWER_TOKENS - prompt_tokens, 0)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def build_context(chunks: List[DocumentChunkWithScore], budget: int) -> ChatContext:
+    """
+    Pack chunks, best first, into a context of at most budget tokens.
+
+    A chunk that does not fit is skipped for the next ones, and a chunk whose text is already
+    part of a packed chunk is dropped. Token counts come from the chunks, so the context is not
+    tokenized again: each chunk ends with a separator line, which keeps its tokens apart from
+    the next chunk's.
+    """
+    packed: List[DocumentChunkWithScore] = []
+    texts: List[str] = []
+    used = 0
+    for chunk in chunks:
+        text = _normalize(chunk.text)
+        if not text or any(text in packed_text for packed_text in texts):
+            continue
+        tokens = chunk_tokens(chunk) + SEPARATOR_TOKENS
+        if used + tokens > budget:
+            continue
+        packed.append(chunk)
+        texts.append(text)
+        used += tokens
+
+    return ChatContext(
+        text="".join(f"{chunk.text}{SEPARATOR}" for chunk in packed),
+        chunks=packed,
+        tokens=used,
+    )
@@ -0,0 +1,102 @@
+import os
+import asyncio
+from typing import Optional, Set, Union
+
+from loguru import logger
+
+from datastore.providers.redis_conversation_memory import RedisConversationMemory
+from models.chat import ConversationHistory, ConversationTurn
+from server.db.database import AsyncSessionLocal
+from services.chunks import token_count
+from services.context import message_tokens
+from services.openai import aget_chat_completion
+from services.token_meter import TokenMeter
+from utils.metrics import Metrics
+
+CONVERSATION_HISTORY_TOKENS = int(os.environ.get("CONVERSATION_HISTORY_TOKENS", 800))  # Tokens of history a new turn gets at most
+CONVERSATION_SUMMARY = os.environ.get("CONVERSATION_SUMMARY", "true").lower() == "true"  # Summarize the turns leaving the window
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", 200))  # Length the running summary is asked to stay under
+
+metrics = Metrics()
+
+# The event loop only keeps weak references to tasks, the pending summaries are kept here
+_summaries: Set[asyncio.Task] = set()
+
+
+async def history(user_id: Union[str, bytes], max_tokens: int = CONVERSATION_HISTORY_TOKENS) -> ConversationHistory:
+    """
+    The history a new turn of a conversation is routed with: its running summary and as many of
+    its latest turns as fit in max_tokens with it. Turns carry their token count, so nothing is
+    tokenized.
+    """
+    turns, summary, used = await RedisConversationMemory().window(user_id)
+    if used > max_tokens:
+        summary, used = None, 0
+
+    kept = []
+    for turn in reversed(turns):
+        if used + turn.tokens > max_tokens:
+            break
+        kept.append(turn)
+        used += turn.tokens
+
+    return ConversationHistory(summary=summary, turns=kept[::-1], tokens=used)
+
+
+async def remember(user_id: Union[str, bytes], question: str, answer: str, stripe_id: Optional[str] = None):
+    """
+    Add a turn to a conversation. The turn that leaves the window with it is folded into the
+    running summary in the background, so the reply is not held up by the completion, and
+    its tokens are charged to stripe_id.
+    """
+    turn = ConversationTurn(user_question=question, answer=answer, tokens=token_count(question) + token_count(answer))
+    evicted = await RedisConversationMemory().append(user_id, turn)
+    if evicted is not None and CONVERSATION_SUMMARY:
+        task = asyncio.create_task(summarize(user_id, evicted, stripe_id))
+        _summaries.add(task)
+        task.add_done_callback(_summaries.discard)
+
+
+async def summarize(user_id: Union[str, bytes], turn: ConversationTurn, stripe_id: Optional[str] = None) -> int:
+    """
+    Fold a turn into the running summary of its conversation.
+
+    Returns:
+        The tokens of the summary completion, charged to stripe_id when it is given.
+    """
+    memory = RedisConversationMemory()
+    tokens = 0
+    try:
+        async with memory.summary_lock(user_id):
+            messages = summary_messages(await memory.summary(user_id), turn)
+            text = await aget_chat_completion(messages=messages)
+            tokens = message_tokens(messages) + token_count(text)
+            await memory.set_summary(user_id, text, token_count(text))
+        metrics.incr("conversation.summary")
+    except Exception as e:
+        # The turns in the window are still there, only older context is lost
+        logger.warning(f"Conversation summary of {user_id} failed: {e}")
+        metrics.incr("conversation.summary_error")
+
+    if tokens and stripe_id is not None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await TokenMeter().charge(db, stripe_id, tokens)
+        except Exception as e:
+            logger.error(f"Charging the conversation summary of {user_id} failed: {e}")
+    return tokens
+
+
+def summary_messages(summary: Optional[str], turn: ConversationTurn):
+    return [
+        {
+            "role": "system",
+            "content": f"""
+            Update the summary of a customer support conversation with its next turn. Keep the facts the customer gave, what they asked and what they were told, in at most {CONVERSATION_SUMMARY_TOKENS} tokens. Write the summary only.
+
+            Summary: {summary or "(empty)"}
+            Customer: {turn.user_question}
+            Assistant: {turn.answer}
+            """
+        }
+    ]
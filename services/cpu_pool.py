@@ -0,0 +1,113 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+CPU_POOL_SIZE = int(os.environ.get("CPU_POOL_SIZE", max(1, (os.cpu_count() or 2) - 1)))  # Worker processes, 0 runs tasks on a thread instead
+CPU_POOL_REQUEST_CONCURRENCY = int(os.environ.get("CPU_POOL_REQUEST_CONCURRENCY", 4))  # Tasks in flight per request
+CPU_POOL_REQUEST_BUDGET = float(os.environ.get("CPU_POOL_REQUEST_BUDGET", 120))  # CPU seconds one request may spend in the pool
+
+metrics = Metrics()
+
+
+class CPUBudgetExceeded(Exception):
+    pass
+
+
+def _timed(func: Callable, *args) -> Tuple[Any, float]:
+    """Runs in the worker: call func and report the CPU time it took."""
+    start = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - start
+
+
+@singleton_with_lock
+class CPUPool():
+    """
+    Process pool for CPU-bound upload work (text extraction, tokenization), so it never runs
+    on the event loop thread.
+
+    Workers are spawned rather than forked, since the server process already holds threads,
+    sockets and an event loop. Functions submitted here must be importable module-level
+    functions with picklable arguments.
+    """
+
+    def __init__(self, size: int = CPU_POOL_SIZE):
+        self.size = size
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.size > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.size, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def task(
+        self,
+        budget: float = CPU_POOL_REQUEST_BUDGET,
+        concurrency: int = CPU_POOL_REQUEST_CONCURRENCY,
+    ) -> "CPUTask":
+        """Start a per-request view of the pool with its own concurrency and CPU budget."""
+        return CPUTask(self, budget, concurrency)
+
+    async def submit(self, func: Callable, *args) -> Tuple[Any, float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), _timed, func, *args)
+
+
+class CPUTask:
+    """
+    The share of the pool one request may use: at most `concurrency` tasks in flight and
+    `budget` CPU seconds in total, after which CPUBudgetExceeded is raised.
+    """
+
+    def __init__(self, pool: CPUPool, budget: float, concurrency: int):
+        self.pool = pool
+        self.budget = budget
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.used = 0.0
+
+    async def run(self, func: Callable, *args) -> Any:
+        async with self.semaphore:
+            if self.used >= self.budget:
+                raise CPUBudgetExceeded(f"CPU budget of {self.budget}s exceeded")
+            result, cpu_seconds = await self.pool.submit(func, *args)
+        self.used += cpu_seconds
+        metrics.observe("cpu_pool.task_ms", cpu_seconds * 1000)
+        if self.used > self.budget:
+            raise CPUBudgetExceeded(f"CPU budget of {self.budget}s exceeded")
+        return result
+
+    async def map(self, func: Callable, args_list: Iterable[tuple]) -> AsyncIterator[Any]:
+        """
+        Run func over every argument tuple concurrently and yield the results in input order,
+        each one as soon as it and everything before it are done.
+        """
+        tasks: List[asyncio.Task] = [
+            asyncio.ensure_future(self.run(func, *args)) for args in args_list
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark failures of tasks after the first one as retrieved
+                    task.exception()
+            metrics.observe("cpu_pool.request_cpu_ms", self.used * 1000)
+            logger.debug(f"CPU pool request used {self.used:.2f}s of {self.budget}s")
@@ -0,0 +1,143 @@
+import os
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+from loguru import logger
+from redis.exceptions import RedisError
+
+from datastore.providers.redis_chat import AsyncRedisChat
+from services.openai import aget_embeddings
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))  # Vectors kept in the in-process tier
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 604800))  # Seconds a vector lives in the Redis tier
+EMBEDDING_CACHE_REDIS = os.environ.get("EMBEDDING_CACHE_REDIS", "true").lower() == "true"
+
+metrics = Metrics()
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+@singleton_with_lock
+class EmbeddingCache():
+    """
+    Two-tier cache in front of `aget_embeddings`.
+
+    The first tier is an in-process LRU, the second a Redis tier shared by every worker that
+    stores vectors as packed float32 bytes under `Embedding::{model}::{sha1(normalized text)}`.
+    Both tiers are keyed by the embedding model or deployment, so switching models never
+    serves stale vectors. The Redis tier goes through the asyncio client, as it is read on
+    every chat turn and query.
+    """
+
+    def __init__(self, maxsize: int = EMBEDDING_CACHE_SIZE, ttl: int = EMBEDDING_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.lock = Lock()
+        self.redis = AsyncRedisChat().redis if EMBEDDING_CACHE_REDIS else None
+
+    def _model(self) -> str:
+        return os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID") or "text-embedding-ada-002"
+
+    def _key(self, model: str, text: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"Embedding::{model}::{digest}"
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            vector = self.local.get(key)
+            if vector is not None:
+                self.local.move_to_end(key)
+            return vector
+
+    def _set_local(self, key: str, vector: np.ndarray):
+        with self.lock:
+            self.local[key] = vector
+            self.local.move_to_end(key)
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+                metrics.incr("embedding_cache.eviction")
+
+    async def _get_redis(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        if self.redis is None or not keys:
+            return [None] * len(keys)
+        try:
+            values = await self.redis.mget(keys)
+        except RedisError as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+            return [None] * len(keys)
+        return [np.frombuffer(value, dtype=np.float32) if value else None for value in values]
+
+    async def _set_redis(self, items: dict):
+        if self.redis is None or not items:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, vector in items.items():
+                pipe.set(key, vector.tobytes(), ex=self.ttl)
+            await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    async def get_embeddings(
+        self, texts: List[str], embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts, only calling the API for texts missing from both tiers.
+
+        Args:
+            texts: The list of texts to embed.
+            embed: Embeds the missing texts, `aget_embeddings` when not provided.
+
+        Returns:
+            A list of embeddings in the same order as texts.
+        """
+        model = self._model()
+        keys = [self._key(model, text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [self._get_local(key) for key in keys]
+        metrics.incr("embedding_cache.hit.local", sum(vector is not None for vector in vectors))
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        for i, vector in zip(missing, await self._get_redis([keys[i] for i in missing])):
+            if vector is not None:
+                vectors[i] = vector
+                self._set_local(keys[i], vector)
+                metrics.incr("embedding_cache.hit.redis")
+
+        # Embed each distinct missing text once
+        pending = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                pending.setdefault(keys[i], texts[i])
+
+        if pending:
+            metrics.incr("embedding_cache.miss", len(pending))
+            embeddings = await (embed or aget_embeddings)(list(pending.values()))
+            fresh = {
+                key: np.asarray(embedding, dtype=np.float32)
+                for key, embedding in zip(pending.keys(), embeddings)
+            }
+            for key, vector in fresh.items():
+                self._set_local(key, vector)
+            await self._set_redis(fresh)
+
+            vectors = [fresh[keys[i]] if vector is None else vector for i, vector in enumerate(vectors)]
+
+        return [vector.tolist() for vector in vectors]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.local),
+            "hits_local": metrics.get("embedding_cache.hit.local"),
+            "hits_redis": metrics.get("embedding_cache.hit.redis"),
+            "misses": metrics.get("embedding_cache.miss"),
+            "evictions": metrics.get("embedding_cache.eviction"),
+        }
@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, List, Optional
+
+import tiktoken
+from loguru import logger
+
+from services.embedding_cache import EmbeddingCache
+from services.openai import acreate_embeddings
+from utils.metrics import Metrics
+
+EMBEDDINGS_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 256))  # The maximum number of texts per request
+EMBEDDINGS_BATCH_TOKENS = int(os.environ.get("OPENAI_EMBEDDING_BATCH_TOKENS", 8191))  # The maximum number of tokens per request
+EMBEDDINGS_CONCURRENCY = int(os.environ.get("OPENAI_EMBEDDING_CONCURRENCY", 4))  # Requests in flight per upload
+EMBEDDINGS_TPM = int(os.environ.get("OPENAI_EMBEDDING_TPM", 240000))  # Tokens-per-minute budget of the deployment
+EMBEDDINGS_RPM = int(os.environ.get("OPENAI_EMBEDDING_RPM", 1440))  # Requests-per-minute budget of the deployment
+EMBEDDINGS_MAX_RETRIES = int(os.environ.get("OPENAI_EMBEDDING_MAX_RETRIES", 3))  # Attempts per batch
+
+tokenizer = tiktoken.get_encoding("cl100k_base")
+metrics = Metrics()
+
+
+class TokenBucket:
+    """
+    Async token bucket: `capacity` units, refilled continuously at `rate` units per second.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # A single request larger than the whole bucket still has to go through eventually
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+# Rate limits belong to the deployment, so every scheduler in the worker shares them
+token_bucket = TokenBucket(EMBEDDINGS_TPM, EMBEDDINGS_TPM / 60)
+request_bucket = TokenBucket(EMBEDDINGS_RPM, EMBEDDINGS_RPM / 60)
+
+
+class EmbeddingScheduler:
+    """
+    Embed many texts with several requests in flight, within the deployment's TPM/RPM budget.
+
+    Texts are packed into batches by token count, every batch is retried on its own, and
+    results come back in input order. The scheduler is the only retry layer: it embeds with
+    `acreate_embeddings`, which does not retry, so every attempt waits for the rate limits.
+    When a batch fails for good, the batches still pending are cancelled.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+        concurrency: int = EMBEDDINGS_CONCURRENCY,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        batch_tokens: int = EMBEDDINGS_BATCH_TOKENS,
+        batch_size: int = EMBEDDINGS_BATCH_SIZE,
+        max_retries: int = EMBEDDINGS_MAX_RETRIES,
+    ):
+        self.embed_batch = embed or partial(EmbeddingCache().get_embeddings, embed=acreate_embeddings)
+        self.concurrency = concurrency
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else token_bucket
+        )
+        self.request_bucket = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else request_bucket
+        )
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    def pack(self, token_counts: List[int]) -> List[List[int]]:
+        """Group consecutive text indices into batches under both the token and the size limit."""
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        batch_tokens = 0
+        for i, count in enumerate(token_counts):
+            if batch and (batch_tokens + count > self.batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += count
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def backoff(self, attempt: int) -> float:
+        return min(2 ** attempt, 20)
+
+    async def embed(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        """
+        Args:
+            texts: The texts to embed.
+            token_counts: Token count of every text, computed in a thread when not provided.
+
+        Returns:
+            A list of embeddings in the same order as texts.
+        """
+        if not texts:
+            return []
+        if token_counts is None:
+            encoded = await asyncio.to_thread(tokenizer.encode_batch, texts, disallowed_special=())
+            token_counts = [len(tokens) for tokens in encoded]
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch: List[int]):
+            tokens = sum(token_counts[i] for i in batch)
+            for attempt in range(1, self.max_retries + 1):
+                async with semaphore:
+                    await self.request_bucket.acquire()
+                    await self.token_bucket.acquire(tokens)
+                    try:
+                        vectors = await self.embed_batch([texts[i] for i in batch])
+                    except Exception as e:
+                        if attempt == self.max_retries:
+                            raise
+                        logger.warning(f"Embedding batch of {len(batch)} failed (attempt {attempt}): {e}")
+                        metrics.incr("embedding_scheduler.retry")
+                    else:
+                        for i, vector in zip(batch, vectors):
+                            embeddings[i] = vector
+                        metrics.observe("embedding_scheduler.batch_tokens", tokens)
+                        return
+                # Back off outside the semaphore so other batches keep going
+                await asyncio.sleep(self.backoff(attempt))
+
+        tasks = [asyncio.create_task(run(batch)) for batch in self.pack(token_counts)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # The upload failed, stop spending the rate limits on it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return embeddings
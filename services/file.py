@@ -1,6 +1,7 @@
 import os
+import tempfile
 from io import BufferedReader
-from typing import Optional
+from typing import AsyncIterator, Optional, Set
 from fastapi import UploadFile
 import mimetypes
 from PyPDF2 import PdfReader
@@ -10,21 +11,22 @@ import pptx
 from loguru import logger
 
 from models.models import Document, DocumentMetadata
+from services.cpu_pool import CPUPool, CPUTask
+
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 20))  # Pages one pool worker extracts at a time
 
 
 async def get_document_from_file(
-    file: UploadFile, metadata: DocumentMetadata
+    file: UploadFile, metadata: DocumentMetadata, cpu_task: Optional[CPUTask] = None
 ) -> (Document, int):
-    extracted_text, file_size = await extract_text_from_form_file(file)
+    extracted_text, file_size = await extract_text_from_form_file(file, cpu_task)
 
     doc = Document(text=extracted_text, metadata=metadata)
 
     return doc, file_size
 
 
-def extract_text_from_filepath(filepath: str, mimetype: Optional[str] = None) -> str:
-    """Return the text content of a file given its filepath."""
-
+def guess_mimetype(filepath: str, mimetype: Optional[str] = None) -> str:
     if mimetype is None:
         # Get the mimetype of the file based on its extension
         mimetype, _ = mimetypes.guess_type(filepath)
@@ -35,6 +37,14 @@ def extract_text_from_filepath(filepath: str, mimetype: Optional[str] = None) ->
         else:
             raise Exception("Unsupported file type")
 
+    return mimetype
+
+
+def extract_text_from_filepath(filepath: str, mimetype: Optional[str] = None) -> str:
+    """Return the text content of a file given its filepath."""
+
+    mimetype = guess_mimetype(filepath, mimetype)
+
     try:
         with open(filepath, "rb") as file:
             extracted_text = extract_text_from_file(file, mimetype)
@@ -87,8 +97,71 @@ def extract_text_from_file(file: BufferedReader, mimetype: str) -> str:
     return extracted_text
 
 
+def count_pdf_pages(filepath: str) -> int:
+    with open(filepath, "rb") as file:
+        return len(PdfReader(file).pages)
+
+
+def extract_text_from_pdf_pages(filepath: str, start: int, end: int) -> str:
+    """Return the text of pages [start, end) of a pdf, joined the same way as extract_text_from_file."""
+    with open(filepath, "rb") as file:
+        reader = PdfReader(file)
+        return " ".join([reader.pages[i].extract_text() for i in range(start, end)])
+
+
+async def stream_text_from_filepath(
+    filepath: str,
+    mimetype: Optional[str] = None,
+    cpu_task: Optional[CPUTask] = None,
+    skip: Optional[Set[int]] = None,
+) -> AsyncIterator[str]:
+    """
+    Extract the text of a file in the CPU pool and yield it in order, piece by piece.
+
+    PDFs are split into ranges of PDF_PAGES_PER_TASK pages that are extracted by several
+    workers at once; joining the pieces with " " gives the same text as extract_text_from_file.
+    Other file types are extracted by a single worker and yielded as one piece.
+    Pieces whose index is in skip are not extracted, an empty string is yielded in their place.
+    """
+    mimetype = guess_mimetype(filepath, mimetype)
+    cpu_task = cpu_task or CPUPool().task()
+    skip = skip or set()
+
+    if mimetype != "application/pdf":
+        yield "" if 0 in skip else await cpu_task.run(extract_text_from_filepath, filepath, mimetype)
+        return
+
+    num_pages = await cpu_task.run(count_pdf_pages, filepath)
+    page_ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, num_pages))
+        for start in range(0, num_pages, PDF_PAGES_PER_TASK)
+    ]
+    texts = cpu_task.map(
+        extract_text_from_pdf_pages,
+        [(filepath, start, end) for index, (start, end) in enumerate(page_ranges) if index not in skip],
+    )
+    try:
+        for index in range(len(page_ranges)):
+            yield "" if index in skip else await anext(texts)
+    finally:
+        await texts.aclose()
+
+
+async def save_form_file(file: UploadFile, directory: Optional[str] = None) -> (str, int):
+    """Write an uploaded file to a temporary location the pool workers can read from and return its path and size."""
+    file_stream = await file.read()
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile("wb", prefix="upload_", dir=directory, delete=False) as f:
+        f.write(file_stream)
+
+    return f.name, len(file_stream)
+
+
 # Extract text from a file based on its mimetype
-async def extract_text_from_form_file(file: UploadFile):
+async def extract_text_from_form_file(file: UploadFile, cpu_task: Optional[CPUTask] = None):
     """Return the text content of a file."""
     # get the file body from the upload file object
     mimetype = file.content_type
@@ -96,18 +169,12 @@ async def extract_text_from_form_file(file: UploadFile):
     logger.info(f"file.file: {file.file}")
     logger.info("file: ", file)
 
-    file_stream = await file.read()
-
-    file_size = len(file_stream)
-
-    temp_file_path = "/tmp/temp_file"
-
-    # write the file to a temporary location
-    with open(temp_file_path, "wb") as f:
-        f.write(file_stream)
+    temp_file_path, file_size = await save_form_file(file)
 
     try:
-        extracted_text = extract_text_from_filepath(temp_file_path, mimetype)
+        extracted_text = " ".join(
+            [text async for text in stream_text_from_filepath(temp_file_path, mimetype, cpu_task)]
+        )
     except Exception as e:
         logger.error(e)
         os.remove(temp_file_path)
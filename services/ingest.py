@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentMetadata, UpsertProgress
+from services.chunks import get_text_chunk_spans_in_pool
+from services.cpu_pool import CPUPool, CPUTask
+from services.embedding_scheduler import EmbeddingScheduler
+from utils.metrics import Metrics
+
+UPSERT_CHUNK_WORKERS = int(os.environ.get("UPSERT_CHUNK_WORKERS", 2))  # Text pieces chunked at once
+UPSERT_EMBED_WORKERS = int(os.environ.get("UPSERT_EMBED_WORKERS", 2))  # Embedding batches in flight
+UPSERT_EMBED_BATCH_SIZE = int(os.environ.get("UPSERT_EMBED_BATCH_SIZE", 64))  # Chunks handed to the embedding scheduler at a time
+UPSERT_WRITE_WORKERS = int(os.environ.get("UPSERT_WRITE_WORKERS", 1))  # Vector store writes in flight
+UPSERT_WRITE_BATCH_SIZE = int(os.environ.get("UPSERT_WRITE_BATCH_SIZE", 64))  # Points per vector store write
+UPSERT_QUEUE_SIZE = int(os.environ.get("UPSERT_QUEUE_SIZE", 256))  # Chunks buffered between two stages
+
+metrics = Metrics()
+
+# Tells the workers of a stage that nothing more is coming
+_DONE = object()
+
+
+class UpsertPipeline:
+    """
+    Upsert a document as it is extracted: text pieces flow through bounded chunk, embed and
+    write stages, each with its own number of workers, and points are written in fixed-size
+    batches as soon as their embeddings arrive.
+
+    At most UPSERT_QUEUE_SIZE chunks wait between two stages, so the number of embeddings held
+    in memory does not grow with the size of the document. Chunks never span two text pieces.
+
+    Chunk ids are derived from the document id and the chunk's position, so running the same
+    document again overwrites the same points. A text piece is committed once all of its chunks
+    are written; passing the progress of an interrupted run resumes it after those pieces.
+    Character offsets of chunks count from the start of the document, the length of every piece
+    is kept in the progress so that the offsets survive skipping committed pieces.
+    """
+
+    UUID_NAMESPACE = uuid.UUID("6f0d3c0e-5a0e-4c5b-9d7e-2f1b8c1e4a57")
+
+    def __init__(
+        self,
+        write: Callable[[Dict[str, List[DocumentChunk]]], Awaitable[List[str]]],
+        chunk_token_size: Optional[int] = None,
+        cpu_task: Optional[CPUTask] = None,
+        on_progress: Optional[Callable[[UpsertProgress], Awaitable[None]]] = None,
+        scheduler: Optional[EmbeddingScheduler] = None,
+        chunk_workers: int = UPSERT_CHUNK_WORKERS,
+        embed_workers: int = UPSERT_EMBED_WORKERS,
+        embed_batch_size: int = UPSERT_EMBED_BATCH_SIZE,
+        write_workers: int = UPSERT_WRITE_WORKERS,
+        write_batch_size: int = UPSERT_WRITE_BATCH_SIZE,
+        queue_size: int = UPSERT_QUEUE_SIZE,
+    ):
+        self.write = write
+        self.chunk_token_size = chunk_token_size
+        self.cpu_task = cpu_task or CPUPool().task()
+        self.on_progress = on_progress
+        self.scheduler = scheduler or EmbeddingScheduler()
+        self.chunk_workers = chunk_workers
+        self.embed_workers = embed_workers
+        self.embed_batch_size = embed_batch_size
+        self.write_workers = write_workers
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+
+    async def _report(self, progress: UpsertProgress):
+        if self.on_progress is not None:
+            await self.on_progress(progress)
+
+    async def run(
+        self,
+        texts: AsyncIterator[str],
+        metadata: Optional[DocumentMetadata] = None,
+        document_id: Optional[str] = None,
+        progress: Optional[UpsertProgress] = None,
+    ) -> UpsertProgress:
+        """
+        Args:
+            texts: The text of the document, piece by piece. Pieces already committed are skipped,
+                so the source may yield anything in their place.
+            metadata: Metadata copied onto every chunk.
+            document_id: The id of the document, generated if not provided.
+            progress: The progress of an interrupted run of the same document to resume.
+
+        Returns:
+            The final progress of the upsert.
+        """
+        progress = progress or UpsertProgress(document_id=document_id or str(uuid.uuid4()))
+        committed = set(progress.committed)
+        # Chunks of every piece still waiting to be written, and the piece of every chunk
+        pending: Dict[int, int] = {}
+        pieces: Dict[str, int] = {}
+        chunk_metadata = DocumentChunkMetadata(
+            **(metadata.__dict__ if metadata is not None else {}),
+            document_id=progress.document_id,
+        )
+
+        text_queue: asyncio.Queue = asyncio.Queue(self.chunk_workers)
+        embed_queue: asyncio.Queue = asyncio.Queue(max(1, self.queue_size // self.embed_batch_size))
+        write_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+
+        async def consume(queue: asyncio.Queue, handle: Callable[..., Awaitable[None]]):
+            while (item := await queue.get()) is not _DONE:
+                await handle(item)
+
+        async def stage(queue, workers, handle, next_queue, next_workers):
+            await asyncio.gather(*[consume(queue, handle) for _ in range(workers)])
+            for _ in range(next_workers):
+                await next_queue.put(_DONE)
+
+        async def extract():
+            index, offset = 0, 0
+            async for text in texts:
+                if index not in committed:
+                    progress.piece_chars[index] = len(text)
+                    await text_queue.put((index, offset, text))
+                offset += progress.piece_chars.get(index, 0)
+                index += 1
+            for _ in range(self.chunk_workers):
+                await text_queue.put(_DONE)
+
+        async def chunk(item):
+            index, offset, text = item
+            text_chunks = await get_text_chunk_spans_in_pool(text, self.chunk_token_size, self.cpu_task)
+            progress.chunks += len(text_chunks)
+            pending[index] = len(text_chunks)
+            if not text_chunks:
+                progress.committed.append(index)
+            await self._report(progress)
+
+            doc_chunks = []
+            for i, (text_chunk, start, end, chunk_tokens) in enumerate(text_chunks):
+                chunk_id = str(uuid.uuid5(self.UUID_NAMESPACE, f"{progress.document_id}:{index}:{i}"))
+                pieces[chunk_id] = index
+                doc_chunks.append(
+                    DocumentChunk(
+                        id=chunk_id,
+                        text=text_chunk,
+                        metadata=chunk_metadata,
+                        token_count=chunk_tokens,
+                        start_char=offset + start,
+                        end_char=offset + end,
+                    )
+                )
+            for i in range(0, len(doc_chunks), self.embed_batch_size):
+                await embed_queue.put(doc_chunks[i : i + self.embed_batch_size])
+
+        async def embed(batch: List[DocumentChunk]):
+            embeddings = await self.scheduler.embed(
+                [chunk.text for chunk in batch], [chunk.token_count for chunk in batch]
+            )
+            progress.embedded += len(batch)
+            for chunk, embedding in zip(batch, embeddings):
+                chunk.embedding = embedding
+                await write_queue.put(chunk)
+
+        async def flush(batch: List[DocumentChunk]):
+            start = time.perf_counter()
+            await self.write({progress.document_id: batch})
+            metrics.observe("upsert_pipeline.write_ms", (time.perf_counter() - start) * 1000)
+            progress.written += len(batch)
+            for chunk in batch:
+                index = pieces.pop(chunk.id)
+                pending[index] -= 1
+                if pending[index] == 0:
+                    progress.committed.append(index)
+            await self._report(progress)
+
+        async def write():
+            batch: List[DocumentChunk] = []
+            while (chunk := await write_queue.get()) is not _DONE:
+                batch.append(chunk)
+                if len(batch) >= self.write_batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+
+        tasks = [
+            asyncio.ensure_future(extract()),
+            asyncio.ensure_future(stage(text_queue, self.chunk_workers, chunk, embed_queue, self.embed_workers)),
+            asyncio.ensure_future(stage(embed_queue, self.embed_workers, embed, write_queue, self.write_workers)),
+            *[asyncio.ensure_future(write()) for _ in range(self.write_workers)],
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # A failed stage would leave the others blocked on a full or empty queue
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        progress.done = True
+        await self._report(progress)
+        metrics.incr("upsert_pipeline.chunks", progress.written)
+        logger.info(f"Upserted {progress.written} chunks of document {progress.document_id}")
+        return progress
@@ -0,0 +1,157 @@
+import os
+import socket
+import uuid
+import asyncio
+from typing import Optional, Set
+
+from loguru import logger
+
+from datastore.datastore import DataStore
+from datastore.providers.redis_ingest_queue import RedisIngestQueue
+from datastore.providers.redis_semantic_cache import RedisSemanticCache
+from models.models import DocumentMetadataFilter, IngestJob, IngestJobStatus, UpsertProgress
+from services.cpu_pool import CPUBudgetExceeded, CPUPool
+from services.file import stream_text_from_filepath
+from server.db import async_crud
+from server.db.database import AsyncSessionLocal
+from utils.metrics import Metrics
+
+INGEST_WORKER_CONCURRENCY = int(os.environ.get("INGEST_WORKER_CONCURRENCY", 2))  # Jobs one worker process runs at once
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 3))  # Attempts per job before it is marked failed
+INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL", 1))  # Seconds between polls of an empty queue
+INGEST_UPLOAD_DIR = os.environ.get("INGEST_UPLOAD_DIR", "/tmp/ingest")  # Uploaded files waiting for a worker, shared by all workers
+
+metrics = Metrics()
+
+
+class IngestWorker:
+    """
+    Run ingestion jobs from the RedisIngestQueue through DataStore.upsert_stream.
+
+    Every job reuses its id as the document id, so the points of a retried or resumed job
+    overwrite the ones written before. The job's progress is saved after every write batch
+    and a retry skips the text pieces that were already committed.
+    """
+
+    def __init__(
+        self,
+        datastore: Optional[DataStore] = None,
+        queue: Optional[RedisIngestQueue] = None,
+        concurrency: int = INGEST_WORKER_CONCURRENCY,
+        max_attempts: int = INGEST_MAX_ATTEMPTS,
+    ):
+        if datastore is None:
+            from datastore.providers.qdrant_datastore import QdrantDataStore
+
+            datastore = QdrantDataStore()
+        self.datastore = datastore
+        self.queue = queue or RedisIngestQueue()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.running: Set[asyncio.Task] = set()
+
+    def backoff(self, attempt: int) -> float:
+        return min(2 ** attempt, 30)
+
+    async def run_forever(self):
+        logger.info(f"Ingestion worker {self.id} started")
+        while True:
+            try:
+                if len(self.running) >= self.concurrency:
+                    await asyncio.wait(self.running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                await self.queue.reap()
+                job = await self.queue.claim(self.id)
+            except Exception as e:
+                logger.error(f"Ingestion queue unavailable: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(INGEST_POLL_INTERVAL)
+                continue
+
+            task = asyncio.create_task(self.process(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def heartbeat(self, job: IngestJob):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await self.queue.renew(job, self.id)
+
+    async def process(self, job: IngestJob):
+        job.status = IngestJobStatus.running
+        job.attempts += 1
+        await self.queue.save(job)
+        heartbeat = asyncio.create_task(self.heartbeat(job))
+
+        async def on_progress(progress: UpsertProgress):
+            job.progress = progress
+            await self.queue.save(job)
+
+        try:
+            cpu_task = CPUPool().task()
+            skip = set(job.progress.committed) if job.progress is not None else None
+            job.progress = await self.datastore.upsert_stream(
+                stream_text_from_filepath(job.path, job.mimetype, cpu_task, skip),
+                metadata=job.metadata,
+                document_id=job.id,
+                collection_name=job.collection,
+                cpu_task=cpu_task,
+                on_progress=on_progress,
+                progress=job.progress,
+            )
+        except CPUBudgetExceeded:
+            await self.fail(job, "File too large to process")
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed (attempt {job.attempts}): {e}")
+            if job.attempts >= self.max_attempts:
+                await self.fail(job, str(e))
+            else:
+                metrics.incr("ingest.retry")
+                await asyncio.sleep(self.backoff(job.attempts))
+                job.status = IngestJobStatus.queued
+                job.error = str(e)
+                await self.queue.requeue(job)
+        else:
+            await RedisSemanticCache().invalidate(job.collection)
+            job.status = IngestJobStatus.done
+            job.error = None
+            await self.queue.finish(job)
+            self.remove_file(job)
+            metrics.incr("ingest.done")
+        finally:
+            heartbeat.cancel()
+
+    async def fail(self, job: IngestJob, error: str):
+        """Give up on a job: drop the chunks it wrote and its file record."""
+        job.status = IngestJobStatus.failed
+        job.error = error
+        try:
+            await self.datastore.delete(
+                filter=DocumentMetadataFilter(document_id=job.id),
+                collection_name=job.collection,
+            )
+            async with AsyncSessionLocal() as db:
+                await async_crud.delete_file(db, uuid.UUID(job.file_id))
+        except Exception as e:
+            logger.error(f"Cleanup of ingestion job {job.id} failed: {e}")
+        await self.queue.finish(job)
+        self.remove_file(job)
+        metrics.incr("ingest.failed")
+
+    def remove_file(self, job: IngestJob):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+
+
+def start():
+    asyncio.run(IngestWorker().run_forever())
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,174 @@
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from pydantic import BaseModel
+
+from services.embedding_cache import EmbeddingCache
+from utils.metrics import Metrics
+
+INTENT_ROUTER = os.environ.get("INTENT_ROUTER", "rule")  # "rule", "embedding" or "none"
+INTENT_ROUTER_DEFAULT = os.environ.get("INTENT_ROUTER_DEFAULT")  # Route for questions no rule matches, None falls back to the LLM
+INTENT_ROUTER_THRESHOLD = float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.85))  # Minimum exemplar similarity
+INTENT_ROUTER_MARGIN = float(os.environ.get("INTENT_ROUTER_MARGIN", 0.05))  # Minimum lead over the runner-up function
+
+metrics = Metrics()
+
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    ("get_balance", r"\b(my|account) balance\b|\bhow much money (do )?i have\b"),
+    ("get_balance", r"残高|残金"),
+]
+
+DEFAULT_EXEMPLARS: Dict[str, List[str]] = {
+    "get_balance": [
+        "What is my balance?",
+        "How much money do I have in my account?",
+        "Check my balance",
+        "残高を教えてください",
+        "口座の残高はいくらですか？",
+    ],
+    "ask_database": [
+        "What is this product?",
+        "How do I set this up?",
+        "What are the system requirements?",
+        "これは何ですか？",
+        "設定方法を教えてください",
+    ],
+}
+
+
+class RouteDecision(BaseModel):
+    name: str
+    arguments: dict
+    confidence: float
+
+
+class IntentRouter(ABC):
+    """Picks the function for a question locally, or returns None to defer to the LLM router."""
+
+    @abstractmethod
+    async def route(self, question: str, question_embedding: Optional[List[float]] = None) -> Optional[RouteDecision]:
+        raise NotImplementedError
+
+
+def _decision(name: str, question: str, confidence: float) -> RouteDecision:
+    arguments = {"key_word": question} if name == "ask_database" else {}
+    return RouteDecision(name=name, arguments=arguments, confidence=confidence)
+
+
+class RuleIntentRouter(IntentRouter):
+    def __init__(self, rules: List[Tuple[str, str]] = DEFAULT_RULES, default: Optional[str] = INTENT_ROUTER_DEFAULT):
+        self.rules = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in rules]
+        self.default = default
+
+    async def route(self, question: str, question_embedding: Optional[List[float]] = None) -> Optional[RouteDecision]:
+        for name, pattern in self.rules:
+            if pattern.search(question):
+                return _decision(name, question, 1.0)
+
+        if self.default:
+            return _decision(self.default, question, 0.5)
+
+        return None
+
+
+class EmbeddingIntentRouter(IntentRouter):
+    def __init__(
+        self,
+        exemplars: Dict[str, List[str]] = DEFAULT_EXEMPLARS,
+        threshold: float = INTENT_ROUTER_THRESHOLD,
+        margin: float = INTENT_ROUTER_MARGIN,
+    ):
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self.matrices: Optional[Dict[str, np.ndarray]] = None
+
+    async def _load(self):
+        self.matrices = {}
+        for name, texts in self.exemplars.items():
+            matrix = np.asarray(await EmbeddingCache().get_embeddings(texts), dtype=np.float32)
+            self.matrices[name] = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    async def route(self, question: str, question_embedding: Optional[List[float]] = None) -> Optional[RouteDecision]:
+        if self.matrices is None:
+            await self._load()
+        if question_embedding is None:
+            question_embedding = (await EmbeddingCache().get_embeddings([question]))[0]
+
+        vector = np.asarray(question_embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector)
+
+        scores = sorted(
+            ((float(np.max(matrix @ vector)), name) for name, matrix in self.matrices.items()),
+            reverse=True,
+        )
+        best, name = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else -1.0
+
+        if best >= self.threshold and best - runner_up >= self.margin:
+            return _decision(name, question, best)
+
+        return None
+
+
+class NoIntentRouter(IntentRouter):
+    async def route(self, question: str, question_embedding: Optional[List[float]] = None) -> Optional[RouteDecision]:
+        return None
+
+
+def get_intent_router() -> IntentRouter:
+    match INTENT_ROUTER:
+        case "rule":
+            return RuleIntentRouter()
+        case "embedding":
+            return EmbeddingIntentRouter()
+        case "none":
+            return NoIntentRouter()
+        case _:
+            raise ValueError(f"Unsupported intent router: {INTENT_ROUTER}")
+
+
+async def local_route(
+    router: IntentRouter,
+    question: str,
+    question_embedding: Optional[List[float]] = None,
+    follow_up: bool = False,
+) -> Optional[RouteDecision]:
+    """
+    Ask the local router first and record which path the turn took.
+
+    The local router takes its arguments from the question as it is, so a follow-up in a
+    conversation is only routed locally to functions without arguments. The others go to the
+    LLM, which rewrites them with the conversation's context.
+    """
+    start = time.perf_counter()
+    try:
+        decision = await router.route(question, question_embedding)
+    except Exception as e:
+        logger.warning(f"Intent router failed, falling back to the LLM: {e}")
+        decision = None
+    if decision is not None and follow_up and decision.arguments:
+        metrics.incr("intent_router.follow_up")
+        decision = None
+    metrics.observe("intent_router.local_latency_ms", (time.perf_counter() - start) * 1000)
+
+    if decision is None:
+        metrics.incr("intent_router.llm")
+        return None
+
+    metrics.incr("intent_router.local")
+    metrics.incr(f"intent_router.local.{decision.name}")
+    # Estimate the saving from the average latency of the LLM routing calls seen so far
+    llm_latency = metrics.histograms.get("intent_router.llm_latency_ms")
+    if llm_latency is not None and llm_latency.count:
+        metrics.incr("intent_router.saved_ms", llm_latency.sum / llm_latency.count)
+    return decision
+
+
+def record_llm_route(latency: float):
+    metrics.observe("intent_router.llm_latency_ms", latency * 1000)
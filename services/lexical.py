@@ -0,0 +1,36 @@
+import re
+import unicodedata
+from typing import Dict, List, Sequence, Tuple
+
+RRF_K = 60  # Rank constant of reciprocal rank fusion, from Cormack et al.
+
+# Runs of latin letters and digits, or runs of kana and kanji
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lexical search terms.
+
+    Japanese has no spaces between words, so runs of kana and kanji become overlapping
+    character bigrams, like a CJK analyzer does. Latin words, digits and product codes are
+    lowercased and kept whole, after NFKC folds full-width characters to ASCII.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token[0].isascii() or len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge rankings of ids into one, best first, scoring each id by the sum of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
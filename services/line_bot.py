@@ -1,22 +1,22 @@
 import aiohttp
+from typing import Optional
 
-from typing import List
 from services.chat import chat_line
-from models.chat import ChatHistory
-from datastore.providers.redis_chat import RedisChat
+from services.conversation import remember
+from models.chat import ConversationHistory
 from loguru import logger
 
 async def line_reply(
     reply_token: str, 
     question: str,
-    history: List[ChatHistory], 
+    history: ConversationHistory,
     user_id: str,
     collection: str, 
     language: str, 
     sorry: str,
-    cache: RedisChat
+    stripe_id: Optional[str] = None
 ) -> str:
-    answer, token_usage = await chat_line(
+    answer, usage = await chat_line(
         question=question,
         history=history,
         collection=collection,
@@ -24,10 +24,7 @@ async def line_reply(
         sorry=sorry
     )
 
-    cache.set_chat_history( user_id, {
-        "user_question": question,
-        "answer": answer
-    })
+    await remember(user_id, question, answer, stripe_id)
 
     data = {
         "replyToken": reply_token,
@@ -44,4 +41,4 @@ async def line_reply(
             resp = await resp.text()
             logger.debug(resp)
             
-    return answer, token_usage
\ No newline at end of file
+    return answer, usage
\ No newline at end of file
@@ -1,9 +1,46 @@
-from typing import List
+from typing import List, Optional
+import aiohttp
 import openai
 import os
 
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
+# Connection pool shared by every async OpenAI call in this worker
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_KEEPALIVE_TIMEOUT = float(os.environ.get("OPENAI_KEEPALIVE_TIMEOUT", 30))
+OPENAI_REQUEST_TIMEOUT = float(os.environ.get("OPENAI_REQUEST_TIMEOUT", 60))
+
+_aiosession: Optional[aiohttp.ClientSession] = None
+
+
+def get_aiosession() -> aiohttp.ClientSession:
+    """
+    Return the pooled aiohttp session used by the async OpenAI client, creating it on first use.
+
+    openai keeps the session in a ContextVar, which does not propagate from the startup
+    hook to request tasks, so it is bound again on every call.
+    """
+    global _aiosession
+    if _aiosession is None or _aiosession.closed:
+        connector = aiohttp.TCPConnector(
+            limit=OPENAI_MAX_CONNECTIONS,
+            keepalive_timeout=OPENAI_KEEPALIVE_TIMEOUT,
+        )
+        _aiosession = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=OPENAI_REQUEST_TIMEOUT),
+        )
+
+    openai.aiosession.set(_aiosession)
+    return _aiosession
+
+
+async def close_aiosession():
+    global _aiosession
+    if _aiosession is not None and not _aiosession.closed:
+        await _aiosession.close()
+    _aiosession = None
+
 
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
 def get_embeddings(texts: List[str]) -> List[List[float]]:
@@ -79,6 +116,90 @@ def get_chat_completion(
     print(f"Completion: {completion}")
     return completion
 
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts using OpenAI's ada model without blocking the event loop.
+
+    Args:
+        texts: The list of texts to embed.
+
+    Returns:
+        A list of embeddings, each of which is a list of floats.
+
+    Raises:
+        Exception: If the OpenAI API call fails.
+    """
+    return await acreate_embeddings(texts)
+
+
+async def acreate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Call the embeddings API once, without retrying, for callers that pace and retry their
+    requests themselves like `EmbeddingScheduler`.
+    """
+    get_aiosession()
+    deployment = os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID")
+
+    if deployment == None:
+        response = await openai.Embedding.acreate(input=texts, model="text-embedding-ada-002")
+    else:
+        response = await openai.Embedding.acreate(input=texts, deployment_id=deployment)
+
+    data = response["data"]  # type: ignore
+
+    return [result["embedding"] for result in data]
+
+
+async def acreate_chat_completion(**kwargs):
+    """
+    Call the chat completion API on the pooled async session.
+
+    Accepts the same arguments as `openai.ChatCompletion.create`. With `stream=True` the
+    result is an async generator of chunks.
+    """
+    get_aiosession()
+    return await openai.ChatCompletion.acreate(**kwargs)
+
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+async def aget_chat_completion(
+    messages,
+    model="gpt-3.5-turbo",
+    deployment_id = None,
+    temperature = 0
+) -> str:
+    """
+    Async version of `get_chat_completion`.
+
+    Args:
+        messages: The list of messages in the chat history.
+        model: The name of the model to use for the completion.
+
+    Returns:
+        A string containing the chat completion.
+
+    Raises:
+        Exception: If the OpenAI API call fails.
+    """
+    deployment_id = os.environ.get("OPENAI_COMPLETIONMODEL_DEPLOYMENTID")
+
+    if deployment_id == None:
+        response = await acreate_chat_completion(
+            model=model,
+            messages=messages,
+            temperature=temperature
+        )
+    else:
+        response = await acreate_chat_completion(
+            deployment_id = deployment_id,
+            messages=messages,
+        )
+
+    choices = response["choices"]  # type: ignore
+    completion = choices[0].message.content.strip()
+    return completion
+
 # @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
 def get_completion(
     prompt,
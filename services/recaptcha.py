@@ -1,41 +1,50 @@
-import requests
-from datastore.providers.redis_chat import RedisChat
+import aiohttp
+from datastore.providers.redis_chat import AsyncRedisChat
 from loguru import logger
 
-cache = RedisChat()
+cache = AsyncRedisChat()
 
-def v2_captcha_verify(user_id: bytes, token: str) -> bool:
+
+async def siteverify(secret: str, token: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            "https://www.google.com/recaptcha/api/siteverify", data={"secret": secret, "response": token}
+        ) as resp:
+            return await resp.json()
+
+
+async def v2_captcha_verify(user_id: bytes, token: str) -> bool:
     # secret = "6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe"
     secret = "6LdGlBooAAAAAB4cV-PjV1Q1A-4261xHfTuqfmta"
-    res = requests.post(f"https://www.google.com/recaptcha/api/siteverify?secret={secret}&response={token}")
+    res = await siteverify(secret, token)
 
-    succ = res.json()["success"]
+    succ = res["success"]
 
     logger.info(succ)
 
     if succ:
-        cache.redis.srem("captcha", user_id)
+        await cache.redis.srem("captcha", user_id)
         return True
     else:
         return False
 
 
-def v3_captcha_verify(user_id: bytes, token: str) -> bool:
-    if cache.redis.sismember("captcha", user_id):
+async def v3_captcha_verify(user_id: bytes, token: str) -> bool:
+    if await cache.redis.sismember("captcha", user_id):
         return False
 
     secret = "6LddwxooAAAAAJ1paREUji1g5PNX84pt45x73Afa"
-    res = requests.post(f"https://www.google.com/recaptcha/api/siteverify?secret={secret}&response={token}")
+    res = await siteverify(secret, token)
 
-    logger.info(res.json())
+    logger.info(res)
 
     try:
-        score = res.json()['score']
+        score = res['score']
     except KeyError:
         score = 0
 
     if score < 0.5:
-        cache.redis.sadd("captcha", user_id)
+        await cache.redis.sadd("captcha", user_id)
         return False
     else:
         return True
@@ -1,7 +1,7 @@
 from datastore.providers import redis_chat, qdrant_datastore
 from models.i18n import i18nAdapter
 from services.chat import chat_response
-from services.openai import get_chat_completion
+from services.openai import aget_chat_completion
 from server.db.database import SessionLocal
 from server.db import crud
 
@@ -21,7 +21,7 @@ sem = asyncio.Semaphore(2)
 db = SessionLocal()
 scheduler = AsyncIOSchedulerWrapper()
 
-def generate_question(query: str, language: str) -> str:
+async def generate_question(query: str, language: str) -> str:
     query_content = ""
     
     messages = [
@@ -35,7 +35,7 @@ def generate_question(query: str, language: str) -> str:
         }
     ]
 
-    question = get_chat_completion(messages, temperature=0)
+    question = await aget_chat_completion(messages, temperature=0)
     
     return question
 
@@ -47,7 +47,7 @@ async def answer_question(lang: str, query: str, question: str, collection: str)
         collection
     )
 
-    content = chat_response(
+    content = await chat_response(
         context=query_results[0].results, 
         user_question=question,
         sorry=i18n_adapter.get_message(lang, message="sorry")
@@ -77,7 +77,7 @@ async def collection_question_recommand(collecion_id: str):
 
         if add_key_word:
             for key_word in add_key_word:
-                question = generate_question(key_word, language)
+                question = await generate_question(key_word, language)
                 answer = await answer_question(lang, key_word, question, collecion_id)
 
                 cache.add_faq(key_word, question, answer, lang, collecion_id)
@@ -0,0 +1,95 @@
+import os
+import asyncio
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+
+from models.models import DocumentChunkWithScore
+from services.context import chunk_tokens
+from utils.common import singleton_with_lock
+
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # Multilingual MiniLM cross-encoder, fast enough on CPU
+RERANK_MAX_LENGTH = int(os.environ.get("RERANK_MAX_LENGTH", 256))  # Tokens of each query and chunk pair the cross-encoder reads
+
+
+def mmr(chunks: List[DocumentChunkWithScore], relevance: float) -> List[DocumentChunkWithScore]:
+    """
+    Reorder chunks by maximal marginal relevance.
+
+    Each next chunk maximizes `relevance * score - (1 - relevance) * similarity`, where score
+    falls linearly from 1 with the chunk's rank, since cosine, fusion and cross-encoder scores
+    have nothing in common but their order, and similarity is its highest cosine similarity with
+    the chunks already picked, so near-duplicates of a picked chunk sink to the end. Chunks
+    without an embedding, like lexical-only hits, are never counted as duplicates.
+    """
+    if len(chunks) < 2:
+        return list(chunks)
+
+    chunks = sorted(chunks, key=lambda chunk: chunk.score, reverse=True)
+    scores = 1 - np.arange(len(chunks), dtype=np.float32) / len(chunks)
+    dimension = next((len(chunk.embedding) for chunk in chunks if chunk.embedding), 0)
+    vectors = np.array(
+        [chunk.embedding if chunk.embedding else [0.0] * dimension for chunk in chunks],
+        dtype=np.float32,
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    similarities = vectors @ vectors.T
+
+    picked: List[int] = []
+    redundancy = np.zeros(len(chunks), dtype=np.float32)
+    remaining = list(range(len(chunks)))
+    while remaining:
+        marginal = relevance * scores[remaining] - (1 - relevance) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(marginal)))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, similarities[best])
+    return [chunks[i] for i in picked]
+
+
+def within_budget(
+    chunks: List[DocumentChunkWithScore], top_k: Optional[int], max_tokens: Optional[int]
+) -> List[DocumentChunkWithScore]:
+    """The first top_k chunks, skipping those that no longer fit in max_tokens."""
+    selected, used = [], 0
+    for chunk in chunks:
+        if top_k is not None and len(selected) >= top_k:
+            break
+        if max_tokens is not None:
+            tokens = chunk_tokens(chunk)
+            if used + tokens > max_tokens:
+                continue
+            used += tokens
+        selected.append(chunk)
+    return selected
+
+
+@singleton_with_lock
+class CrossEncoderReranker():
+    """
+    Rescore query and chunk pairs with a cross-encoder.
+
+    The model needs sentence-transformers, which is not a dependency of the server. Without it,
+    or when the model cannot be loaded, re-ranking is skipped and chunks keep their order.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL):
+        self.model = None
+        try:
+            from sentence_transformers import CrossEncoder
+
+            self.model = CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+        except Exception as e:
+            logger.warning(f"Re-ranking disabled, cannot load {model_name}: {e}")
+
+    async def rerank(self, query: str, chunks: List[DocumentChunkWithScore]) -> List[DocumentChunkWithScore]:
+        if self.model is None or not chunks:
+            return chunks
+
+        # predict releases the GIL in torch, a thread keeps the event loop free
+        scores = await asyncio.get_running_loop().run_in_executor(
+            None, self.model.predict, [(query, chunk.text) for chunk in chunks]
+        )
+        rescored = [chunk.copy(update={"score": float(score)}) for chunk, score in zip(chunks, scores)]
+        return sorted(rescored, key=lambda chunk: chunk.score, reverse=True)
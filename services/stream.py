@@ -0,0 +1,85 @@
+import os
+import asyncio
+from typing import AsyncIterator, Generic, Optional, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", 32))  # Chunks buffered between upstream and the websocket
+
+_END = object()
+
+
+class StreamBridge(Generic[T]):
+    """
+    Pump an upstream async iterator (e.g. an OpenAI SSE stream) into a bounded queue on its own task.
+
+    The reader never blocks the upstream socket while it is sending, and the upstream stops
+    reading once the queue is full, so a slow websocket applies backpressure all the way to
+    the HTTP connection. Closing the bridge cancels the pump and closes the upstream
+    iterator, which releases the HTTP response so no more tokens are paid for.
+
+    Usage:
+        async with StreamBridge(stream) as chunks:
+            async for chunk in chunks:
+                ...
+    """
+
+    def __init__(self, source: AsyncIterator[T], maxsize: int = STREAM_QUEUE_SIZE):
+        self._source = source
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def _pump(self):
+        try:
+            async for item in self._source:
+                await self._queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._queue.put(e)
+            return
+        await self._queue.put(_END)
+
+    def __aiter__(self) -> "StreamBridge[T]":
+        if self._task is None:
+            self._task = asyncio.create_task(self._pump())
+        return self
+
+    async def __anext__(self) -> T:
+        if self._closed:
+            raise StopAsyncIteration
+
+        item = await self._queue.get()
+        if item is _END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        aclose = getattr(self._source, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception as e:
+                logger.warning(f"Closing upstream stream failed: {e}")
+
+    async def __aenter__(self) -> "StreamBridge[T]":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,192 @@
+import os
+import json
+import asyncio
+from typing import Dict, Iterable, Optional
+
+from loguru import logger
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from datastore.providers.redis_chat import AsyncRedisChat, RedisChat
+from server.db import async_crud, crud
+from server.db.database import SessionLocal
+from utils.common import singleton_with_lock
+from utils.metrics import Metrics
+
+TOKEN_METER_FLUSH_SECONDS = int(os.environ.get("TOKEN_METER_FLUSH_SECONDS", 10))  # Seconds between write-backs of the usage to the plans
+TOKEN_METER_FLUSH_BATCH = int(os.environ.get("TOKEN_METER_FLUSH_BATCH", 500))  # Customers written back per UPDATE
+TOKEN_METER_INVOICE_ATTEMPTS = int(os.environ.get("TOKEN_METER_INVOICE_ATTEMPTS", 3))  # Attempts per invoice before it is dropped
+TOKEN_METER_INVOICE_BACKOFF = float(os.environ.get("TOKEN_METER_INVOICE_BACKOFF", 30))  # Seconds before a failed invoice is retried
+
+DIRTY_KEY = "TokenMeter::Dirty"
+INVOICE_QUEUE = "TokenMeter::Invoices"
+
+# Returns nil when the counter is not loaded, else the tokens left and whether this charge reached the limit
+CHARGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local remaining = redis.call('DECRBY', KEYS[1], ARGV[1])
+redis.call('INCRBY', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[2])
+if remaining <= 0 and redis.call('SET', KEYS[3], 1, 'NX') then
+    redis.call('RPUSH', KEYS[5], ARGV[3])
+    return {remaining, 1}
+end
+return {remaining, 0}
+"""
+
+# Starts the counter from the plan, minus the usage not written back to it yet
+LOAD_SCRIPT = """
+local pending = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('SET', KEYS[1], tonumber(ARGV[1]) - pending, 'NX')
+"""
+
+metrics = Metrics()
+
+
+@singleton_with_lock
+class TokenMeter():
+    """
+    Chat token metering in Redis, written back to the plans in the background.
+
+    Layout, following the RedisChat key scheme:
+        {stripe_id}::token_remaining   tokens left on the customer's plan
+        {stripe_id}::token_usage       tokens used since the last write-back
+        {stripe_id}::reach_limit       set when the counter runs out, cleared when a plan is paid
+        TokenMeter::Dirty              set of the customers with usage to write back
+        TokenMeter::Invoices           list of the usage invoices to send
+
+    A charge is one script: it decrements the counter, adds to the usage and, the first time
+    the counter runs out, sets reach_limit and queues an invoice, so concurrent turns of a
+    customer never lose an update and only one of them invoices. flush_usage writes the
+    usage of every customer back to their plan in batched UPDATEs.
+    """
+
+    def __init__(self):
+        self.redis = RedisChat().redis
+        self.async_redis = AsyncRedisChat().redis
+        self.charge_script = self.async_redis.register_script(CHARGE_SCRIPT)
+        self.load_script = self.async_redis.register_script(LOAD_SCRIPT)
+
+    def _keys(self, stripe_id: str):
+        return [
+            f"{stripe_id}::token_remaining",
+            f"{stripe_id}::token_usage",
+            f"{stripe_id}::reach_limit",
+            DIRTY_KEY,
+            INVOICE_QUEUE,
+        ]
+
+    async def charge(self, db: AsyncSession, stripe_id: str, tokens: int) -> Optional[int]:
+        """
+        Charge tokens to a customer.
+
+        Returns:
+            The tokens left, None when the customer has no plan.
+        """
+        if tokens <= 0:
+            return None
+
+        keys = self._keys(stripe_id)
+        invoice = json.dumps({"stripe_id": stripe_id, "attempts": 0})
+        result = await self.charge_script(keys=keys, args=[tokens, stripe_id, invoice])
+        if result is None:
+            # First charge since the counter was reset, start it from the plan
+            token_remaining = await async_crud.get_token_remaining(db, stripe_id)
+            if token_remaining is None:
+                return None
+            await self.load_script(keys=keys[:2], args=[token_remaining])
+            result = await self.charge_script(keys=keys, args=[tokens, stripe_id, invoice])
+
+        remaining, reached = result
+        if reached:
+            logger.info(f"{stripe_id} reached its token limit")
+            metrics.incr("token_meter.reach_limit")
+        return remaining
+
+    def _take_usage(self, stripe_ids: Iterable[str]) -> Dict[str, int]:
+        pipe = self.redis.pipeline(transaction=False)
+        stripe_ids = list(stripe_ids)
+        for stripe_id in stripe_ids:
+            pipe.getdel(f"{stripe_id}::token_usage")
+        return {
+            stripe_id: int(used)
+            for stripe_id, used in zip(stripe_ids, pipe.execute())
+            if used is not None and int(used) != 0
+        }
+
+    def _give_back_usage(self, usage: Dict[str, int]):
+        pipe = self.redis.pipeline(transaction=False)
+        for stripe_id, used in usage.items():
+            pipe.incrby(f"{stripe_id}::token_usage", used)
+            pipe.sadd(DIRTY_KEY, stripe_id)
+        pipe.execute()
+
+    def flush_usage(self, stripe_ids: Optional[Iterable[str]] = None, db: Optional[Session] = None):
+        """
+        Write the usage of customers back to their plans, of every customer with usage by default.
+        A write-back that fails is given back to Redis for the next one.
+        """
+        session = db or SessionLocal()
+        try:
+            while True:
+                if stripe_ids is None:
+                    batch = [stripe_id.decode() for stripe_id in self.redis.spop(DIRTY_KEY, TOKEN_METER_FLUSH_BATCH)]
+                else:
+                    batch, stripe_ids = list(stripe_ids), []
+                if not batch:
+                    break
+
+                usage = self._take_usage(batch)
+                if not usage:
+                    continue
+                try:
+                    crud.apply_token_usage(session, usage)
+                except Exception:
+                    session.rollback()
+                    self._give_back_usage(usage)
+                    raise
+                metrics.incr("token_meter.flushed_tokens", sum(usage.values()))
+        except Exception as e:
+            logger.error(f"Token usage write-back failed: {e}")
+            metrics.incr("token_meter.flush_error")
+        finally:
+            if db is None:
+                session.close()
+
+    def reset(self, stripe_id: str):
+        """
+        Restart the counter of a customer from its plan, after the plan was renewed or changed.
+        Write back its usage first, or the renewed plan is charged for it.
+        """
+        self.redis.delete(f"{stripe_id}::token_remaining", f"{stripe_id}::reach_limit")
+
+    async def send_invoices(self):
+        """Send the usage invoices of the customers that ran out of tokens, until cancelled."""
+        while True:
+            try:
+                item = await self.async_redis.blpop(INVOICE_QUEUE, timeout=5)
+            except RedisError as e:
+                logger.warning(f"Invoice queue unavailable: {e}")
+                await asyncio.sleep(TOKEN_METER_INVOICE_BACKOFF)
+                continue
+            if item is None:
+                continue
+
+            invoice = json.loads(item[1])
+            try:
+                await asyncio.to_thread(self._send_invoice, invoice["stripe_id"])
+                metrics.incr("token_meter.invoice")
+            except Exception as e:
+                invoice["attempts"] += 1
+                logger.error(f"Invoice of {invoice['stripe_id']} failed (attempt {invoice['attempts']}): {e}")
+                metrics.incr("token_meter.invoice_error")
+                if invoice["attempts"] < TOKEN_METER_INVOICE_ATTEMPTS:
+                    await asyncio.sleep(TOKEN_METER_INVOICE_BACKOFF)
+                    await self.async_redis.rpush(INVOICE_QUEUE, json.dumps(invoice))
+
+    def _send_invoice(self, stripe_id: str):
+        with SessionLocal() as db:
+            crud.create_usage_invoice(db, stripe_id)
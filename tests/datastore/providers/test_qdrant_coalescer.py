@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from qdrant_client.http import models as rest
+
+from datastore.providers.qdrant_datastore import SearchCoalescer
+
+
+def request(value: float, limit: int = 3) -> rest.SearchRequest:
+    return rest.SearchRequest(vector=[float(value), 1.0], limit=limit)
+
+
+class FakeSearch:
+    def __init__(self, error=None, delay=0.001):
+        self.batches = []
+        self.error = error
+        self.delay = delay
+
+    async def __call__(self, collection, requests):
+        self.batches.append((collection, requests))
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [[f"{collection}:{r.vector[0]}"] for r in requests]
+
+
+async def test_concurrent_searches_share_one_batch_per_collection():
+    search = FakeSearch()
+    coalescer = SearchCoalescer(search, window=0.01, max_batch=32)
+
+    results = await asyncio.gather(
+        coalescer.search("a", [request(1)]),
+        coalescer.search("a", [request(2)]),
+        coalescer.search("b", [request(3)]),
+    )
+
+    assert results == [[["a:1.0"]], [["a:2.0"]], [["b:3.0"]]]
+    assert sorted((collection, len(requests)) for collection, requests in search.batches) == [("a", 2), ("b", 1)]
+
+
+async def test_max_batch_flushes_before_the_window():
+    search = FakeSearch()
+    coalescer = SearchCoalescer(search, window=10, max_batch=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(coalescer.search("a", [request(1)]), coalescer.search("a", [request(2)])),
+        timeout=1,
+    )
+
+    assert results == [[["a:1.0"]], [["a:2.0"]]]
+
+
+async def test_identical_searches_are_sent_once():
+    search = FakeSearch(delay=0.05)
+    coalescer = SearchCoalescer(search, window=0.01)
+
+    first = asyncio.ensure_future(coalescer.search("a", [request(1)]))
+    await asyncio.sleep(0.02)
+    # The first search is in flight now, the second one joins it
+    second = coalescer.search("a", [request(1)])
+
+    assert await asyncio.gather(first, second) == [[["a:1.0"]], [["a:1.0"]]]
+    assert len(search.batches) == 1
+    assert coalescer.futures == {}
+
+
+async def test_different_limits_are_not_deduplicated():
+    search = FakeSearch()
+    coalescer = SearchCoalescer(search, window=0.01)
+
+    await asyncio.gather(coalescer.search("a", [request(1, limit=3)]), coalescer.search("a", [request(1, limit=5)]))
+
+    assert len(search.batches[0][1]) == 2
+
+
+async def test_failures_reach_every_waiter():
+    coalescer = SearchCoalescer(FakeSearch(error=RuntimeError("down")), window=0.01)
+
+    results = await asyncio.gather(
+        coalescer.search("a", [request(1)]),
+        coalescer.search("a", [request(2)]),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_cancelled_caller_does_not_cancel_shared_search():
+    coalescer = SearchCoalescer(FakeSearch(), window=0.01)
+
+    first = asyncio.ensure_future(coalescer.search("a", [request(1)]))
+    second = asyncio.ensure_future(coalescer.search("a", [request(1)]))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == [["a:1.0"]]
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client.http import models as rest
+from qdrant_client.http.models import PayloadSchemaType
+
+from datastore.providers.qdrant_datastore import QDRANT_SHARED_COLLECTION, QdrantDataStore
+
+
+class FakeClient:
+    def __init__(self, schema=None):
+        self.schema = schema or {}
+        self.created = []
+
+    def get_collection(self, collection_name):
+        vectors = SimpleNamespace(distance=rest.Distance.COSINE, size=1536)
+        return SimpleNamespace(
+            config=SimpleNamespace(params=SimpleNamespace(vectors=vectors)),
+            payload_schema={field: SimpleNamespace(data_type=t) for field, t in self.schema.items()},
+        )
+
+    def create_payload_index(self, collection_name, field_name, field_schema):
+        self.created.append((collection_name, field_name, field_schema))
+        self.schema[field_name] = field_schema
+
+
+class FakePool:
+    def __init__(self, *args, **kwargs):
+        self.client = FakeClient()
+
+
+@pytest.fixture
+def datastore(mocker):
+    mocker.patch("datastore.providers.qdrant_datastore.QdrantClientPool", FakePool)
+    mocker.patch("datastore.providers.qdrant_datastore.RedisLexicalIndex").return_value = mocker.AsyncMock()
+    return QdrantDataStore()
+
+
+def test_ensure_payload_indexes_creates_missing_indexes_on_the_collection(datastore):
+    datastore.client = FakeClient({"metadata.document_id": PayloadSchemaType.KEYWORD})
+
+    created = datastore.ensure_payload_indexes("tenant-collection")
+
+    assert set(created) == {"metadata.source", "metadata.source_id", "metadata.author", "created_at"}
+    assert {collection for collection, _, _ in datastore.client.created} == {"tenant-collection"}
+    assert ("tenant-collection", "created_at", PayloadSchemaType.INTEGER) in datastore.client.created
+    assert datastore.audit_payload_indexes("tenant-collection") == ([], [])
+
+
+def test_audit_reports_mismatched_types(datastore):
+    schema = {field: field_schema for field, field_schema in datastore.payload_indexes("c").items()}
+    schema["metadata.author"] = PayloadSchemaType.TEXT
+    datastore.client = FakeClient(schema)
+
+    assert datastore.audit_payload_indexes("c") == ([], ["metadata.author"])
+    assert datastore.ensure_payload_indexes("c") == []
+
+
+def test_shared_collection_indexes_tenant_id(datastore):
+    assert datastore.payload_indexes(QDRANT_SHARED_COLLECTION)["tenant_id"] == PayloadSchemaType.KEYWORD
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client.http import models as rest
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+from datastore.providers.qdrant_datastore import (
+    QDRANT_SHARED_COLLECTION,
+    QdrantDataStore,
+    SearchCoalescer,
+)
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentMetadataFilter,
+    QueryWithEmbedding,
+)
+
+CHUNK_ID = "7d0b2c4e-8f5a-4b8e-9d1c-2a3b4c5d6e7f"
+
+
+class FakeClient:
+    def __init__(self):
+        self.collections = set()
+
+    def get_collection(self, collection_name):
+        if collection_name not in self.collections:
+            raise UnexpectedResponse(status_code=404, reason_phrase="Not Found", content=b"", headers=None)
+        return SimpleNamespace(payload_schema={})
+
+    def create_collection(self, collection_name, **kwargs):
+        self.collections.add(collection_name)
+
+    recreate_collection = create_collection
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakePool:
+    def __init__(self, *args, **kwargs):
+        self.client = FakeClient()
+        self.calls = []
+
+    async def call(self, method, timeout, **kwargs):
+        self.calls.append((method, kwargs))
+        if method == "search_batch":
+            return [
+                [
+                    rest.ScoredPoint(
+                        id="00000000-0000-0000-0000-000000000000",
+                        version=0,
+                        score=1.0,
+                        payload={"id": CHUNK_ID, "text": "text", "metadata": {}, "tenant_id": "tenant-a"},
+                    )
+                ]
+                for _ in kwargs["requests"]
+            ]
+        return rest.UpdateResult(operation_id=0, status="completed")
+
+
+@pytest.fixture
+def datastore(mocker):
+    mocker.patch("datastore.providers.qdrant_datastore.QdrantClientPool", FakePool)
+    mocker.patch("datastore.providers.qdrant_datastore.RedisLexicalIndex").return_value = mocker.AsyncMock()
+    datastore = QdrantDataStore()
+    datastore.pool = FakePool()
+    datastore.coalescer = SearchCoalescer(datastore._search_batch, window=0)
+    datastore.multitenant = True
+    return datastore
+
+
+def tenant_of(selector: rest.Filter) -> str:
+    return next(c.match.value for c in selector.must if getattr(c, "key", None) == "tenant_id")
+
+
+async def test_upsert_writes_tenant_points_to_shared_collection(datastore):
+    chunk = DocumentChunk(id=CHUNK_ID, text="text", metadata=DocumentChunkMetadata(), embedding=[0.0])
+
+    await datastore._upsert({"doc": [chunk]}, collection_name="tenant-a")
+    await datastore._upsert({"doc": [chunk]}, collection_name="tenant-b")
+
+    (_, a), (_, b) = datastore.pool.calls
+    assert a["collection_name"] == b["collection_name"] == QDRANT_SHARED_COLLECTION
+    assert a["points"][0].payload["tenant_id"] == "tenant-a"
+    assert a["points"][0].payload["id"] == CHUNK_ID
+    # The same chunk id in two tenants must not overwrite each other
+    assert a["points"][0].id != b["points"][0].id
+
+
+async def test_query_is_scoped_to_tenant(datastore):
+    query = QueryWithEmbedding(query="hello", embedding=[0.0], top_k=3)
+
+    results = await datastore._query([query], collection_name="tenant-a")
+
+    _, kwargs = datastore.pool.calls[0]
+    assert kwargs["collection_name"] == QDRANT_SHARED_COLLECTION
+    assert tenant_of(kwargs["requests"][0].filter) == "tenant-a"
+    assert results[0].results[0].id == CHUNK_ID
+
+
+async def test_delete_all_only_deletes_tenant(datastore):
+    await datastore.delete(delete_all=True, collection_name="tenant-a")
+    await datastore.delete(
+        ids=[CHUNK_ID],
+        filter=DocumentMetadataFilter(document_id="doc"),
+        collection_name="tenant-a",
+    )
+
+    (_, delete_all), (_, delete_ids) = datastore.pool.calls
+    assert tenant_of(delete_all["points_selector"]) == "tenant-a"
+    assert tenant_of(delete_ids["points_selector"]) == "tenant-a"
+    has_id = next(c for c in delete_ids["points_selector"].must if isinstance(c, rest.HasIdCondition))
+    assert has_id.has_id == [datastore._point_id(CHUNK_ID, "tenant-a")]
+
+
+async def test_default_collection_is_not_shared(datastore):
+    query = QueryWithEmbedding(query="hello", embedding=[0.0], top_k=3)
+
+    await datastore._query([query])
+
+    _, kwargs = datastore.pool.calls[0]
+    assert kwargs["collection_name"] == datastore.collection_name
+    assert kwargs["requests"][0].filter is None
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from datastore.providers.qdrant_datastore import QdrantClientPool
+from utils.circuit_breaker import CircuitOpenError
+
+
+class FakeClient:
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.threads = set()
+
+    def search_batch(self, collection_name, requests):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [self.name for _ in requests]
+
+
+def pool_with(*clients, threads=4):
+    pool = QdrantClientPool(size=1, threads=threads)
+    pool.clients = list(clients)
+    return pool
+
+
+async def test_call_runs_off_the_event_loop_round_robin():
+    a, b = FakeClient("a"), FakeClient("b")
+    pool = pool_with(a, b)
+
+    results = [await pool.call("search_batch", 1, collection_name="c", requests=[1]) for _ in range(4)]
+
+    assert results == [["a"], ["b"], ["a"], ["b"]]
+    assert threading.get_ident() not in a.threads | b.threads
+
+
+async def test_blocking_calls_do_not_stall_the_loop():
+    pool = pool_with(FakeClient("a", delay=0.1))
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await pool.call("search_batch", 1, collection_name="c", requests=[1])
+    task.cancel()
+
+    assert ticks >= 5
+
+
+async def test_call_gives_up_after_the_deadline():
+    pool = pool_with(FakeClient("a", delay=0.2))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await pool.call("search_batch", 0.05, collection_name="c", requests=[1])
+
+
+async def test_circuit_opens_on_unavailable_but_not_on_bad_requests():
+    pool = pool_with(FakeClient("a", error=ValueError("bad request")))
+    pool.breaker.failure_threshold = 2
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await pool.call("search_batch", 1, collection_name="c", requests=[1])
+    assert pool.breaker.state == "closed"
+
+    pool.clients = [FakeClient("a", error=ConnectionError("refused"))]
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await pool.call("search_batch", 1, collection_name="c", requests=[1])
+    with pytest.raises(CircuitOpenError):
+        await pool.call("search_batch", 1, collection_name="c", requests=[1])
@@ -0,0 +1,31 @@
+from qdrant_client.http import models as rest
+
+from datastore.providers.qdrant_datastore import storage_config
+from models.models import CollectionStorage, StorageProfile
+
+
+def test_default_profile_keeps_collection_defaults():
+    assert storage_config(CollectionStorage()) == {}
+
+
+def test_int8_on_disk_profile():
+    config = storage_config(CollectionStorage(profile=StorageProfile.int8_on_disk))
+
+    assert config["quantization_config"].scalar.type == rest.ScalarType.INT8
+    assert config["quantization_config"].scalar.always_ram
+    assert config["on_disk_payload"]
+    assert config["optimizers_config"].memmap_threshold > 0
+
+
+def test_on_disk_profile_is_not_quantized():
+    config = storage_config(CollectionStorage(profile=StorageProfile.on_disk))
+
+    assert "quantization_config" not in config
+    assert config["on_disk_payload"]
+
+
+def test_hnsw_overrides():
+    config = storage_config(CollectionStorage(hnsw_m=32, hnsw_ef_construct=256))
+
+    assert config["hnsw_config"].m == 32
+    assert config["hnsw_config"].ef_construct == 256
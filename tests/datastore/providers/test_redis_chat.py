@@ -1,34 +1,37 @@
-from datastore.providers.redis_chat import RedisChat
-from models.chat import ChatHistory
+from datastore.providers.redis_chat import AsyncRedisChat, RedisChat, count_round_trips
 import pytest
 
 
 @pytest.fixture
 def redis_chat() -> RedisChat:
     redis_chat = RedisChat()
-    if redis_chat.user_exists(b"user_id"):
-        redis_chat.redis.delete(b"user_id")
-    return redis_chat
+    redis_chat.redis.delete("collection::en::KeywordToQuestion", "collection::en::QuestionToAnswer")
+    # The first call of a script loads it
+    redis_chat.delete_faq("missing", "en", "collection")
+    yield redis_chat
+    redis_chat.redis.delete("collection::en::KeywordToQuestion", "collection::en::QuestionToAnswer")
 
 
-def test_set_chat_history(redis_chat):
-    write_chat_history =  ChatHistory(
-        user_question="user_question", query="query", background="background", answer="answer"
-    )
+def test_faq_writes_take_one_round_trip(redis_chat):
+    round_trips = count_round_trips()
+    redis_chat.add_faq("keyword", "question", "answer", "en", "collection")
+    assert round_trips.count == 1
+    assert redis_chat.get_faq_answer("question", "en", "collection") == "answer"
 
-    redis_chat.set_chat_history(b"user_id", write_chat_history.dict())
+    round_trips = count_round_trips()
+    redis_chat.delete_faq("keyword", "en", "collection")
+    assert round_trips.count == 1
+    assert redis_chat.get_faq_question("en", "collection") == []
 
-    assert redis_chat.get_chat_history(b"user_id") == [write_chat_history]
 
-    redis_chat.redis.delete(b"user_id")
+async def test_async_faq_matches_the_sync_client(redis_chat):
+    async_chat = AsyncRedisChat()
 
-def test_get_qa_history(redis_chat):
-    write_qa_history =  ChatHistory(
-        user_question="user_question", query="query", background="background", answer="answer"
-    )
+    await async_chat.add_faq("keyword", "question", "answer", "en", "collection")
+    assert redis_chat.get_faq_answer("question", "en", "collection") == "answer"
 
-    redis_chat.set_chat_history(b"user_id", write_qa_history.dict())
-
-    assert redis_chat.get_qa_history(b"user_id") == [{"user_question": "user_question", "answer": "answer"}]
-
-    redis_chat.redis.delete(b"user_id")
\ No newline at end of file
+    round_trips = count_round_trips()
+    await async_chat.delete_faq("keyword", "en", "collection")
+    assert round_trips.count == 1
+    assert await async_chat.get_faq_question("en", "collection") == []
+    assert await async_chat.get_faq_answer("question", "en", "collection") == ""
@@ -0,0 +1,34 @@
+from datastore.providers.redis_conversation_memory import CONVERSATION_WINDOW, RedisConversationMemory
+from models.chat import ConversationTurn
+import pytest
+
+
+@pytest.fixture
+async def memory() -> RedisConversationMemory:
+    memory = RedisConversationMemory()
+    await memory.redis.delete(b"user_id::Turns", b"user_id::Summary")
+    yield memory
+    await memory.redis.delete(b"user_id::Turns", b"user_id::Summary")
+
+
+def turn(i: int) -> ConversationTurn:
+    return ConversationTurn(user_question=f"question {i}", answer=f"answer {i}", tokens=i)
+
+
+async def test_append_returns_the_turn_leaving_the_window(memory):
+    evicted = [await memory.append(b"user_id", turn(i)) for i in range(CONVERSATION_WINDOW + 2)]
+
+    assert evicted == [None] * CONVERSATION_WINDOW + [turn(0), turn(1)]
+    assert await memory.turns(b"user_id") == [turn(i) for i in range(CONVERSATION_WINDOW + 2)]
+
+
+async def test_window_reads_the_latest_turns_and_the_summary(memory):
+    for i in range(CONVERSATION_WINDOW + 2):
+        await memory.append(b"user_id", turn(i))
+    await memory.set_summary(b"user_id", "summary", 3)
+
+    turns, summary, tokens = await memory.window(b"user_id")
+
+    assert turns == [turn(i) for i in range(2, CONVERSATION_WINDOW + 2)]
+    assert (summary, tokens) == ("summary", 3)
+    assert await memory.exists(b"user_id")
@@ -0,0 +1,56 @@
+import pytest
+from redis.exceptions import ConnectionError, ResponseError
+
+from datastore.providers.redis_lexical_index import RedisLexicalIndex
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentMetadataFilter
+from utils.metrics import Metrics
+
+
+@pytest.fixture
+def index(mocker):
+    mocker.patch("datastore.providers.redis_lexical_index.LEXICAL_INDEX_ENABLED", True)
+    index = RedisLexicalIndex()
+    index.indexes.clear()
+    mocker.patch.object(index, "redis", new=mocker.MagicMock())
+    index.redis.ft.return_value.create_index = mocker.AsyncMock(side_effect=ResponseError("Index already exists"))
+    yield index
+    index.indexes.clear()
+
+
+async def test_add_writes_the_chunks_in_one_pipeline(index, mocker):
+    pipe = index.redis.pipeline.return_value
+    pipe.execute = mocker.AsyncMock()
+    chunk = DocumentChunk(id="doc-1_0", text="SKU-123 の仕様", metadata=DocumentChunkMetadata(document_id="doc-1"))
+
+    await index.add("collection-1", [chunk])
+
+    pipe.hset.assert_called_once()
+    assert pipe.hset.call_args.args[0] == "collection-1::Lexical::doc-1_0"
+    pipe.execute.assert_awaited_once()
+
+
+async def test_search_treats_an_unreachable_redis_as_no_hits(index, mocker):
+    index.redis.ft.return_value.search = mocker.AsyncMock(side_effect=ConnectionError("refused"))
+    errors = Metrics().get("lexical.error")
+
+    assert await index.search("collection-1", "SKU-123", 5) == []
+    assert Metrics().get("lexical.error") == errors + 1
+
+
+async def test_delete_by_filter_deletes_the_matching_hashes(index, mocker):
+    doc = mocker.Mock(id="collection-1::Lexical::doc-1_0")
+    index.redis.ft.return_value.search = mocker.AsyncMock(side_effect=[mocker.Mock(docs=[doc]), mocker.Mock(docs=[])])
+    index.redis.delete = mocker.AsyncMock()
+
+    await index.delete("collection-1", filter=DocumentMetadataFilter(document_id="doc-1"))
+
+    index.redis.delete.assert_awaited_once_with(doc.id)
+
+
+async def test_nothing_is_indexed_while_disabled(index, mocker):
+    mocker.patch("datastore.providers.redis_lexical_index.LEXICAL_INDEX_ENABLED", False)
+    chunk = DocumentChunk(id="doc-1_0", text="SKU-123", metadata=DocumentChunkMetadata(document_id="doc-1"))
+
+    await index.add("collection-1", [chunk])
+
+    index.redis.pipeline.assert_not_called()
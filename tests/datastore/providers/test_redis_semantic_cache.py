@@ -0,0 +1,44 @@
+import pytest
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from datastore.providers.redis_semantic_cache import RedisSemanticCache
+from models.i18n import i18n
+from utils.metrics import Metrics
+
+
+@pytest.fixture
+def cache(mocker):
+    cache = RedisSemanticCache()
+    cache.indexes.clear()
+    mocker.patch.object(cache, "redis", new=mocker.MagicMock())
+    yield cache
+    cache.indexes.clear()
+
+
+async def test_lookup_treats_an_unreachable_redis_as_a_miss(cache, mocker):
+    cache.redis.ft.return_value.create_index = mocker.AsyncMock()
+    cache.redis.ft.return_value.search = mocker.AsyncMock(side_effect=ConnectionError("refused"))
+    errors = Metrics().get("semantic_cache.error")
+
+    assert await cache.lookup([0.1] * 4, "collection-1", i18n.en) is None
+    assert Metrics().get("semantic_cache.error") == errors + 1
+
+
+async def test_add_does_not_raise_when_redis_times_out(cache, mocker):
+    cache.redis.ft.return_value.create_index = mocker.AsyncMock(side_effect=ResponseError("Index already exists"))
+    cache.redis.pipeline.return_value.execute = mocker.AsyncMock(side_effect=TimeoutError("timed out"))
+
+    await cache.add([0.1] * 4, "answer", ["chunk-1"], "collection-1", i18n.en)
+
+    cache.redis.pipeline.return_value.execute.assert_awaited_once()
+
+
+async def test_invalidate_forgets_the_indexes_of_the_collection(cache, mocker):
+    cache.indexes.add(cache._index("collection-1", i18n.en))
+    cache.redis.ft.return_value.dropindex = mocker.AsyncMock(side_effect=ResponseError("Unknown Index name"))
+    cache.redis.delete = mocker.AsyncMock()
+
+    await cache.invalidate("collection-1")
+
+    assert not cache.indexes
+    cache.redis.delete.assert_any_await(cache._lru("collection-1", i18n.en))
@@ -0,0 +1,83 @@
+from typing import List, Optional
+
+import pytest
+
+from datastore.datastore import DataStore
+from models.models import (
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    Query,
+    QueryResult,
+    QueryWithEmbedding,
+    RetrievalMode,
+)
+
+
+def chunk(id: str, score: float = 0.0) -> DocumentChunkWithScore:
+    return DocumentChunkWithScore(id=id, text=f"text {id}", metadata=DocumentChunkMetadata(), score=score)
+
+
+class FakeDataStore(DataStore):
+    def __init__(self, dense: List[str], lexical: List[str]):
+        self.dense = dense
+        self.lexical = lexical
+        self.top_k = []
+
+    async def _upsert(self, chunks, collection_name=None):
+        return []
+
+    async def _query(self, queries: List[QueryWithEmbedding], collection_name: Optional[str] = None):
+        self.top_k.extend(query.top_k for query in queries)
+        return [
+            QueryResult(query=query.query, results=[chunk(id) for id in self.dense[:query.top_k]])
+            for query in queries
+        ]
+
+    async def _lexical_query(self, query, limit, collection_name=None):
+        return [chunk(id) for id in self.lexical[:limit]]
+
+    async def delete(self, ids=None, filter=None, delete_all=None, collection_name=None):
+        return True
+
+    def _create_collection(self, collection_name, vector_size=1536, distance="Cosine", storage=None):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def embeddings(mocker):
+    cache = mocker.patch("datastore.datastore.EmbeddingCache").return_value
+    cache.get_embeddings = mocker.AsyncMock(side_effect=lambda texts: [[0.0] for _ in texts])
+
+
+async def test_dense_query_ignores_lexical_results():
+    datastore = FakeDataStore(dense=["a", "b", "c", "d"], lexical=["x"])
+
+    results = await datastore.query([Query(query="q", top_k=2)])
+
+    assert [chunk.id for chunk in results[0].results] == ["a", "b"]
+    assert datastore.top_k == [2]
+
+
+async def test_hybrid_query_fuses_dense_and_lexical_rankings():
+    datastore = FakeDataStore(dense=["a", "b", "c"], lexical=["sku", "c"])
+
+    results = await datastore.query([Query(query="q", top_k=3, retrieval=RetrievalMode.hybrid)])
+
+    # Found by both retrievers first, then the best of each
+    assert [chunk.id for chunk in results[0].results] == ["c", "a", "sku"]
+    assert results[0].results[0].score == pytest.approx(1 / 63 + 1 / 62)
+    # The dense ranking is deeper than top_k, so fusion can promote lower dense hits
+    assert datastore.top_k[0] > 3
+
+
+async def test_mmr_query_returns_diverse_chunks(mocker):
+    datastore = FakeDataStore(dense=[], lexical=[])
+    datastore._query = mocker.AsyncMock(return_value=[QueryResult(query="q", results=[
+        DocumentChunkWithScore(id="a", text="a", metadata=DocumentChunkMetadata(), embedding=[1.0, 0.0], score=0.9),
+        DocumentChunkWithScore(id="a-copy", text="a", metadata=DocumentChunkMetadata(), embedding=[1.0, 0.0], score=0.89),
+        DocumentChunkWithScore(id="b", text="b", metadata=DocumentChunkMetadata(), embedding=[0.0, 1.0], score=0.8),
+    ])])
+
+    results = await datastore.query([Query(query="q", top_k=2, mmr_lambda=0.7)])
+
+    assert [chunk.id for chunk in results[0].results] == ["a", "b"]
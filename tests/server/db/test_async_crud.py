@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from server.db import async_crud, models, schemas
+from server.db.database import async_url, pool_options
+
+
+@pytest.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+async def collection(db):
+    collection = models.Collection(id=uuid.uuid4(), owner="owner", name="docs", fallback_msg="Bye")
+    db.add_all([
+        collection,
+        models.User(owner="owner", email="owner@example.com", stripe_id="cus_1"),
+        models.Plan(stripe_id="cus_1", token_remaining=100, file_remaining=10),
+        models.Plan(stripe_id="cus_1", token_remaining=500, file_remaining=20),
+    ])
+    await db.commit()
+    return collection
+
+
+async def test_check_collection_owner(db, collection):
+    assert await async_crud.check_collection_owner(db, "owner", collection.id)
+    assert not await async_crud.check_collection_owner(db, "someone", collection.id)
+    assert not await async_crud.check_collection_owner(db, "owner", uuid.uuid4())
+
+
+async def test_get_collection_config(db, collection):
+    config = await async_crud.get_collection_config(db, collection.id)
+
+    assert config.stripe_id == "cus_1"
+    assert config.has_plan
+    assert config.fallback_msg == "Bye"
+    assert await async_crud.get_collection_config(db, uuid.uuid4()) is None
+
+
+async def test_files_count_towards_the_owner_storage(db, collection):
+    assert await async_crud.get_total_file_size(db, "owner") == 0
+
+    await async_crud.create_file(
+        db, schemas.DocumentFileCreate(file_name="a.pdf", collection_id=collection.id, file_size=7)
+    )
+
+    assert await async_crud.get_total_file_size(db, "owner") == 7
+    assert await async_crud.get_file_limit(db, "owner") == 30
+
+
+async def test_get_token_remaining_reads_the_fullest_plan(db, collection):
+    assert await async_crud.get_token_remaining(db, "cus_1") == 500
+    assert await async_crud.get_token_remaining(db, "cus_2") is None
+
+
+def test_async_url_switches_to_the_async_driver():
+    assert async_url("postgresql://user:password@db/app") == "postgresql+asyncpg://user:password@db/app"
+    assert async_url("sqlite:///./sql_app.db") == "sqlite+aiosqlite:///./sql_app.db"
+    assert pool_options("sqlite:///./sql_app.db") == {}
+    assert pool_options("postgresql://db/app")["pool_pre_ping"]
@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from server.db import crud, models
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+@pytest.fixture
+def queries(db):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", count)
+    yield statements
+    event.remove(db.get_bind(), "before_cursor_execute", count)
+
+
+@pytest.fixture
+def customer(db):
+    db.add_all([
+        models.User(owner="owner", email="owner@example.com", stripe_id="cus_1"),
+        models.User(owner="other", email="other@example.com", stripe_id="cus_2"),
+        models.PlanConfig(price_id="price_1", platform="web", plan="basic", is_subscription=True, token_limit=1000),
+        models.PlanConfig(price_id="price_2", platform="web", plan="plus", is_subscription=True, token_limit=5000),
+        models.PlanConfig(price_id="price_3", platform="web", plan="plus", is_subscription=False, token_limit=0),
+        models.PlanConfig(price_id="price_4", platform="line", plan="basic", is_subscription=True, token_limit=800),
+        models.Plan(stripe_id="cus_1", platform="web", plan="basic", token_remaining=100, file_remaining=10),
+        models.Plan(
+            stripe_id="cus_1", platform="web", plan="plus", token_remaining=4000, file_remaining=20,
+            start_at=datetime.datetime(2026, 10, 1), expire_at=datetime.datetime(2026, 11, 1),
+        ),
+        models.Plan(stripe_id="cus_1", platform="line", plan="basic", token_remaining=300, file_remaining=5),
+        models.Plan(stripe_id="cus_2", platform="web", plan="basic", token_remaining=999, file_remaining=99),
+    ])
+    db.commit()
+
+
+def test_get_subscription_info_reads_every_platform_in_one_query(db, customer, queries):
+    info = crud.get_subscription_info(db, "cus_1")
+
+    assert len(queries) == 1
+    assert info["web"] == {
+        "plan": "plus",
+        "remaining_tokens": 4100,
+        "total_tokens": 5000,
+        "start_at": datetime.datetime(2026, 10, 1),
+        "expire_at": datetime.datetime(2026, 11, 1),
+    }
+    assert info["line"]["plan"] == "basic"
+    assert info["line"]["remaining_tokens"] == 300
+    assert info["line"]["total_tokens"] == 800
+    assert crud.get_subscription_info(db, "cus_3") == {}
+
+
+def test_get_file_limit_in_one_query(db, customer, queries):
+    assert crud.get_file_limit(db, "owner") == 35
+    assert len(queries) == 1
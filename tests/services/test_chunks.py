@@ -0,0 +1,124 @@
+import json
+import random
+
+import pytest
+
+from services.chunks import (
+    CHUNK_SIZE,
+    MAX_NUM_CHUNKS,
+    MIN_CHUNK_LENGTH_TO_EMBED,
+    MIN_CHUNK_SIZE_CHARS,
+    get_text_chunk_spans,
+    get_text_chunks,
+    tokenizer,
+)
+
+
+def legacy_get_text_chunks(text, chunk_token_size):
+    """The previous quadratic implementation, kept as the reference for chunk boundaries."""
+    if not text or text.isspace():
+        return []
+
+    tokens = tokenizer.encode(text, disallowed_special=())
+    chunks = []
+    chunk_size = chunk_token_size or CHUNK_SIZE
+    num_chunks = 0
+
+    while tokens and num_chunks < MAX_NUM_CHUNKS:
+        chunk = tokens[:chunk_size]
+        chunk_text = tokenizer.decode(chunk)
+
+        if not chunk_text or chunk_text.isspace():
+            tokens = tokens[len(chunk) :]
+            continue
+
+        last_punctuation = max(
+            chunk_text.rfind("."),
+            chunk_text.rfind("?"),
+            chunk_text.rfind("!"),
+            chunk_text.rfind("\n"),
+        )
+
+        if last_punctuation != -1 and last_punctuation > MIN_CHUNK_SIZE_CHARS:
+            chunk_text = chunk_text[: last_punctuation + 1]
+
+        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+
+        if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(chunk_text_to_append)
+
+        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+        num_chunks += 1
+
+    if tokens:
+        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
+        if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(remaining_text)
+
+    return chunks
+
+
+def random_text(seed: int, length: int) -> str:
+    rng = random.Random(seed)
+    words = [
+        "retrieval", "plugin", "vector", "Qdrant", "embedding", "token", "SKU-1234", "v2.0",
+        "Windows 365", "クラウド", "デスクトップ", "サービス", "設定", "日本語", "😀", "naïve", "café",
+    ]
+    separators = [" ", " ", " ", ". ", "? ", "! ", "\n", "\n\n", "、", "。", ", ", "  "]
+    parts = []
+    while sum(map(len, parts)) < length:
+        parts.append(rng.choice(words))
+        parts.append(rng.choice(separators))
+    return "".join(parts)
+
+
+def faq_text() -> str:
+    with open("eval/registry/data/faq-ja.json", encoding="utf-8") as f:
+        return "\n".join(item["question"] + "\n" + item["answer"] for item in json.load(f))
+
+
+def readme_text() -> str:
+    with open("README.md", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("chunk_token_size", [None, 50, 200, 512])
+@pytest.mark.parametrize("text_factory", [faq_text, readme_text])
+def test_matches_legacy_chunker_on_documents(text_factory, chunk_token_size):
+    text = text_factory()
+
+    assert get_text_chunks(text, chunk_token_size) == legacy_get_text_chunks(text, chunk_token_size)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_legacy_chunker_on_mixed_text(seed):
+    text = random_text(seed, 20000)
+
+    assert get_text_chunks(text, None) == legacy_get_text_chunks(text, None)
+
+
+@pytest.mark.parametrize("text", ["", "   \n ", "short", "no punctuation " * 500, "。" * 3000, "\n" * 1000 + "tail text"])
+def test_matches_legacy_chunker_on_edge_cases(text):
+    assert get_text_chunks(text, None) == legacy_get_text_chunks(text, None)
+
+
+@pytest.mark.parametrize("chunk_token_size", [None, 50])
+@pytest.mark.parametrize("text_factory", [faq_text, readme_text, lambda: random_text(0, 20000)])
+def test_spans_point_at_the_chunks_in_the_text(text_factory, chunk_token_size):
+    text = text_factory()
+
+    spans = get_text_chunk_spans(text, chunk_token_size)
+
+    assert [chunk for chunk, _, _, _ in spans] == get_text_chunks(text, chunk_token_size)
+    # Chunks that split a character end or start with a replacement character instead
+    assert all(
+        text[start:end].replace("\n", " ") == chunk for chunk, start, end, _ in spans if "\ufffd" not in chunk
+    )
+    assert all(spans[i][2] <= spans[i + 1][1] for i in range(len(spans) - 1))
+
+
+@pytest.mark.parametrize("text_factory", [faq_text, readme_text])
+def test_spans_count_the_tokens_of_their_chunks(text_factory):
+    spans = get_text_chunk_spans(text_factory(), 50)
+
+    assert [tokens for _, _, _, tokens in spans] == [len(tokenizer.encode(chunk, disallowed_special=())) for chunk, _, _, _ in spans]
@@ -0,0 +1,84 @@
+import uuid
+
+import pytest
+
+from server.db import schemas
+from services.collection_config import COLLECTION_CONFIG_CHANNEL, INVALIDATE_ALL, CollectionConfigCache
+
+
+@pytest.fixture
+def configs(mocker):
+    configs = CollectionConfigCache()
+    configs.configs.clear()
+    configs.ttl = 60
+    mocker.patch.object(configs, "redis")
+    mocker.patch.object(configs, "async_redis")
+    yield configs
+    configs.configs.clear()
+
+
+@pytest.fixture
+def load(mocker):
+    def config(db, collection_id):
+        return schemas.CollectionConfig(id=collection_id, stripe_id="cus_1", has_plan=True, fallback_msg="Bye")
+
+    return mocker.patch("services.collection_config.async_crud.get_collection_config", side_effect=config)
+
+
+async def test_get_reads_through_once_until_the_ttl(configs, load, mocker):
+    collection_id = uuid.uuid4()
+    clock = mocker.patch("services.collection_config.time.monotonic", return_value=0)
+
+    assert (await configs.get(None, collection_id)).fallback_msg == "Bye"
+    assert await configs.stripe_id(None, collection_id) == "cus_1"
+    assert load.call_count == 1
+
+    clock.return_value = 61
+    await configs.get(None, collection_id)
+    assert load.call_count == 2
+
+
+async def test_invalidate_drops_the_config_and_tells_the_other_workers(configs, load):
+    collection_id = uuid.uuid4()
+    await configs.get(None, collection_id)
+
+    configs.invalidate(collection_id)
+    await configs.get(None, collection_id)
+
+    assert load.call_count == 2
+    configs.redis.publish.assert_called_with(COLLECTION_CONFIG_CHANNEL, str(collection_id))
+
+
+async def test_ainvalidate_publishes_without_blocking(configs, load):
+    await configs.get(None, uuid.uuid4())
+
+    await configs.ainvalidate()
+
+    assert configs.configs == {}
+    configs.async_redis.publish.assert_awaited_once_with(COLLECTION_CONFIG_CHANNEL, INVALIDATE_ALL)
+
+
+async def test_drop_all(configs, load):
+    await configs.get(None, uuid.uuid4())
+    await configs.get(None, uuid.uuid4())
+
+    configs.drop(INVALIDATE_ALL)
+
+    assert configs.configs == {}
+
+
+async def test_stripe_id_of_a_collection_without_plan_raises(configs, mocker):
+    mocker.patch(
+        "services.collection_config.async_crud.get_collection_config",
+        return_value=schemas.CollectionConfig(id=uuid.uuid4(), stripe_id="cus_1", has_plan=False),
+    )
+
+    with pytest.raises(AttributeError):
+        await configs.stripe_id(None, uuid.uuid4())
+
+
+async def test_missing_collections_are_not_cached(configs, mocker):
+    mocker.patch("services.collection_config.async_crud.get_collection_config", return_value=None)
+
+    assert await configs.get(None, uuid.uuid4()) is None
+    assert configs.configs == {}
@@ -0,0 +1,70 @@
+from models.models import DocumentChunkMetadata, DocumentChunkWithScore
+from services.chunks import token_count
+from services.context import (
+    CHAT_ANSWER_TOKENS,
+    CHAT_CONTEXT_WINDOW,
+    REPLY_PRIMING_TOKENS,
+    SEPARATOR,
+    SEPARATOR_TOKENS,
+    TOKENS_PER_MESSAGE,
+    build_context,
+    context_budget,
+    message_tokens,
+)
+
+
+def chunk(id, text, token_count=None):
+    return DocumentChunkWithScore(
+        id=id, text=text, metadata=DocumentChunkMetadata(), score=1.0, token_count=token_count
+    )
+
+
+def test_build_context_packs_chunks_best_first_with_their_token_counts():
+    chunks = [chunk("a", "first answer", 10), chunk("b", "second answer", 20)]
+
+    context = build_context(chunks, 1000)
+
+    assert context.text == f"first answer{SEPARATOR}second answer{SEPARATOR}"
+    assert [c.id for c in context.chunks] == ["a", "b"]
+    assert context.tokens == 30 + 2 * SEPARATOR_TOKENS
+
+
+def test_build_context_skips_chunks_over_the_budget_for_smaller_ones():
+    chunks = [chunk("a", "first", 10), chunk("b", "too long", 50), chunk("c", "third", 10)]
+
+    context = build_context(chunks, 20 + 2 * SEPARATOR_TOKENS)
+
+    assert [c.id for c in context.chunks] == ["a", "c"]
+
+
+def test_build_context_drops_chunks_contained_in_packed_ones():
+    chunks = [
+        chunk("a", "Refunds take five  days.\nContact support.", 10),
+        chunk("b", "Refunds take five days.", 5),
+        chunk("c", "Shipping is free.", 5),
+    ]
+
+    context = build_context(chunks, 1000)
+
+    assert [c.id for c in context.chunks] == ["a", "c"]
+
+
+def test_build_context_counts_chunks_stored_without_a_token_count():
+    context = build_context([chunk("a", "an older chunk")], 1000)
+
+    assert context.tokens == token_count("an older chunk") + SEPARATOR_TOKENS
+
+
+def test_message_tokens_counts_every_message_and_the_reply_priming():
+    messages = [{"role": "system", "content": "Answer briefly."}, {"role": "user", "content": "Hi"}]
+
+    expected = REPLY_PRIMING_TOKENS + 2 * TOKENS_PER_MESSAGE + sum(
+        token_count(value) for message in messages for value in message.values()
+    )
+    assert message_tokens(messages) == expected
+
+
+def test_context_budget_leaves_room_for_the_prompt_and_the_answer():
+    assert context_budget("gpt-4", 100) == 8192 - CHAT_ANSWER_TOKENS - 100
+    assert context_budget("unknown", 100) == CHAT_CONTEXT_WINDOW - CHAT_ANSWER_TOKENS - 100
+    assert context_budget("gpt-4", 10**6) == 0
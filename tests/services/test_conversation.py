@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from models.chat import ConversationTurn
+from services import conversation
+
+
+def turn(i: int, tokens: int) -> ConversationTurn:
+    return ConversationTurn(user_question=f"question {i}", answer=f"answer {i}", tokens=tokens)
+
+
+@pytest.fixture
+def memory(mocker):
+    memory = mocker.AsyncMock()
+    memory.summary_lock = mocker.MagicMock(return_value=asyncio.Lock())
+    mocker.patch("services.conversation.RedisConversationMemory", return_value=memory)
+    return memory
+
+
+@pytest.fixture
+def meter(mocker):
+    mocker.patch("services.conversation.AsyncSessionLocal")
+    meter = mocker.patch("services.conversation.TokenMeter").return_value
+    meter.charge = mocker.AsyncMock()
+    return meter
+
+
+async def test_history_keeps_the_latest_turns_that_fit_with_the_summary(memory):
+    memory.window.return_value = ([turn(0, 50), turn(1, 30), turn(2, 40)], "summary", 20)
+
+    history = await conversation.history(b"user_id", max_tokens=100)
+
+    assert history.summary == "summary"
+    assert [t.user_question for t in history.turns] == ["question 1", "question 2"]
+    assert history.tokens == 90
+
+
+async def test_history_drops_a_summary_over_the_budget(memory):
+    memory.window.return_value = ([turn(0, 10)], "long summary", 500)
+
+    history = await conversation.history(b"user_id", max_tokens=100)
+
+    assert history.summary is None
+    assert history.tokens == 10
+
+
+async def test_remember_folds_the_evicted_turn_into_the_summary(memory, meter, mocker):
+    memory.append.return_value = turn(0, 10)
+    memory.summary.return_value = "old summary"
+    completion = mocker.patch("services.conversation.aget_chat_completion", return_value="new summary")
+
+    await conversation.remember(b"user_id", "question", "answer", "cus_1")
+    await asyncio.gather(*conversation._summaries)
+
+    stored = memory.append.call_args.args[1]
+    assert (stored.user_question, stored.answer) == ("question", "answer")
+    assert stored.tokens > 0
+    assert "old summary" in completion.call_args.kwargs["messages"][0]["content"]
+    memory.set_summary.assert_called_with(b"user_id", "new summary", conversation.token_count("new summary"))
+    memory.summary_lock.assert_called_once_with(b"user_id")
+    assert not conversation._summaries
+
+
+async def test_summarize_charges_the_summary_completion(memory, meter, mocker):
+    memory.summary.return_value = None
+    mocker.patch("services.conversation.aget_chat_completion", return_value="new summary")
+
+    tokens = await conversation.summarize("user_id", turn(0, 10), "cus_1")
+
+    messages = conversation.summary_messages(None, turn(0, 10))
+    assert tokens == conversation.message_tokens(messages) + conversation.token_count("new summary")
+    assert meter.charge.await_args.args[1:] == ("cus_1", tokens)
+
+
+async def test_summaries_of_a_conversation_fold_one_after_another(memory, meter, mocker):
+    summaries = {}
+
+    async def summary(user_id):
+        return summaries.get(user_id)
+
+    async def set_summary(user_id, text, tokens):
+        summaries[user_id] = text
+
+    async def complete(messages):
+        await asyncio.sleep(0)
+        previous, question = messages[0]["content"].split("Summary: ")[1].split("\n")[:2]
+        return f"{previous} + {question.split('Customer: ')[1]}"
+
+    memory.summary.side_effect = summary
+    memory.set_summary.side_effect = set_summary
+    mocker.patch("services.conversation.aget_chat_completion", side_effect=complete)
+
+    await asyncio.gather(*[conversation.summarize("user_id", turn(i, 10)) for i in range(3)])
+
+    assert summaries["user_id"] == "(empty) + question 0 + question 1 + question 2"
+    meter.charge.assert_not_awaited()
+
+
+def test_turns_are_stored_under_short_keys():
+    assert turn(0, 5).json(by_alias=True) == '{"q": "question 0", "a": "answer 0", "t": 5}'
+    assert ConversationTurn.parse_raw('{"q": "q", "a": "a", "t": 5}') == ConversationTurn(
+        user_question="q", answer="a", tokens=5
+    )
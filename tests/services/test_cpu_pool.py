@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from services.cpu_pool import CPUBudgetExceeded, CPUTask, _timed
+
+
+class FakePool:
+    """Runs tasks inline and reports `cost` CPU seconds for each of them."""
+
+    def __init__(self, cost: float = 0.0, delays=None):
+        self.cost = cost
+        self.delays = delays or {}
+        self.calls = []
+
+    async def submit(self, func, *args):
+        self.calls.append(args)
+        await asyncio.sleep(self.delays.get(args[0], 0))
+        return func(*args), self.cost
+
+
+def test_timed_reports_cpu_time():
+    result, cpu_seconds = _timed(sum, range(1000))
+
+    assert result == sum(range(1000))
+    assert cpu_seconds >= 0
+
+
+async def test_map_yields_results_in_input_order():
+    # Earlier tasks finish last
+    pool = FakePool(delays={0: 0.03, 1: 0.02, 2: 0.01})
+    task = CPUTask(pool, budget=10, concurrency=3)
+
+    assert [result async for result in task.map(str, [(i,) for i in range(4)])] == ["0", "1", "2", "3"]
+
+
+async def test_run_raises_once_budget_is_spent():
+    pool = FakePool(cost=1.0)
+    task = CPUTask(pool, budget=1.5, concurrency=1)
+
+    assert await task.run(str, 1) == "1"
+    with pytest.raises(CPUBudgetExceeded):
+        await task.run(str, 2)
+    with pytest.raises(CPUBudgetExceeded):
+        await task.run(str, 3)
+
+    # The third task is refused before it reaches the pool
+    assert pool.calls == [(1,), (2,)]
+
+
+async def test_map_stops_submitting_after_budget_is_exceeded():
+    pool = FakePool(cost=1.0)
+    task = CPUTask(pool, budget=1.5, concurrency=1)
+
+    with pytest.raises(CPUBudgetExceeded):
+        _ = [result async for result in task.map(str, [(i,) for i in range(10)])]
+
+    assert len(pool.calls) < 10
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from redis.exceptions import ConnectionError
+
+from services.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def embedding_cache(mocker) -> EmbeddingCache:
+    cache = EmbeddingCache()
+    mocker.patch.object(cache, "redis", None)
+    mocker.patch.object(cache, "local", type(cache.local)())
+    return cache
+
+
+@pytest.fixture
+def fake_embeddings(mocker):
+    async def embed(texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    return mocker.patch("services.embedding_cache.aget_embeddings", side_effect=embed)
+
+
+async def test_embeds_each_distinct_text_once(embedding_cache, fake_embeddings):
+    result = await embedding_cache.get_embeddings(["a", "bb", "a", " bb "])
+
+    assert result == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+    fake_embeddings.assert_called_once_with(["a", "bb"])
+
+
+async def test_serves_repeated_texts_from_local_tier(embedding_cache, fake_embeddings):
+    await embedding_cache.get_embeddings(["question"])
+    result = await embedding_cache.get_embeddings(["question", "other"])
+
+    assert result == [[8.0, 1.0], [5.0, 1.0]]
+    assert fake_embeddings.call_count == 2
+    fake_embeddings.assert_called_with(["other"])
+
+
+async def test_evicts_least_recently_used(embedding_cache, fake_embeddings, mocker):
+    mocker.patch.object(embedding_cache, "maxsize", 2)
+
+    await embedding_cache.get_embeddings(["a", "b"])
+    await embedding_cache.get_embeddings(["a"])
+    await embedding_cache.get_embeddings(["c"])
+
+    assert len(embedding_cache.local) == 2
+    await embedding_cache.get_embeddings(["a"])
+    fake_embeddings.assert_called_with(["c"])
+
+
+async def test_reads_the_redis_tier_and_survives_its_failures(embedding_cache, fake_embeddings, mocker):
+    redis = mocker.MagicMock()
+    redis.mget = mocker.AsyncMock(return_value=[np.asarray([9.0, 1.0], dtype=np.float32).tobytes(), None])
+    redis.pipeline.return_value.execute = mocker.AsyncMock()
+    mocker.patch.object(embedding_cache, "redis", redis)
+
+    result = await embedding_cache.get_embeddings(["shared", "new"])
+
+    assert result == [[9.0, 1.0], [3.0, 1.0]]
+    fake_embeddings.assert_called_once_with(["new"])
+    redis.pipeline.return_value.execute.assert_awaited_once()
+
+    redis.mget.side_effect = ConnectionError("refused")
+    assert await embedding_cache.get_embeddings(["other"]) == [[5.0, 1.0]]
+
+
+async def test_embeds_missing_texts_with_the_given_function(embedding_cache, fake_embeddings, mocker):
+    embed = mocker.AsyncMock(return_value=[[3.0, 1.0]])
+
+    assert await embedding_cache.get_embeddings(["abc"], embed=embed) == [[3.0, 1.0]]
+    embed.assert_awaited_once_with(["abc"])
+    fake_embeddings.assert_not_called()
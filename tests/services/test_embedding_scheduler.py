@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+from services.embedding_scheduler import EmbeddingScheduler, TokenBucket
+
+
+def test_pack_respects_token_and_size_limits():
+    scheduler = EmbeddingScheduler(embed=None, batch_tokens=100, batch_size=3)
+
+    assert scheduler.pack([40, 40, 40, 10, 10, 10, 10, 200]) == [[0, 1], [2, 3, 4], [5, 6], [7]]
+
+
+async def test_embed_preserves_order_with_concurrent_batches():
+    async def embed(texts):
+        # Later batches finish first
+        await asyncio.sleep(0.01 / int(texts[0]) if texts[0] != "0" else 0.02)
+        return [[float(text)] for text in texts]
+
+    scheduler = EmbeddingScheduler(embed=embed, concurrency=4, batch_size=2)
+    texts = [str(i) for i in range(10)]
+
+    assert await scheduler.embed(texts, token_counts=[1] * 10) == [[float(i)] for i in range(10)]
+
+
+async def test_embed_retries_only_failed_batches(mocker):
+    mocker.patch.object(EmbeddingScheduler, "backoff", return_value=0)
+    calls = []
+
+    async def embed(texts):
+        calls.append(tuple(texts))
+        if texts == ["c", "d"] and calls.count(("c", "d")) == 1:
+            raise RuntimeError("rate limited")
+        return [[1.0] for _ in texts]
+
+    scheduler = EmbeddingScheduler(embed=embed, batch_size=2)
+    await scheduler.embed(["a", "b", "c", "d"], token_counts=[1] * 4)
+
+    assert calls.count(("a", "b")) == 1
+    assert calls.count(("c", "d")) == 2
+
+
+async def test_embed_gives_up_after_max_retries(mocker):
+    mocker.patch.object(EmbeddingScheduler, "backoff", return_value=0)
+
+    async def embed(texts):
+        raise RuntimeError("down")
+
+    scheduler = EmbeddingScheduler(embed=embed, max_retries=2)
+    with pytest.raises(RuntimeError):
+        await scheduler.embed(["a"], token_counts=[1])
+
+
+async def test_embed_cancels_pending_batches_when_one_fails_for_good(mocker):
+    mocker.patch.object(EmbeddingScheduler, "backoff", return_value=0)
+    cancelled = []
+
+    async def embed(texts):
+        if texts == ["a"]:
+            raise RuntimeError("down")
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(texts[0])
+            raise
+
+    scheduler = EmbeddingScheduler(embed=embed, concurrency=3, batch_size=1, max_retries=2)
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(scheduler.embed(["a", "b", "c"], token_counts=[1] * 3), timeout=1)
+
+    assert sorted(cancelled) == ["b", "c"]
+
+
+async def test_embed_counts_tokens_when_not_given():
+    async def embed(texts):
+        return [[1.0] for _ in texts]
+
+    scheduler = EmbeddingScheduler(embed=embed)
+
+    assert await scheduler.embed(["a", "b"]) == [[1.0], [1.0]]
+
+
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=10, rate=100)
+
+    await bucket.acquire(10)
+    start = time.monotonic()
+    await bucket.acquire(5)
+
+    assert time.monotonic() - start >= 0.04
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from models.models import DocumentMetadata, Source
+from services.cpu_pool import CPUTask
+from services.ingest import UpsertPipeline
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def embed(self, texts, token_counts=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return [[float(len(text))] for text in texts]
+
+
+async def texts(pieces):
+    for piece in pieces:
+        yield piece
+
+
+def pipeline(write, **kwargs):
+    return UpsertPipeline(
+        write=write,
+        cpu_task=CPUTask(pool=None, budget=10, concurrency=1),
+        scheduler=kwargs.pop("scheduler", FakeScheduler()),
+        **kwargs,
+    )
+
+
+async def test_run_writes_every_chunk_in_fixed_size_batches():
+    batches = []
+
+    async def write(chunks):
+        batches.extend(chunks.values())
+        return list(chunks.keys())
+
+    pieces = [f"Sentence number {i} of piece {p}. " * 40 for p in range(5) for i in range(3)]
+    progress = await pipeline(write, write_batch_size=7, embed_batch_size=3).run(
+        texts(pieces), DocumentMetadata(source=Source.file, source_id="file-1"), "doc-1"
+    )
+
+    written = [chunk for batch in batches for chunk in batch]
+    assert progress.done
+    assert progress.chunks == progress.embedded == progress.written == len(written) > 7
+    assert all(len(batch) <= 7 for batch in batches)
+    assert all(chunk.embedding == [float(len(chunk.text))] for chunk in written)
+    assert {chunk.metadata.document_id for chunk in written} == {"doc-1"}
+    assert {chunk.metadata.source_id for chunk in written} == {"file-1"}
+    assert len({chunk.id for chunk in written}) == len(written)
+    assert all(chunk.token_count > 0 for chunk in written)
+    document = "".join(pieces)
+    assert all(document[chunk.start_char:chunk.end_char] == chunk.text for chunk in written)
+
+
+async def test_run_limits_embedding_concurrency():
+    scheduler = FakeScheduler()
+
+    async def write(chunks):
+        return list(chunks.keys())
+
+    pieces = ["Some words to embed. " * 200 for _ in range(10)]
+    await pipeline(write, scheduler=scheduler, embed_workers=2, embed_batch_size=1).run(texts(pieces))
+
+    assert scheduler.max_in_flight == 2
+
+
+async def test_run_reports_progress_after_every_write():
+    reports = []
+
+    async def write(chunks):
+        return list(chunks.keys())
+
+    async def on_progress(progress):
+        reports.append(progress.written)
+
+    pieces = ["A sentence to chunk. " * 200 for _ in range(3)]
+    progress = await pipeline(write, on_progress=on_progress, write_batch_size=2).run(texts(pieces))
+
+    assert reports[-1] == progress.written
+    assert reports == sorted(reports)
+
+
+async def test_run_propagates_write_failures():
+    async def write(chunks):
+        raise RuntimeError("qdrant down")
+
+    pieces = ["A sentence to chunk. " * 200 for _ in range(20)]
+    with pytest.raises(RuntimeError):
+        await pipeline(write, queue_size=2, write_batch_size=1).run(texts(pieces))
+
+
+async def test_run_resumes_after_committed_pieces_with_the_same_chunk_ids():
+    first_run = []
+
+    async def flaky_write(chunks):
+        if any("Piece 3" in chunk.text for batch in chunks.values() for chunk in batch):
+            raise RuntimeError("qdrant down")
+        first_run.extend(chunks.values())
+        return list(chunks.keys())
+
+    pieces = [f"Piece {p} sentence. " * 50 for p in range(4)]
+    reports = []
+
+    async def on_progress(p):
+        reports.append(p.copy(deep=True))
+
+    with pytest.raises(RuntimeError):
+        await pipeline(flaky_write, on_progress=on_progress, write_batch_size=1).run(
+            texts(pieces), document_id="doc-1"
+        )
+    progress = reports[-1]
+    assert 3 not in progress.committed
+
+    second_run = []
+
+    async def write(chunks):
+        second_run.extend(*chunks.values())
+        return list(chunks.keys())
+
+    skipped = ["" if i in progress.committed else piece for i, piece in enumerate(pieces)]
+    resumed = await pipeline(write).run(texts(skipped), document_id="doc-1", progress=progress)
+
+    assert resumed.done
+    assert sorted(resumed.committed) == [0, 1, 2, 3]
+    # Offsets still count the characters of the skipped pieces
+    document = "".join(pieces)
+    assert all(document[chunk.start_char:chunk.end_char] == chunk.text for chunk in second_run)
+
+    fresh = []
+
+    async def fresh_write(chunks):
+        fresh.extend(*chunks.values())
+        return list(chunks.keys())
+
+    await pipeline(fresh_write).run(texts(pieces), document_id="doc-1")
+    written_ids = {chunk.id for batch in first_run for chunk in batch} | {chunk.id for chunk in second_run}
+    assert written_ids == {chunk.id for chunk in fresh}
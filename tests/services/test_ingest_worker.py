@@ -0,0 +1,119 @@
+import pytest
+
+from models.models import DocumentMetadata, IngestJob, IngestJobStatus, UpsertProgress
+from services.ingest_worker import IngestWorker
+
+
+class FakeQueue:
+    lease_seconds = 60
+
+    def __init__(self):
+        self.saved = []
+        self.requeued = []
+        self.finished = []
+
+    async def save(self, job):
+        self.saved.append(job.copy(deep=True))
+
+    async def requeue(self, job):
+        self.requeued.append(job.copy(deep=True))
+
+    async def finish(self, job):
+        self.finished.append(job.copy(deep=True))
+
+    async def renew(self, job, worker_id):
+        pass
+
+
+class FakeDataStore:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+        self.deleted = []
+
+    async def upsert_stream(self, texts, metadata=None, document_id=None, collection_name=None,
+                            cpu_task=None, on_progress=None, progress=None):
+        self.calls.append(progress)
+        progress = progress or UpsertProgress(document_id=document_id)
+        progress.committed.append(len(progress.committed))
+        await on_progress(progress)
+        if len(self.calls) <= self.failures:
+            raise RuntimeError("qdrant down")
+        progress.done = True
+        return progress
+
+    async def delete(self, filter=None, collection_name=None, **kwargs):
+        self.deleted.append(filter.document_id)
+        return True
+
+
+@pytest.fixture
+def job(tmp_path):
+    path = tmp_path / "upload"
+    path.write_text("text")
+    return IngestJob(
+        id="job-1",
+        tenant="user-1",
+        collection="collection-1",
+        file_id="00000000-0000-0000-0000-000000000001",
+        path=str(path),
+        mimetype="text/plain",
+        metadata=DocumentMetadata(source_id="00000000-0000-0000-0000-000000000001"),
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_side_effects(mocker):
+    mocker.patch("services.ingest_worker.stream_text_from_filepath")
+    mocker.patch("services.ingest_worker.CPUPool")
+    mocker.patch("services.ingest_worker.RedisSemanticCache").return_value.invalidate = mocker.AsyncMock()
+    mocker.patch("services.ingest_worker.AsyncSessionLocal")
+    mocker.patch("services.ingest_worker.async_crud.delete_file")
+    mocker.patch.object(IngestWorker, "backoff", return_value=0)
+
+
+async def test_process_finishes_job_and_removes_file(job):
+    queue = FakeQueue()
+    worker = IngestWorker(datastore=FakeDataStore(), queue=queue)
+
+    await worker.process(job)
+
+    assert queue.finished[-1].status == IngestJobStatus.done
+    assert queue.finished[-1].progress.done
+    assert not queue.requeued
+    with pytest.raises(FileNotFoundError):
+        open(job.path)
+
+
+async def test_process_requeues_with_committed_progress(job):
+    queue = FakeQueue()
+    datastore = FakeDataStore(failures=1)
+    worker = IngestWorker(datastore=datastore, queue=queue)
+
+    await worker.process(job)
+
+    requeued = queue.requeued[-1]
+    assert requeued.status == IngestJobStatus.queued
+    assert requeued.progress.committed == [0]
+
+    # The retry resumes from what the first attempt committed
+    await worker.process(requeued)
+
+    assert datastore.calls[-1].committed == [0, 1]
+    assert queue.finished[-1].status == IngestJobStatus.done
+    assert queue.finished[-1].attempts == 2
+
+
+async def test_process_fails_job_after_max_attempts(job, mocker):
+    delete_file = mocker.patch("services.ingest_worker.async_crud.delete_file")
+    queue = FakeQueue()
+    datastore = FakeDataStore(failures=1)
+    worker = IngestWorker(datastore=datastore, queue=queue, max_attempts=1)
+
+    await worker.process(job)
+
+    assert queue.finished[-1].status == IngestJobStatus.failed
+    assert queue.finished[-1].error == "qdrant down"
+    assert datastore.deleted == ["job-1"]
+    assert not queue.requeued
+    delete_file.assert_awaited_once()
@@ -0,0 +1,46 @@
+from services.intent_router import RuleIntentRouter, local_route
+from utils.metrics import Metrics
+
+
+async def test_rule_router_matches_balance_questions():
+    router = RuleIntentRouter()
+
+    decision = await router.route("What is my balance?")
+    assert decision.name == "get_balance"
+    assert decision.confidence == 1.0
+
+    decision = await router.route("口座の残高を教えて")
+    assert decision.name == "get_balance"
+
+
+async def test_rule_router_defers_to_llm_without_default():
+    router = RuleIntentRouter(default=None)
+
+    assert await router.route("How do I balance the load across servers?") is None
+
+
+async def test_rule_router_default_route_uses_question_as_key_word():
+    router = RuleIntentRouter(default="ask_database")
+
+    decision = await router.route("What is Windows 365?")
+    assert decision.name == "ask_database"
+    assert decision.arguments == {"key_word": "What is Windows 365?"}
+
+
+async def test_local_route_counts_paths():
+    metrics = Metrics()
+    local, llm = metrics.get("intent_router.local"), metrics.get("intent_router.llm")
+
+    await local_route(RuleIntentRouter(default=None), "Check my balance")
+    await local_route(RuleIntentRouter(default=None), "What is Windows 365?")
+
+    assert metrics.get("intent_router.local") == local + 1
+    assert metrics.get("intent_router.llm") == llm + 1
+
+
+async def test_local_route_leaves_follow_up_searches_to_the_llm():
+    router = RuleIntentRouter(default="ask_database")
+
+    assert await local_route(router, "and the price?", follow_up=True) is None
+    assert (await local_route(router, "and the price?")).name == "ask_database"
+    assert (await local_route(router, "Check my balance", follow_up=True)).name == "get_balance"
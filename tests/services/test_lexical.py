@@ -0,0 +1,21 @@
+from services.lexical import reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_japanese_into_bigrams():
+    assert tokenize("価格表") == ["価格", "格表"]
+    assert tokenize("は") == ["は"]
+
+
+def test_tokenize_keeps_codes_and_folds_width():
+    assert tokenize("Windows 365 SKU ＡＢＣ１２３") == ["windows", "365", "sku", "abc123"]
+
+
+def test_tokenize_splits_mixed_scripts():
+    assert tokenize("Windows365の価格") == ["windows365", "の価", "価格"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+
+    assert [id for id, _ in fused] == ["c", "a", "b", "d"]
+    assert fused[0][1] == 1 / 63 + 1 / 61
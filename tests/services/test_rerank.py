@@ -0,0 +1,48 @@
+from models.models import DocumentChunkMetadata, DocumentChunkWithScore
+from services.chunks import token_count
+from services.rerank import mmr, within_budget
+
+
+def chunk(id, score, embedding=None, text=None, token_count=None):
+    return DocumentChunkWithScore(
+        id=id,
+        text=text or f"text {id}",
+        metadata=DocumentChunkMetadata(),
+        embedding=embedding,
+        score=score,
+        token_count=token_count,
+    )
+
+
+def test_mmr_sinks_near_duplicates():
+    chunks = [
+        chunk("a", 0.90, [1.0, 0.0]),
+        chunk("a-copy", 0.89, [1.0, 0.01]),
+        chunk("b", 0.80, [0.0, 1.0]),
+    ]
+
+    assert [c.id for c in mmr(chunks, 0.7)] == ["a", "b", "a-copy"]
+    # Pure relevance keeps the retrieval order
+    assert [c.id for c in mmr(chunks, 1.0)] == ["a", "a-copy", "b"]
+
+
+def test_mmr_keeps_chunks_without_embedding():
+    chunks = [chunk("a", 0.9, [1.0, 0.0]), chunk("lexical", 0.5), chunk("a-copy", 0.8, [1.0, 0.0])]
+
+    assert [c.id for c in mmr(chunks, 0.5)] == ["a", "lexical", "a-copy"]
+
+
+def test_within_budget_skips_chunks_that_do_not_fit():
+    long, short = "long text " * 50, "short"
+    chunks = [chunk("1", 0.9, text=short), chunk("2", 0.8, text=long), chunk("3", 0.7, text=short)]
+
+    budget = 2 * token_count(short)
+
+    assert [c.id for c in within_budget(chunks, 3, budget)] == ["1", "3"]
+    assert [c.id for c in within_budget(chunks, 2, None)] == ["1", "2"]
+
+
+def test_within_budget_uses_the_token_count_of_ingestion():
+    chunks = [chunk("1", 0.9, text="short", token_count=40), chunk("2", 0.8, text="short")]
+
+    assert [c.id for c in within_budget(chunks, None, 40)] == ["1"]
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from services.stream import StreamBridge
+
+
+async def counter(n: int, closed: list):
+    try:
+        for i in range(n):
+            yield i
+            await asyncio.sleep(0)
+    finally:
+        closed.append(True)
+
+
+async def test_stream_bridge_yields_everything_in_order():
+    closed = []
+    async with StreamBridge(counter(100, closed), maxsize=4) as chunks:
+        result = [chunk async for chunk in chunks]
+
+    assert result == list(range(100))
+    assert closed == [True]
+
+
+async def test_stream_bridge_close_tears_down_upstream():
+    closed = []
+
+    async def answer():
+        async with StreamBridge(counter(1000, closed), maxsize=4) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    stream = answer()
+    async for chunk in stream:
+        if chunk == 5:
+            break
+    await stream.aclose()
+
+    assert closed == [True]
+
+
+async def test_stream_bridge_reraises_upstream_errors():
+    async def broken():
+        yield 1
+        raise ValueError("upstream")
+
+    with pytest.raises(ValueError):
+        async with StreamBridge(broken()) as chunks:
+            async for _ in chunks:
+                pass
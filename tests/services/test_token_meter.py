@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+from services.token_meter import DIRTY_KEY, INVOICE_QUEUE, TokenMeter
+
+
+@pytest.fixture
+def meter(mocker):
+    meter = TokenMeter()
+    mocker.patch.object(meter, "redis")
+    mocker.patch.object(meter, "async_redis")
+    mocker.patch.object(meter, "charge_script", new_callable=mocker.AsyncMock)
+    mocker.patch.object(meter, "load_script", new_callable=mocker.AsyncMock)
+    return meter
+
+
+async def test_charge_loads_the_counter_from_the_plan_once(meter, mocker):
+    get_token_remaining = mocker.patch("services.token_meter.async_crud.get_token_remaining", return_value=1000)
+    meter.charge_script.side_effect = [None, [900, 0]]
+
+    assert await meter.charge(None, "cus_1", 100) == 900
+
+    get_token_remaining.assert_called_once_with(None, "cus_1")
+    meter.load_script.assert_awaited_once_with(
+        keys=["cus_1::token_remaining", "cus_1::token_usage"], args=[1000]
+    )
+    assert meter.charge_script.await_count == 2
+
+
+async def test_charge_without_a_plan_or_tokens_is_not_metered(meter, mocker):
+    mocker.patch("services.token_meter.async_crud.get_token_remaining", return_value=None)
+    meter.charge_script.return_value = None
+
+    assert await meter.charge(None, "cus_1", 100) is None
+    assert await meter.charge(None, "cus_1", 0) is None
+    meter.load_script.assert_not_awaited()
+
+
+def test_flush_usage_writes_back_every_dirty_customer(meter, mocker):
+    apply_token_usage = mocker.patch("services.token_meter.crud.apply_token_usage")
+    meter.redis.spop.side_effect = [[b"cus_1", b"cus_2"], []]
+    meter.redis.pipeline.return_value.execute.return_value = [b"120", None]
+
+    meter.flush_usage(db=mocker.Mock())
+
+    apply_token_usage.assert_called_once()
+    assert apply_token_usage.call_args.args[1] == {"cus_1": 120}
+
+
+def test_flush_usage_gives_the_usage_back_when_the_write_fails(meter, mocker):
+    mocker.patch("services.token_meter.crud.apply_token_usage", side_effect=RuntimeError("database down"))
+    pipe = meter.redis.pipeline.return_value
+    pipe.execute.return_value = [b"120"]
+
+    meter.flush_usage(["cus_1"], db=mocker.Mock())
+
+    pipe.incrby.assert_called_once_with("cus_1::token_usage", 120)
+    pipe.sadd.assert_called_once_with(DIRTY_KEY, "cus_1")
+
+
+async def test_failed_invoices_are_queued_again(meter, mocker):
+    mocker.patch("services.token_meter.TOKEN_METER_INVOICE_BACKOFF", 0)
+    mocker.patch.object(meter, "_send_invoice", side_effect=RuntimeError("stripe down"))
+    invoice = json.dumps({"stripe_id": "cus_1", "attempts": 0})
+    blpop = asyncio.Event()
+
+    async def pop(*args, **kwargs):
+        if blpop.is_set():
+            await asyncio.sleep(3600)
+        blpop.set()
+        return (INVOICE_QUEUE.encode(), invoice)
+
+    meter.async_redis.blpop.side_effect = pop
+    task = asyncio.create_task(meter.send_invoices())
+    for _ in range(10):
+        await asyncio.sleep(0)
+        if meter.async_redis.rpush.await_count:
+            break
+    task.cancel()
+
+    meter.async_redis.rpush.assert_awaited_once_with(
+        INVOICE_QUEUE, json.dumps({"stripe_id": "cus_1", "attempts": 1})
+    )
@@ -0,0 +1,77 @@
+import bisect
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, List, Optional
+
+from utils.common import singleton_with_lock
+
+DEFAULT_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        buckets = {str(le): count for le, count in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0,
+            "buckets": buckets,
+        }
+
+
+@singleton_with_lock
+class Metrics():
+    """In-process counters and histograms for this worker, served by `/metrics`."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get(self, name: str) -> float:
+        return self.counters.get(name, 0)
+
+    def observe(self, name: str, value: float, buckets: Optional[List[float]] = None):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets or DEFAULT_BUCKETS)
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Observe the milliseconds the block takes in the histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def ratio(self, hit: str, miss: str) -> float:
+        hits, misses = self.get(hit), self.get(miss)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.snapshot() for name, histogram in self.histograms.items()
+                },
+            }